@@ -1,336 +1,364 @@
-import streamlit as st
-import pandas as pd
-import io
-import datetime
-import os
-
-st.set_page_config(page_title="Statement Processing", layout="wide")
-st.title("📊 Statement Processor")
-
-# Define three tabs
-tab1, tab2, tab3 = st.tabs(["📊 Statement Processor", "Non-AI PO Check", "💳 Remittance Merge"])
-
-# --- TAB 1 ---
-with tab1:
-    st.header("📋 Step 1: Upload Statement & Estimates Files")
-    statement_file = st.file_uploader("📄 Upload Statement File (.xlsx)", type=["xlsx"])
-    estimates_file = st.file_uploader("📄 Upload Estimates File (.xlsx)", type=["xlsx"])
-
-    required_cols = [
-        'Appointment date', 'Appointment month', 'Appointment year', 'Vendor Name',
-        'PO', 'ROID', 'Invoice no', 'VIN', 'Sub Total', 'Tax Total', 'AI trans Fee', 'FMC Rebate', 'Payable Amount',
-        'Rebate AI', 'Rebate%', 'Amount to pay', 'Trans fee', 'Merch fee',
-        'Status in api', 'AP status'
-    ]
-
-    rebate_enrichment_df = None
-    output_final = None
-
-    if statement_file and estimates_file:
-        statement_df = pd.read_excel(statement_file)
-        estimates_df = pd.read_excel(estimates_file)
-
-        merge_key = st.selectbox("🔑 Select merge key", ['PO', 'ROID'])
-
-        if merge_key not in statement_df.columns or merge_key not in estimates_df.columns:
-            st.error(f"❌ Selected key '{merge_key}' not found in both files.")
-            st.stop()
-
-        estimates_df = estimates_df[[col for col in required_cols if col in estimates_df.columns]]
-
-        st.info(f"🔗 Merging on: **{merge_key}**")
-        merged_df = pd.merge(statement_df, estimates_df, how='left', on=merge_key, indicator=True)
-        merged_df['Match Status'] = merged_df['_merge'].map({
-            'both': 'Matched with Estimates',
-            'left_only': 'Unmatched with Estimates (N/A)'
-        })
-        merged_df.drop(columns=['_merge'], inplace=True)
-
-        if 'Statement amount' in merged_df.columns and 'Amount to pay' in merged_df.columns:
-            merged_df['Disputed amount'] = merged_df['Statement amount'] - merged_df['Amount to pay']
-
-        unmatched_df = merged_df[merged_df['Match Status'] == 'Unmatched with Estimates (N/A)']
-
-        with st.expander("📄 Initial Merged File", expanded=False):
-            st.dataframe(merged_df)
-
-            for col in ['Appointment date', 'Appointment month', 'Appointment year']:
-                if col in merged_df.columns:
-                    merged_df[col] = merged_df[col].astype(str)
-
-            output_initial = io.BytesIO()
-            with pd.ExcelWriter(output_initial, engine='xlsxwriter') as writer:
-                merged_df.to_excel(writer, index=False, sheet_name='Merged')
-            output_initial.seek(0)
-
-            st.download_button(
-                "📥 Download Initial Merged File",
-                output_initial.getvalue(),
-                "Initial_Merged_Statement_Estimates.xlsx",
-                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-        st.markdown("---")
-        st.subheader("🧮 Step 2: Tax & Rebate Calculator for Enrichment")
-
-        rebate_input_file = st.file_uploader("📁 Upload file for Tax & Rebate Calculation", type=["xlsx"], key="rebate_file")
-
-        if rebate_input_file:
-            rebate_percent = st.number_input("💸 Enter Rebate %", value=0.0, step=0.1, key="rebate_pct")
-            df = pd.read_excel(rebate_input_file)
-
-            required_cols_step2 = ['SubTotal (exc. Tax)', 'Total (inc. Tax)', 'Payable Amount (inc. Tax)']
-
-            if not all(col in df.columns for col in required_cols_step2):
-                st.error(f"❌ Required columns: {', '.join(required_cols_step2)}")
-            else:
-                for col in required_cols_step2:
-                    df[col] = df[col].astype(str).str.replace(r'[$,₹,CA]', '', regex=True)
-                    df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
-
-                rebate_rate = rebate_percent / 100.0
-                df['Tax'] = df['Total (inc. Tax)'] - df['SubTotal (exc. Tax)']
-                df['Rebate'] = df['SubTotal (exc. Tax)'] * (-rebate_rate)
-                df['Rebate %'] = df.apply(
-                    lambda row: f"{((row['Rebate'] / row['SubTotal (exc. Tax)']) * 100):.2f}%"
-                    if row['SubTotal (exc. Tax)'] != 0 else '0.00%', axis=1
-                )
-                df['Amount to Pay'] = df['Payable Amount (inc. Tax)'] + df['Rebate']
-
-                if 'appointment_datetime' in df.columns:
-                    df['appointment_datetime'] = pd.to_datetime(df['appointment_datetime'], errors='coerce')
-                    df['Appointment date'] = df['appointment_datetime'].dt.date
-                    df['Appointment month'] = df['appointment_datetime'].dt.strftime('%B')
-                    df['Appointment year'] = df['appointment_datetime'].dt.year
-
-                column_renames = {
-                    'SubTotal (exc. Tax)': 'Sub Total',
-                    'Tax': 'Tax Total',
-                    'Payable Amount (inc. Tax)': 'Payable Amount',
-                    'Rebate': 'Rebate AI',
-                    'Rebate %': 'Rebate%',
-                    'Amount to Pay': 'Amount to pay',
-                    'company': 'Vendor Name',
-                    'transaction_fee': 'Trans fee',
-                    'merch_fee': 'Merch fee',
-                    'Status_in_api': 'Status in api',
-                    'ap_status': 'AP status',
-                    'ai_order_id': 'ROID',
-                    'id': 'PO',
-                    'invoice_number': 'Invoice no',
-                    'vin': 'VIN',
-                    'AI Transaction Fee': 'AI trans Fee',
-                    'FMC Rebate Amount': 'FMC Rebate'
-                }
-
-                for old, new in column_renames.items():
-                    if old in df.columns:
-                        df[new] = df[old]
-
-                final_cols = [col for col in required_cols if col in df.columns]
-                rebate_enrichment_df = df[final_cols]
-
-                st.success("✅ Calculations complete!")
-                st.dataframe(rebate_enrichment_df)
-
-                for col in ['Appointment date', 'Appointment month', 'Appointment year']:
-                    if col in rebate_enrichment_df.columns:
-                        rebate_enrichment_df[col] = rebate_enrichment_df[col].astype(str)
-
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    rebate_enrichment_df.to_excel(writer, index=False, sheet_name='Updated')
-                output.seek(0)
-
-                st.download_button(
-                    label="📅 Download Tax & Rebate Result",
-                    data=output.getvalue(),
-                    file_name="updated_calculations.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-
-        if unmatched_df.shape[0] > 0 and rebate_enrichment_df is not None:
-            st.markdown("---")
-            st.subheader("🔍 Step 3: Enrich Unmatched Rows Using Calculated File")
-
-            drop_cols = [col for col in unmatched_df.columns if col in rebate_enrichment_df.columns and col != merge_key]
-            enrich_df = pd.merge(
-                unmatched_df.drop(columns=drop_cols),
-                rebate_enrichment_df,
-                on=merge_key,
-                how='left',
-                indicator=True
-            )
-            enrich_df['Match Status'] = enrich_df['_merge'].map({
-                'both': 'Matched with Query result',
-                'left_only': 'Still Unmatched'
-            })
-            enrich_df.drop(columns=['_merge'], inplace=True)
-
-            if 'Statement amount' in enrich_df.columns and 'Amount to pay' in enrich_df.columns:
-                enrich_df['Disputed amount'] = enrich_df['Statement amount'] - enrich_df['Amount to pay']
-
-            final_output = pd.concat([merged_df[merged_df['Match Status'] == 'Matched with Estimates'], enrich_df])
-
-            if {'Disputed amount', 'Rebate AI'}.issubset(final_output.columns):
-                final_output['Dispute analysis'] = final_output['Rebate AI'] + final_output['Disputed amount']
-
-            if 'Dispute analysis' in final_output.columns and 'Match Status' in final_output.columns:
-                cols = final_output.columns.tolist()
-                cols.remove('Match Status')
-                idx = cols.index('Dispute analysis') + 1
-                cols.insert(idx, 'Match Status')
-                final_output = final_output[cols]
-
-            match_status_summary = final_output['Match Status'].value_counts()
-            duplicate_statements = merged_df[merged_df['Match Status'] == 'Matched with Estimates'].duplicated(subset=merge_key, keep=False).sum()
-            duplicate_estimates = estimates_df[estimates_df[merge_key].isin(final_output[merge_key])].duplicated(subset=merge_key, keep=False).sum()
-
-            st.write("### Summary of Match Status")
-            st.write(f"🔗 **Matched with Estimates**: {match_status_summary.get('Matched with Estimates', 0)}")
-            st.write(f"🔗 **Matched with Query result**: {match_status_summary.get('Matched with Query result', 0)}")
-            st.write(f"🔗 **Still Unmatched**: {match_status_summary.get('Still Unmatched', 0)}")
-            st.write(f"🔁 **Duplicates in Statements**: {duplicate_statements}")
-            st.write(f"🔁 **Duplicates in Estimates**: {duplicate_estimates}")
-
-            # Convert PO column to int (if possible)
-            if 'PO' in final_output.columns:
-                try:
-                    final_output['PO'] = pd.to_numeric(final_output['PO'], errors='raise').astype(int)
-                except Exception as e:
-                    st.warning(f"⚠️ Could not convert PO column to integer format in Tab 1: {e}")
-
-            for col in ['Appointment date', 'Appointment month', 'Appointment year']:
-                if col in final_output.columns:
-                    final_output[col] = final_output[col].astype(str)
-
-            output_final = io.BytesIO()
-            with pd.ExcelWriter(output_final, engine='xlsxwriter') as writer:
-                final_output.to_excel(writer, index=False, sheet_name='Final Processed')
-            output_final.seek(0)
-
-            original_name = os.path.splitext(statement_file.name)[0] if statement_file else "Processed_Statement"
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M")
-            file_name = f"{original_name}_Final_Processed_{timestamp}.xlsx"
-
-            st.session_state["final_output_file_name"] = file_name
-            st.session_state["final_output_df"] = final_output
-
-            st.success("✅ Final enriched file ready!")
-            st.download_button(
-                "📥 Download Final Enriched Statement",
-                output_final.getvalue(),
-                file_name,
-                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
-
-
-# --- TAB 2 ---
-with tab2:
-    st.header("🤚 Tab 2: PO Match Checker with Non-AI Reference")
-    final_df = st.session_state.get("final_output_df")
-    if final_df is None:
-        st.warning("⚠️ Please run Tab 1 and complete processing to generate the final output file first.")
-    else:
-        non_ai_file = st.file_uploader("📄 Upload Non-AI Reference File (with 'PO' column)", type=["xlsx"], key="non_ai_file")
-
-        if non_ai_file:
-            try:
-                df_non_ai = pd.read_excel(non_ai_file)
-
-                if 'PO' not in df_non_ai.columns or 'PO' not in final_df.columns:
-                    st.error("❌ 'PO' column not found in both files.")
-                else:
-                    df_non_ai['PO'] = df_non_ai['PO'].astype(str).str.strip()
-                    final_df['PO'] = final_df['PO'].astype(str).str.strip()
-
-                    final_df['Non AI check'] = final_df['PO'].apply(
-                        lambda po: "Matched with Non-AI" if po in df_non_ai['PO'].values else " "
-                    )
-
-                    # Convert PO column to int (if possible)
-                    if 'PO' in final_df.columns:
-                        try:
-                            final_df['PO'] = pd.to_numeric(final_df['PO'], errors='raise').astype(int)
-                        except Exception as e:
-                            st.warning(f"⚠️ Could not convert PO column to integer format in Tab 2: {e}")
-
-                    st.success("✅ 'Non AI check' column added.")
-                    st.dataframe(final_df)
-
-                    output = io.BytesIO()
-                    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                        final_df.to_excel(writer, index=False, sheet_name="PO_Match_Result")
-                    output.seek(0)
-
-                    file_name_tab2 = st.session_state.get("final_output_file_name", "PO_Match_Result.xlsx")
-
-                    st.download_button(
-                        label="📅 Download PO Match Result",
-                        data=output.getvalue(),
-                        file_name=file_name_tab2,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-            except Exception as e:
-                st.error(f"❌ Error processing files: {str(e)}")
-
-# --- TAB 3 ---
-with tab3:
-    st.header("💳 Remittance Merge Based on PO")
-
-    final_df = st.session_state.get("final_output_df")
-
-    if final_df is None:
-        st.warning("⚠️ Please upload and process the base file in Tab 1.")
-    else:
-        remittance_file = st.file_uploader("📤 Upload Remittance File (Excel)", type=["xlsx"], key="remittance_file")
-
-        if remittance_file:
-            try:
-                remit_df = pd.read_excel(remittance_file)
-
-                required_remit_cols = [
-                    'shop_order_id', 'paid_amount', 'paid_date',
-                    'disputed_amount', 'disputed_date',
-                    'dispute_reason', 'payment_details'
-                ]
-
-                missing_cols = [col for col in required_remit_cols if col not in remit_df.columns]
-                if missing_cols:
-                    st.error(f"❌ Missing columns in Remittance File: {missing_cols}")
-                else:
-                    # Subset and rename
-                    remit_df_subset = remit_df[required_remit_cols].copy()
-                    remit_df_subset.rename(columns={'shop_order_id': 'PO'}, inplace=True)
-
-                    # Ensure PO columns are Int64
-                    final_df['PO'] = pd.to_numeric(final_df['PO'], errors='coerce').astype('Int64')
-                    remit_df_subset['PO'] = pd.to_numeric(remit_df_subset['PO'], errors='coerce').astype('Int64')
-
-                    # Merge final_df with remittance info
-                    merged_remit_df = pd.merge(final_df, remit_df_subset, on='PO', how='left')
-
-                    # Final display
-                    st.subheader("🔗 Merged Statement with Remittance Info")
-                    st.dataframe(merged_remit_df)
-
-                    # Download option
-                    csv = merged_remit_df.to_csv(index=False).encode('utf-8')
-                    st.download_button(
-                        label="📥 Download Full Merged Output (Tab 3)",
-                        data=csv,
-                        file_name="tab3_full_merged_output.csv",
-                        mime="text/csv"
-                    )
-
-                    # Also show just remittance part for quick view
-                    st.subheader("📌 Remittance Columns Only (Preview)")
-                    remittance_only = merged_remit_df[[
-                        'PO', 'paid_amount', 'paid_date',
-                        'disputed_amount', 'disputed_date',
-                        'dispute_reason', 'payment_details'
-                    ]]
-                    st.dataframe(remittance_only)
-
-            except Exception as e:
-                st.error(f"❌ Error reading Remittance file: {e}")
+import streamlit as st
+
+from reconciliation.cache import upload_token
+from reconciliation.columns import (
+    FUZZY_MATCHED, MATCHED_ESTIMATES, MATCHED_QUERY, STILL_UNMATCHED, UPLOAD_TYPES, non_ai_cols,
+    required_remit_cols
+)
+from reconciliation.downloads import lazy_download
+from reconciliation.duplicates import DEDUPE_POLICIES, fanout_by_vendor
+from reconciliation.fuzzy import fuzzy_match_count
+from reconciliation.panels import (
+    keep, kept, preview, profile_panel, reference_store, rollup_cube, rollup_panel, rollup_run_name, shared_stage_cache,
+    start_profile
+)
+from reconciliation.engine import (
+    check_non_ai, merge_remittance, non_ai_index, po_to_int, reference_indexes, remittance_only, unmatched_rows
+)
+from reconciliation.pipeline import FC3, Pipeline
+from reconciliation.readers import read_table
+from reconciliation.rollup import run_name, run_rows
+from reconciliation.scenarios import parse_rates, rebate_scenarios, vendor_rate_table
+
+st.set_page_config(page_title="Statement Processing", layout="wide")
+st.title("📊 Statement Processor")
+
+# Shared across reruns and with the other apps, so widget changes only recompute the stages downstream of them
+cache = shared_stage_cache()
+profiler = start_profile("FC3")
+store = reference_store()
+cube = rollup_cube()
+rollup_run = rollup_run_name() if cube is not None else None
+# (key, rows) this rerun adds to the cube: Tab 1's final output, replaced by Tab 3's when it ran
+rollup_source = None
+
+
+def stage(name, deps, fn):
+    # Cached stage; only the ones recomputed on this rerun show up in the profile
+    return cache.stage(name, deps, lambda: profiler.call(name, fn))
+
+
+def read_upload(uploaded_file, columns=None):
+    return cache.stage(
+        "read", (upload_token(uploaded_file), uploaded_file.name, columns),
+        lambda: read_table(uploaded_file, columns=columns)
+    )
+
+
+def non_ai_output(final_df, df_non_ai, index, references=None):
+    # (frame, PO conversion error), computed once per Tab 1 result and reference file rather than on every rerun
+    df = check_non_ai(final_df, df_non_ai, index, references)
+    # Convert PO column to int (if possible)
+    try:
+        return po_to_int(df), None
+    except Exception as e:
+        return df, str(e)
+
+
+def scenario_tables(final_df, rates, rate_table, all_rows):
+    vendor_rates = vendor_rate_table(rate_table) if rate_table is not None else None
+    scenarios = rebate_scenarios(final_df, rates, vendor_rates, all_rows=all_rows)
+    comparison = scenarios.comparison()
+    return comparison, scenarios.pivot(comparison)
+
+
+# Define three tabs
+tab1, tab2, tab3 = st.tabs(["📊 Statement Processor", "Non-AI PO Check", "💳 Remittance Merge"])
+
+# --- TAB 1 ---
+with tab1:
+    st.header("📋 Step 1: Upload Statement & Estimates Files")
+    statement_file = st.file_uploader("📄 Upload Statement File (.xlsx)", type=UPLOAD_TYPES)
+    estimates_file = st.file_uploader("📄 Upload Estimates File (.xlsx)", type=UPLOAD_TYPES)
+    stored_estimates = not estimates_file and store is not None and store.has('estimates')
+    if stored_estimates:
+        st.caption("🗄️ Estimates come from the reference store, only for the statement's POs/ROIDs.")
+
+    rebate_enrichment_df = None
+
+    if statement_file and (estimates_file or stored_estimates):
+        merge_key = st.selectbox("🔑 Select merge key", ['PO', 'ROID'])
+        pipeline = Pipeline(
+            FC3, cache, statement=statement_file, estimates=estimates_file, merge_key=merge_key, reference_store=store
+        )
+
+        try:
+            duplicates = pipeline.get('duplicates')
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+
+        if duplicates.duplicated_estimate_keys:
+            st.warning(
+                f"⚠️ {duplicates.duplicated_estimate_keys} {merge_key}s repeat in Estimates: the merge turns "
+                f"{duplicates.statement_rows} statement rows into {duplicates.merged_rows} "
+                f"(×{duplicates.fanout:.2f})."
+            )
+            pipeline.set(dedupe=st.selectbox(
+                "🧹 Deduplicate Estimates before merging", [None, *DEDUPE_POLICIES], key="dedupe",
+                format_func=lambda policy: "Keep every row" if policy is None else DEDUPE_POLICIES[policy]
+            ))
+
+        try:
+            merged_df = pipeline.get('merged')
+        except ValueError as e:
+            st.error(f"❌ {e}")
+            st.stop()
+
+        st.info(f"🔗 Merging on: **{merge_key}**")
+
+        unmatched_df = unmatched_rows(merged_df)
+
+        report = pipeline.get('duplicate_report')
+        if not report.empty:
+            with st.expander(f"🔁 Duplicate Keys ({len(report)})", expanded=False):
+                preview(report, key="duplicate_preview", data_key=pipeline.key('duplicate_report'))
+                st.write("Extra merged rows by vendor")
+                fanout_key, fanout = stage(
+                    "duplicate_fanout", (pipeline.key('duplicate_report'),), lambda: fanout_by_vendor(report)
+                )
+                preview(fanout, key="duplicate_fanout_preview", data_key=fanout_key)
+                lazy_download(
+                    "📥 Download Duplicate Report", report, "Duplicate_Report.xlsx",
+                    key="duplicate_report", sheet_name='Duplicate Report', data_key=pipeline.key('duplicate_report')
+                )
+
+        with st.expander("📄 Initial Merged File", expanded=False):
+            preview(merged_df, key="merged_preview", data_key=pipeline.key('merged'))
+
+            lazy_download(
+                "📥 Download Initial Merged File", pipeline.get('merged_view'), "Initial_Merged_Statement_Estimates.xlsx",
+                key="initial_merged", sheet_name='Merged', data_key=pipeline.key('merged_view')
+            )
+
+        st.markdown("---")
+        st.subheader("🧮 Step 2: Tax & Rebate Calculator for Enrichment")
+
+        rebate_input_file = st.file_uploader("📁 Upload file for Tax & Rebate Calculation", type=UPLOAD_TYPES, key="rebate_file")
+
+        if not rebate_input_file and pipeline.stored('rebate_input'):
+            st.caption("🗄️ Query results come from the reference store, only for the statement's POs/ROIDs.")
+
+        if rebate_input_file or pipeline.stored('rebate_input'):
+            rebate_percent = st.number_input("💸 Enter Rebate %", value=FC3.rebate_percent, step=0.1, key="rebate_pct")
+            pipeline.set(rebate_input=rebate_input_file, rebate_percent=rebate_percent)
+
+            try:
+                rebate_enrichment_df = pipeline.get('rebates')
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                st.success("✅ Calculations complete!")
+                preview(rebate_enrichment_df, key="rebate_preview", data_key=pipeline.key('rebates'))
+
+                lazy_download(
+                    "📅 Download Tax & Rebate Result", pipeline.get('rebates_view'), "updated_calculations.xlsx",
+                    key="rebate_result", sheet_name='Updated', data_key=pipeline.key('rebates_view')
+                )
+
+        if unmatched_df.shape[0] > 0 and rebate_enrichment_df is not None:
+            st.markdown("---")
+            st.subheader("🔍 Step 3: Enrich Unmatched Rows Using Calculated File")
+
+            # The lookups need every reference row, not just those fetched for the statement's keys
+            fuzzy = not stored_estimates and st.checkbox(
+                "🧩 Suggest matches for Still Unmatched rows", key="fuzzy_match"
+            )
+            if stored_estimates:
+                st.caption("🧩 Match suggestions need the full Estimates file uploaded.")
+            if fuzzy:
+                amount_col = st.selectbox(
+                    "Statement amount column (compared with Payable Amount)",
+                    [None, *pipeline.get('statement').columns],
+                    key="fuzzy_amount", format_func=lambda col: "None" if col is None else col
+                )
+                pipeline.set(fuzzy=True, amount_col=amount_col)
+
+            final_output, po_error = pipeline.get('final_output')
+            final_key = pipeline.key('final_output')
+            summary = pipeline.get('summary')
+
+            st.write("### Summary of Match Status")
+            st.write(f"🔗 **Matched with Estimates**: {summary[MATCHED_ESTIMATES]}")
+            st.write(f"🔗 **Matched with Query result**: {summary[MATCHED_QUERY]}")
+            st.write(f"🔗 **Still Unmatched**: {summary[STILL_UNMATCHED]}")
+            st.write(f"🔁 **Duplicates in Statements**: {summary['Duplicates in Statements']}")
+            st.write(f"🔁 **Duplicates in Estimates**: {summary['Duplicates in Estimates']}")
+            if fuzzy:
+                st.write(f"🧩 **{FUZZY_MATCHED}**: {fuzzy_match_count(final_output)}")
+
+            if po_error:
+                st.warning(f"⚠️ Could not convert PO column to integer format in Tab 1: {po_error}")
+
+            file_name = FC3.output_file_name(statement_file.name)
+
+            # Tabs 2 and 3 read this artifact and derive their own; it is never modified in place
+            st.session_state["final_output_file_name"] = file_name
+            keep("final_output", final_key, final_output)
+            rollup_source = (final_key, lambda: final_output)
+
+            st.success("✅ Final enriched file ready!")
+            lazy_download(
+                "📥 Download Final Enriched Statement", final_output, file_name,
+                key="final_output", sheet_name=FC3.output_sheet, data_key=final_key
+            )
+
+            with st.expander("🧪 Rebate what-if scenarios", expanded=False):
+                rates_text = st.text_input("Rebate % to compare (comma separated)", "5, 7.5, 10", key="scenario_rates")
+                rate_file = st.file_uploader(
+                    "Optional per-vendor rebate table: 'Vendor Name' plus one rebate % column per scenario",
+                    type=UPLOAD_TYPES, key="scenario_table"
+                )
+                all_rows = st.checkbox(
+                    "Apply to every row with a Sub Total, not only the query-matched rows", key="scenario_all_rows"
+                )
+                try:
+                    rates = parse_rates(rates_text)
+                    table_key, rate_table = read_upload(rate_file) if rate_file else (None, None)
+                    # One pass over the final output for every scenario, recomputed only when its inputs change
+                    scenario_key, (comparison, pivot) = stage(
+                        "rebate_scenarios", (final_key, tuple(rates), table_key, all_rows),
+                        lambda: scenario_tables(final_output, rates, rate_table, all_rows)
+                    )
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    st.write("#### Disputed amount per vendor and scenario")
+                    st.dataframe(pivot)
+                    lazy_download(
+                        "📥 Download Scenario Comparison", comparison, "Rebate_Scenarios.xlsx",
+                        key="rebate_scenarios", sheet_name='Rebate Scenarios', data_key=scenario_key
+                    )
+
+
+# --- TAB 2 ---
+with tab2:
+    st.header("🤚 Tab 2: PO Match Checker with Non-AI Reference")
+    final_key, final_df = kept("final_output")
+    if final_df is None:
+        st.warning("⚠️ Please run Tab 1 and complete processing to generate the final output file first.")
+    else:
+        non_ai_file = st.file_uploader("📄 Upload Non-AI Reference File (with 'PO' column)", type=UPLOAD_TYPES, key="non_ai_file")
+
+        if non_ai_file:
+            try:
+                non_ai_key, df_non_ai = read_upload(non_ai_file, non_ai_cols)
+
+                if 'PO' not in df_non_ai.columns or 'PO' not in final_df.columns:
+                    st.error("❌ 'PO' column not found in both files.")
+                else:
+                    # Built once per reference file and kept in the stage cache across reruns
+                    _, index = stage("non_ai_index", (non_ai_key,), lambda: non_ai_index(df_non_ai))
+                    references_key, references = None, None
+                    if st.checkbox("Also list the reference files each PO is in ('Found in')", key="found_in"):
+                        # The Estimates uploaded in Tab 1, and the remittance file once one is uploaded in Tab 3
+                        remit_upload = st.session_state.get("remittance_file")
+                        est_key, est_df = read_upload(estimates_file, ['PO']) if estimates_file else (None, None)
+                        rem_key, rem_df = (
+                            read_upload(remit_upload, required_remit_cols) if remit_upload else (None, None)
+                        )
+                        references_key, references = stage(
+                            "reference_indexes", (est_key, rem_key), lambda: reference_indexes(est_df, rem_df)
+                        )
+                    checked_key, (non_ai_df, po_error) = stage(
+                        "check_non_ai", (final_key, non_ai_key, references_key),
+                        lambda: non_ai_output(final_df, df_non_ai, index, references)
+                    )
+                    if po_error:
+                        st.warning(f"⚠️ Could not convert PO column to integer format in Tab 2: {po_error}")
+
+                    # Stored next to the Tab 1 artifact, which Tab 3 falls back to without a Non-AI check
+                    keep("non_ai_output", checked_key, non_ai_df, base=final_key)
+                    final_df = non_ai_df
+
+                    st.success("✅ 'Non AI check' column added.")
+                    preview(final_df, key="non_ai_preview", data_key=checked_key)
+
+                    file_name_tab2 = st.session_state.get("final_output_file_name", "PO_Match_Result.xlsx")
+
+                    lazy_download(
+                        "📅 Download PO Match Result", final_df, file_name_tab2,
+                        key="po_match_result", sheet_name="PO_Match_Result", data_key=checked_key
+                    )
+            except Exception as e:
+                st.error(f"❌ Error processing files: {str(e)}")
+
+# --- TAB 3 ---
+with tab3:
+    st.header("💳 Remittance Merge Based on PO")
+
+    final_key, final_df = kept("final_output")
+    if final_df is not None:
+        # The Non-AI checked frame when Tab 2 ran on this Tab 1 result
+        checked_key, checked_df = kept("non_ai_output", base=final_key)
+        if checked_df is not None:
+            final_key, final_df = checked_key, checked_df
+
+    if final_df is None:
+        st.warning("⚠️ Please upload and process the base file in Tab 1.")
+    else:
+        remittance_file = st.file_uploader("📤 Upload Remittance File (Excel)", type=UPLOAD_TYPES, key="remittance_file")
+        stored_remittance = not remittance_file and store is not None and store.has('remittance')
+        if stored_remittance:
+            st.caption("🗄️ Remittance comes from the reference store, only for the POs in this output.")
+
+        if remittance_file or stored_remittance:
+            try:
+                if remittance_file:
+                    remit_key, remit_df = read_upload(remittance_file, required_remit_cols)
+                else:
+                    remit_key, remit_df = stage(
+                        "fetch", (store.path, store.version(), 'remittance', final_key, required_remit_cols),
+                        lambda: store.fetch('remittance', {'PO': final_df['PO']}, required_remit_cols)
+                    )
+
+                detail = st.checkbox(
+                    "One row per payment (statement rows repeat for multi-payment POs)", key="remit_detail"
+                )
+                as_of = None
+                if st.checkbox("📅 Only payments up to a statement cutoff", key="remit_cutoff"):
+                    as_of = st.date_input("Cutoff (paid_date)", key="remit_as_of")
+
+                try:
+                    merged_remit_key, merged_remit_df = stage(
+                        "merge_remittance", (final_key, remit_key, detail, str(as_of)),
+                        lambda: merge_remittance(final_df, remit_df, detail=detail, as_of=as_of)
+                    )
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    rollup_source = (
+                        merged_remit_key,
+                        lambda: run_rows(final_df, merged_remit_df, remit_df, detail=detail, as_of=as_of)
+                    )
+
+                    # Final display
+                    st.subheader("🔗 Merged Statement with Remittance Info")
+                    preview(merged_remit_df, key="remit_preview", data_key=merged_remit_key)
+
+                    # Download option
+                    lazy_download(
+                        "📥 Download Full Merged Output (Tab 3)", merged_remit_df, "tab3_full_merged_output.csv",
+                        key="tab3_merged", sheet_name="Remittance Merge", default_format='csv',
+                        data_key=merged_remit_key
+                    )
+
+                    # Also show just remittance part for quick view
+                    st.subheader("📌 Remittance Columns Only (Preview)")
+                    preview(
+                        remittance_only(merged_remit_df), key="remit_only_preview",
+                        data_key=f"{merged_remit_key}:remittance"
+                    )
+
+            except Exception as e:
+                st.error(f"❌ Error reading Remittance file: {e}")
+
+if cube is not None:
+    if rollup_source is not None and statement_file:
+        source_key, rows = rollup_source
+        # One update per result, after every tab ran, so Tab 1's totals never overwrite Tab 3's
+        name = run_name(statement_file.name, rollup_run, upload_token(statement_file))
+        stage("rollup", (cube.path, name, source_key), lambda: cube.update(name, rows()))
+    rollup_panel(cube)
+
+profile_panel(profiler)
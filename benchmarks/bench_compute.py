@@ -0,0 +1,109 @@
+"""Row-wise df.apply vs the columnar Step 2/3 calculations, checking both give identical results.
+
+    python benchmarks/bench_compute.py --rows 200000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reconciliation.columns import MATCHED_ESTIMATES, UNMATCHED_ESTIMATES  # noqa: E402
+from reconciliation.compute import (  # noqa: E402
+    add_dispute_analysis, add_disputed_amount, clean_currency, promote_status, rebate_pct_column
+)
+
+QR_MATCHED = "Matched with Query Results ✅"
+
+
+# --- Previous row-wise implementations, kept as the reference ---
+def clean_currency_rowwise(series):
+    series = series.astype(str).str.replace(r'[$,₹,CA]', '', regex=True)
+    return pd.to_numeric(series, errors='coerce').fillna(0)
+
+
+def rebate_pct_rowwise(df):
+    return df.apply(
+        lambda row: f"{((row['Rebate'] / row['SubTotal (exc. Tax)']) * 100):.2f}%"
+        if row['SubTotal (exc. Tax)'] != 0 else '0.00%', axis=1
+    )
+
+
+def promote_status_rowwise(df, qr_col):
+    return df.apply(
+        lambda row: QR_MATCHED
+        if row["Match Status"] == UNMATCHED_ESTIMATES and not pd.isna(row[qr_col])
+        else row["Match Status"],
+        axis=1
+    )
+
+
+def query_export(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    subtotal = rng.uniform(-200, 2000, rows).round(2)
+    subtotal[rng.random(rows) < 0.05] = 0
+    df = pd.DataFrame({
+        'SubTotal (exc. Tax)': [f"${v:,.2f}" for v in subtotal],
+        'Statement amount': rng.uniform(0, 2000, rows).round(2),
+        'Amount to pay': rng.uniform(0, 2000, rows).round(2),
+        'Match Status': rng.choice([MATCHED_ESTIMATES, UNMATCHED_ESTIMATES], rows),
+        'PO_QR': np.where(rng.random(rows) < 0.5, rng.integers(1, 10**6, rows), np.nan),
+    })
+    df.loc[rng.random(rows) < 0.01, 'SubTotal (exc. Tax)'] = 'n/a'
+    return df
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def bench(label, rowwise, columnar, compare):
+    t_row, expected = timed(*rowwise)
+    t_col, actual = timed(*columnar)
+    compare(expected, actual)
+    print(f"{label:<28}{t_row:>12.3f}{t_col:>12.3f}{t_row / max(t_col, 1e-9):>10.1f}x", flush=True)
+
+
+def assert_same_values(expected, actual):
+    pd.testing.assert_series_equal(expected, actual, check_dtype=False, check_names=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--rebate-pct", type=float, default=10.0)
+    args = parser.parse_args(argv)
+
+    df = query_export(args.rows)
+    subtotal = clean_currency(df['SubTotal (exc. Tax)'])
+    calc = pd.DataFrame({'SubTotal (exc. Tax)': subtotal, 'Rebate': subtotal * (-args.rebate_pct / 100.0)})
+
+    print(f"{'calculation':<28}{'apply s':>12}{'columnar s':>12}{'speedup':>11}")
+    bench("currency cleanup", (clean_currency_rowwise, df['SubTotal (exc. Tax)']),
+          (clean_currency, df['SubTotal (exc. Tax)']), assert_same_values)
+    bench("Rebate % (formatted)", (rebate_pct_rowwise, calc),
+          (rebate_pct_column, calc['Rebate'], calc['SubTotal (exc. Tax)']), assert_same_values)
+    bench("Rebate % (numeric)",
+          (lambda d: rebate_pct_rowwise(d).str.rstrip('%').astype(float), calc),
+          (lambda d: rebate_pct_column(d['Rebate'], d['SubTotal (exc. Tax)'], formatted=False).round(2), calc),
+          assert_same_values)
+    bench("Query Results status", (promote_status_rowwise, df, 'PO_QR'),
+          (promote_status, df['Match Status'], df['PO_QR'].notna(), UNMATCHED_ESTIMATES, QR_MATCHED),
+          assert_same_values)
+
+    disputes = df[['Statement amount', 'Amount to pay']].assign(**{'Rebate AI': calc['Rebate']})
+    bench("Disputed amount/analysis",
+          (lambda d: d.apply(lambda r: r['Rebate AI'] + (r['Statement amount'] - r['Amount to pay']), axis=1),
+           disputes),
+          (lambda d: add_dispute_analysis(add_disputed_amount(d.copy()))['Dispute analysis'], disputes),
+          assert_same_values)
+
+
+if __name__ == '__main__':
+    main()
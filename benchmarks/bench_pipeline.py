@@ -0,0 +1,308 @@
+"""End-to-end stage timings of the reconciliation on synthetic inputs, checked against the original FC3 logic.
+
+    python benchmarks/bench_pipeline.py --rows 10000 100000
+    python benchmarks/bench_pipeline.py --rows 1000000 5000000 --format csv --modes in-memory chunked
+
+Every mode runs in a fresh process: reads, Steps 1-3, Tabs 2 and 3 and the exports, one
+profiler record per stage. "reference" is FC3 as it was before the engine (benchmarks/reference.py);
+up to --check-max-rows its frames and summary are compared value by value with the in-memory
+engine's, and the chunked summary with either. Results are appended to --history with the
+commit they were measured at, and each run is printed next to the previous one of the same scenario.
+"""
+import argparse
+import csv
+import datetime
+import logging
+import multiprocessing as mp
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from reconciliation.chunked import DEFAULT_PARTITIONS, reconcile_chunked  # noqa: E402
+from reconciliation.cli import write_outputs  # noqa: E402
+from reconciliation.columns import (  # noqa: E402
+    MATCHED_NON_AI, NOT_NON_AI, non_ai_cols, rebate_input_cols, required_cols, required_remit_cols
+)
+from reconciliation.engine import reconcile  # noqa: E402
+from reconciliation.profiling import Profiler, max_rss_mb  # noqa: E402
+from reconciliation.readers import read_table  # noqa: E402
+
+from reference import read_raw, reference_fc3  # noqa: E402
+from synthetic import EXCEL_MAX_ROWS, FORMATS, Scenario, cached_inputs  # noqa: E402
+
+MODES = ['reference', 'in-memory', 'chunked']
+OUTPUTS = ['merged_df', 'rebate_enrichment_df', 'final_output', 'non_ai_df', 'merged_remit_df']
+HISTORY = os.path.join(ROOT, 'benchmarks', 'results', 'pipeline_history.csv')
+HISTORY_COLS = [
+    'run', 'commit', 'host', 'python', 'pandas', 'mode', 'format', 'merge_key', 'rows', 'match_rate', 'query_rate',
+    'duplicate_rate', 'non_ai_rate', 'remit_rate', 'seed', 'stage', 'calls', 'seconds', 'rows_in', 'rows_out',
+    'rss_mb',
+]
+
+
+def run_reference(paths, merge_key, rebate_pct, out_dir):
+    out = reference_fc3(
+        read_raw(paths['statement']), read_raw(paths['estimates']), merge_key,
+        rebate_df=read_raw(paths['rebate']), rebate_percent=rebate_pct,
+        non_ai_df=read_raw(paths['non_ai']), remit_df=read_raw(paths['remittance']), export=True,
+    )
+    return out.get('summary', {})
+
+
+def run_in_memory(paths, merge_key, rebate_pct, out_dir):
+    result = reconcile(
+        read_table(paths['statement']),
+        read_table(paths['estimates'], columns=required_cols),
+        merge_key=merge_key,
+        rebate_df=read_table(paths['rebate'], columns=rebate_input_cols),
+        rebate_percent=rebate_pct,
+        non_ai_df=read_table(paths['non_ai'], columns=non_ai_cols),
+        remit_df=read_table(paths['remittance'], columns=required_remit_cols),
+    )
+    write_outputs(result, paths['statement'], out_dir)
+    return result.summary
+
+
+def run_chunked(paths, merge_key, rebate_pct, out_dir, partitions=DEFAULT_PARTITIONS):
+    run = reconcile_chunked(
+        paths['statement'], paths['estimates'], out_dir, merge_key=merge_key, rebate=paths['rebate'],
+        rebate_percent=rebate_pct, non_ai=paths['non_ai'], remittance=paths['remittance'], partitions=partitions,
+    )
+    return run['summary']
+
+
+RUNNERS = {'reference': run_reference, 'in-memory': run_in_memory, 'chunked': run_chunked}
+
+
+def quiet():
+    # The engine's expected PO-conversion warnings repeat per partition and drown the tables
+    logging.getLogger('reconciliation').setLevel(logging.ERROR)
+
+
+def run_case(mode, paths, merge_key, rebate_pct, queue):
+    quiet()
+    profiler = Profiler(mode).activate()
+    with tempfile.TemporaryDirectory() as out_dir:
+        start = time.perf_counter()
+        try:
+            summary = RUNNERS[mode](paths, merge_key, rebate_pct, out_dir)
+        except Exception as e:
+            queue.put({'error': f"{type(e).__name__}: {e}"})
+            return
+        seconds = time.perf_counter() - start
+    queue.put({'records': profiler.records, 'seconds': seconds, 'rss_mb': max_rss_mb(), 'summary': summary})
+
+
+def measure(mode, paths, merge_key, rebate_pct):
+    # A fresh process per mode, so one mode's peak RSS and warm caches don't leak into the next
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_case, args=(mode, paths, merge_key, rebate_pct, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def stage_table(result):
+    # Stages repeated per partition or file are summed; only top-level stages add up to the total
+    records = pd.DataFrame(result['records'], columns=['stage', 'seconds', 'rows_in', 'rows_out', 'rss_mb'])
+    records[['rows_in', 'rows_out']] = records[['rows_in', 'rows_out']].astype('float64')
+    table = records.groupby('stage', sort=False).agg(
+        calls=('stage', 'size'), seconds=('seconds', 'sum'), rows_in=('rows_in', lambda v: v.sum(min_count=1)),
+        rows_out=('rows_out', lambda v: v.sum(min_count=1)), rss_mb=('rss_mb', 'max'),
+    ).reset_index()
+    total = pd.DataFrame([{'stage': 'total', 'calls': 1, 'seconds': result['seconds'], 'rows_in': np.nan,
+                           'rows_out': np.nan, 'rss_mb': result['rss_mb']}])
+    return pd.concat([table, total], ignore_index=True)
+
+
+# --- Equality with the original FC3 logic ---
+def comparable(series):
+    # Values as FC3's users see them: numbers compared as numbers whatever their dtype, text as text
+    missing = series.isna().tolist()
+    num = pd.to_numeric(series.astype(object), errors='coerce').tolist()
+    text = series.astype(object).tolist()
+    return [None if gone else round(n, 6) if not pd.isna(n) else str(t) for gone, n, t in zip(missing, num, text)]
+
+
+def float_po_matches(expected, actual, col, rows):
+    # FC3 compared str(PO) with the Non-AI POs, so once missing POs turned the column float ('1001.0')
+    # nothing matched '1001'; KeyIndex normalizes both sides. Only those extra matches are accepted.
+    if col != 'Non AI check' or 'PO' not in expected.columns or not expected['PO'].isna().any():
+        return False
+    return bool((expected[col].iloc[rows] == NOT_NON_AI).all() and (actual[col].iloc[rows] == MATCHED_NON_AI).all())
+
+
+INTENDED = [float_po_matches]
+
+
+def compare_frames(expected, actual):
+    """Lists of problems and of intended differences between two frames."""
+    problems, intended = [], []
+    if list(expected.columns) != list(actual.columns):
+        return [f"columns differ: {list(expected.columns)} != {list(actual.columns)}"], intended
+    if len(expected) != len(actual):
+        return [f"{len(expected)} rows != {len(actual)} rows"], intended
+    for col in expected.columns:
+        want, got = comparable(expected[col]), comparable(actual[col])
+        bad = [i for i, (w, g) in enumerate(zip(want, got)) if w != g]
+        if not bad:
+            continue
+        message = f"{col}: {len(bad)} rows differ, first at row {bad[0]}: {want[bad[0]]!r} != {got[bad[0]]!r}"
+        if any(accept(expected, actual, col, bad) for accept in INTENDED):
+            intended.append(message)
+        else:
+            problems.append(message)
+    return problems, intended
+
+
+def check_equal(paths, merge_key, rebate_pct):
+    """Problems and intended differences of the in-memory engine against the reference, and its summary."""
+    raw = {name: read_raw(path) for name, path in paths.items()}
+    expected = reference_fc3(raw['statement'], raw['estimates'], merge_key, rebate_df=raw['rebate'],
+                             rebate_percent=rebate_pct, non_ai_df=raw['non_ai'], remit_df=raw['remittance'])
+    result = reconcile(
+        read_table(paths['statement']), read_table(paths['estimates'], columns=required_cols), merge_key=merge_key,
+        rebate_df=read_table(paths['rebate'], columns=rebate_input_cols), rebate_percent=rebate_pct,
+        non_ai_df=read_table(paths['non_ai'], columns=non_ai_cols),
+        remit_df=read_table(paths['remittance'], columns=required_remit_cols),
+        # FC3 joined every remittance row; the per-PO totals joined by default are an intended change
+        remittance_detail=True,
+    )
+    problems, intended = [], []
+    for name in OUTPUTS:
+        want, got = expected.get(name), getattr(result, name)
+        if (want is None) != (got is None):
+            problems.append(f"{name}: produced by only one of reference/engine")
+        elif want is not None:
+            bad, accepted = compare_frames(want, got)
+            problems += [f"{name}: {p}" for p in bad]
+            intended += [f"{name}: {p}" for p in accepted]
+    if expected.get('summary', {}) != result.summary:
+        problems.append(f"summary: {expected.get('summary')} != {result.summary}")
+    return problems, intended, expected.get('summary', {})
+
+
+# --- History ---
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def append_history(path, rows):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    new_file = not os.path.exists(path)
+    with open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=HISTORY_COLS, extrasaction='ignore')
+        if new_file:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def previous_seconds(path, scenario_cols):
+    # Stage seconds of the latest earlier run of the same mode and scenario
+    if not os.path.exists(path):
+        return {}
+    history = pd.read_csv(path, dtype={'commit': str})
+    for col, value in scenario_cols.items():
+        history = history[history[col].astype(str) == str(value)]
+    if history.empty:
+        return {}
+    last = history[history['run'] == history['run'].max()]
+    return dict(zip(last['stage'], last['seconds']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs='+', default=[10_000, 100_000], help="Statement rows per scale")
+    parser.add_argument("--format", choices=FORMATS, default='xlsx', help="Input file format")
+    parser.add_argument("--modes", nargs='+', choices=MODES, default=MODES)
+    parser.add_argument("--merge-key", choices=['PO', 'ROID'], default='PO')
+    parser.add_argument("--rebate-pct", type=float, default=10.0)
+    parser.add_argument("--match-rate", type=float, default=Scenario.match_rate)
+    parser.add_argument("--query-rate", type=float, default=Scenario.query_rate)
+    parser.add_argument("--duplicate-rate", type=float, default=Scenario.duplicate_rate)
+    parser.add_argument("--non-ai-rate", type=float, default=Scenario.non_ai_rate)
+    parser.add_argument("--remit-rate", type=float, default=Scenario.remit_rate)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--check-max-rows", type=int, default=200_000,
+                        help="Largest scale the reference runs and is compared at (its Tab 2 lookup is quadratic)")
+    parser.add_argument("--data-dir", help="Keep generated inputs here and reuse them (default: a temp dir)")
+    parser.add_argument("--history", default=HISTORY, help="CSV the timings are appended to")
+    args = parser.parse_args(argv)
+    quiet()
+
+    if args.format == 'xlsx' and max(args.rows) > EXCEL_MAX_ROWS:
+        parser.error(f"xlsx holds at most {EXCEL_MAX_ROWS} rows; use --format csv or parquet for larger scales")
+
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench-pipeline-")
+    run_id = datetime.datetime.now().isoformat(timespec='seconds')
+    context = {'run': run_id, 'commit': git_commit(), 'host': platform.node(), 'python': platform.python_version(),
+               'pandas': pd.__version__}
+    failed = False
+
+    for rows in args.rows:
+        scenario = Scenario(rows=rows, match_rate=args.match_rate, query_rate=args.query_rate,
+                            duplicate_rate=args.duplicate_rate, non_ai_rate=args.non_ai_rate,
+                            remit_rate=args.remit_rate, seed=args.seed)
+        print(f"\n=== {rows} statement rows ({scenario.tag()}, {args.format}, key {args.merge_key}) ===", flush=True)
+        start = time.perf_counter()
+        paths = cached_inputs(scenario, data_dir, args.format)
+        print(f"inputs ready in {time.perf_counter() - start:.1f}s: {data_dir}", flush=True)
+
+        summaries = {}
+        if rows <= args.check_max_rows:
+            problems, intended, summaries['reference'] = check_equal(paths, args.merge_key, args.rebate_pct)
+            print("equality with the FC3 logic: " + ("OK" if not problems else "FAILED"))
+            for problem in problems:
+                print(f"  {problem}")
+            for difference in intended:
+                print(f"  intended: {difference}")
+            failed |= bool(problems)
+        else:
+            print(f"equality check skipped above {args.check_max_rows} rows")
+
+        for mode in args.modes:
+            if mode == 'reference' and rows > args.check_max_rows:
+                continue
+            result = measure(mode, paths, args.merge_key, args.rebate_pct)
+            if 'error' in result:
+                print(f"\n{mode}: {result['error']}")
+                failed = True
+                continue
+            if mode == 'chunked':
+                expected = summaries.get('reference', summaries.get('in-memory'))
+                if expected is not None and result['summary'] != expected:
+                    print(f"chunked summary differs: {result['summary']} != {expected}")
+                    failed = True
+            summaries[mode] = result['summary']
+
+            scenario_cols = {'mode': mode, 'format': args.format, 'merge_key': args.merge_key, **scenario.params()}
+            scenario_cols.pop('extra_cols')
+            table = stage_table(result)
+            before = previous_seconds(args.history, scenario_cols)
+            table['previous'] = table['stage'].map(before)
+            print(f"\n{mode}:")
+            print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}", na_rep=''), flush=True)
+            append_history(args.history, [{**context, **scenario_cols, **record}
+                                          for record in table.drop(columns='previous').to_dict('records')])
+
+    print(f"\nhistory: {args.history}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
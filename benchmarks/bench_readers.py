@@ -0,0 +1,112 @@
+"""Parse time and peak RSS of the reader backends on a synthetic estimates export.
+
+    python benchmarks/bench_readers.py --rows 500000
+
+Each case runs in a fresh process so peak RSS is not polluted by earlier cases.
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reconciliation.columns import non_ai_cols, required_cols  # noqa: E402
+from reconciliation.readers import engine_available, read_excel, read_table  # noqa: E402
+
+
+def estimates_frame(rows, extra_cols=20, seed=0):
+    # Shaped like an estimates export: the required columns plus columns FC3 never reads
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    df = pd.DataFrame({
+        'Appointment date': dates.date,
+        'Appointment month': dates.strftime('%B'),
+        'Appointment year': dates.year,
+        'Vendor Name': rng.choice([f"Vendor {i}" for i in range(300)], rows),
+        'PO': np.arange(1_000_000, 1_000_000 + rows),
+        'ROID': rng.integers(10_000_000, 99_999_999, rows),
+        'Invoice no': [f"INV-{i}" for i in range(rows)],
+        'VIN': [f"1HGCM82633A{i:06d}" for i in range(rows)],
+    })
+    for col in ['Sub Total', 'Tax Total', 'AI trans Fee', 'FMC Rebate', 'Payable Amount',
+                'Rebate AI', 'Amount to pay', 'Trans fee', 'Merch fee']:
+        df[col] = rng.uniform(0, 1500, rows).round(2)
+    df['Rebate%'] = '-10.00%'
+    df['Status in api'] = rng.choice(['completed', 'cancelled', 'pending'], rows)
+    df['AP status'] = rng.choice(['paid', 'unpaid'], rows)
+    for i in range(extra_cols):
+        df[f"extra_{i}"] = rng.uniform(0, 100, rows).round(2)
+    return df
+
+
+def write_inputs(df, out_dir):
+    paths = {'xlsx': os.path.join(out_dir, 'estimates.xlsx'), 'csv': os.path.join(out_dir, 'estimates.csv')}
+    df.to_excel(paths['xlsx'], index=False, engine='xlsxwriter')
+    df.to_csv(paths['csv'], index=False)
+    if engine_available('pyarrow'):
+        paths['parquet'] = os.path.join(out_dir, 'estimates.parquet')
+        df.to_parquet(paths['parquet'], index=False)
+    return paths
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(path, engine, columns, queue):
+    start = time.perf_counter()
+    if engine:
+        df = read_excel(path, columns=columns, engine=engine)
+    else:
+        df = read_table(path, columns=columns)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, peak_rss_mb(), df.shape))
+
+
+def measure(path, engine, columns):
+    ctx = mp.get_context('spawn')
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_case, args=(path, engine, columns, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--extra-cols", type=int, default=20, help="Columns FC3 never reads")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Writing {args.rows} synthetic estimate rows ...", flush=True)
+        paths = write_inputs(estimates_frame(args.rows, args.extra_cols), tmp)
+
+        cases = [('xlsx', 'openpyxl', None, 'pd.read_excel (baseline)')]
+        cases += [('xlsx', 'openpyxl', required_cols, 'openpyxl, required_cols')]
+        if engine_available('calamine'):
+            cases += [('xlsx', 'calamine', None, 'calamine'),
+                      ('xlsx', 'calamine', required_cols, 'calamine, required_cols'),
+                      ('xlsx', 'calamine', non_ai_cols, 'calamine, PO only')]
+        cases += [('csv', None, required_cols, 'csv, required_cols')]
+        if 'parquet' in paths:
+            cases += [('parquet', None, required_cols, 'parquet, required_cols'),
+                      ('parquet', None, non_ai_cols, 'parquet, PO only')]
+
+        print(f"{'case':<28}{'seconds':>10}{'peak RSS MB':>14}  shape")
+        for fmt, engine, columns, label in cases:
+            elapsed, rss, shape = measure(paths[fmt], engine, columns)
+            print(f"{label:<28}{elapsed:>10.2f}{rss:>14.1f}  {shape}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
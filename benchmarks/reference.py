@@ -0,0 +1,234 @@
+"""FC3.py Tabs 1-3 as they were before the engine was extracted, without the Streamlit calls.
+
+The logic is kept as it was (row-wise apply, per-row Non-AI lookup, str casts) so benchmarks can
+check the optimized paths against it. stage() only marks the steps for the profiler; it is a no-op
+when none is active.
+"""
+import io
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reconciliation.profiling import stage  # noqa: E402
+
+required_cols = [
+    'Appointment date', 'Appointment month', 'Appointment year', 'Vendor Name',
+    'PO', 'ROID', 'Invoice no', 'VIN', 'Sub Total', 'Tax Total', 'AI trans Fee', 'FMC Rebate', 'Payable Amount',
+    'Rebate AI', 'Rebate%', 'Amount to pay', 'Trans fee', 'Merch fee',
+    'Status in api', 'AP status'
+]
+
+required_cols_step2 = ['SubTotal (exc. Tax)', 'Total (inc. Tax)', 'Payable Amount (inc. Tax)']
+
+column_renames = {
+    'SubTotal (exc. Tax)': 'Sub Total',
+    'Tax': 'Tax Total',
+    'Payable Amount (inc. Tax)': 'Payable Amount',
+    'Rebate': 'Rebate AI',
+    'Rebate %': 'Rebate%',
+    'Amount to Pay': 'Amount to pay',
+    'company': 'Vendor Name',
+    'transaction_fee': 'Trans fee',
+    'merch_fee': 'Merch fee',
+    'Status_in_api': 'Status in api',
+    'ap_status': 'AP status',
+    'ai_order_id': 'ROID',
+    'id': 'PO',
+    'invoice_number': 'Invoice no',
+    'vin': 'VIN',
+    'AI Transaction Fee': 'AI trans Fee',
+    'FMC Rebate Amount': 'FMC Rebate'
+}
+
+required_remit_cols = [
+    'shop_order_id', 'paid_amount', 'paid_date',
+    'disputed_amount', 'disputed_date',
+    'dispute_reason', 'payment_details'
+]
+
+
+def read_raw(path):
+    # FC3 only took .xlsx; the other formats are read the plain pandas way
+    with stage(f"read {os.path.basename(path)}") as s:
+        if path.endswith('.csv'):
+            df = pd.read_csv(path)
+        elif path.endswith('.parquet'):
+            df = pd.read_parquet(path)
+        else:
+            df = pd.read_excel(path)
+        s.rows_out = len(df)
+    return df
+
+
+def to_xlsx(df, sheet_name):
+    with stage(f"export {sheet_name} (xlsx)", rows_in=len(df)):
+        output = io.BytesIO()
+        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+            df.to_excel(writer, index=False, sheet_name=sheet_name)
+        return output.getvalue()
+
+
+def reference_fc3(statement_df, estimates_df, merge_key='PO', rebate_df=None, rebate_percent=0.0,
+                  non_ai_df=None, remit_df=None, export=False):
+    """Returns the frames and summary FC3 showed; export=True also builds its download files."""
+    out = {}
+
+    # --- TAB 1 ---
+    with stage("merge_estimates", rows_in=len(statement_df) + len(estimates_df)):
+        estimates_df = estimates_df[[col for col in required_cols if col in estimates_df.columns]]
+        merged_df = pd.merge(statement_df, estimates_df, how='left', on=merge_key, indicator=True)
+        merged_df['Match Status'] = merged_df['_merge'].map({
+            'both': 'Matched with Estimates',
+            'left_only': 'Unmatched with Estimates (N/A)'
+        })
+        merged_df.drop(columns=['_merge'], inplace=True)
+
+        if 'Statement amount' in merged_df.columns and 'Amount to pay' in merged_df.columns:
+            merged_df['Disputed amount'] = merged_df['Statement amount'] - merged_df['Amount to pay']
+
+        unmatched_df = merged_df[merged_df['Match Status'] == 'Unmatched with Estimates (N/A)']
+
+        for col in ['Appointment date', 'Appointment month', 'Appointment year']:
+            if col in merged_df.columns:
+                merged_df[col] = merged_df[col].astype(str)
+    out['merged_df'] = merged_df
+    if export:
+        to_xlsx(merged_df, 'Merged')
+
+    rebate_enrichment_df = None
+    if rebate_df is not None:
+        with stage("calculate_rebates", rows_in=len(rebate_df)):
+            df = rebate_df.copy()
+            for col in required_cols_step2:
+                df[col] = df[col].astype(str).str.replace(r'[$,₹,CA]', '', regex=True)
+                df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)
+
+            rebate_rate = rebate_percent / 100.0
+            df['Tax'] = df['Total (inc. Tax)'] - df['SubTotal (exc. Tax)']
+            df['Rebate'] = df['SubTotal (exc. Tax)'] * (-rebate_rate)
+            df['Rebate %'] = df.apply(
+                lambda row: f"{((row['Rebate'] / row['SubTotal (exc. Tax)']) * 100):.2f}%"
+                if row['SubTotal (exc. Tax)'] != 0 else '0.00%', axis=1
+            )
+            df['Amount to Pay'] = df['Payable Amount (inc. Tax)'] + df['Rebate']
+
+            if 'appointment_datetime' in df.columns:
+                df['appointment_datetime'] = pd.to_datetime(df['appointment_datetime'], errors='coerce')
+                df['Appointment date'] = df['appointment_datetime'].dt.date
+                df['Appointment month'] = df['appointment_datetime'].dt.strftime('%B')
+                df['Appointment year'] = df['appointment_datetime'].dt.year
+
+            for old, new in column_renames.items():
+                if old in df.columns:
+                    df[new] = df[old]
+
+            final_cols = [col for col in required_cols if col in df.columns]
+            rebate_enrichment_df = df[final_cols].copy()
+
+            for col in ['Appointment date', 'Appointment month', 'Appointment year']:
+                if col in rebate_enrichment_df.columns:
+                    rebate_enrichment_df[col] = rebate_enrichment_df[col].astype(str)
+        out['rebate_enrichment_df'] = rebate_enrichment_df
+        if export:
+            to_xlsx(rebate_enrichment_df, 'Updated')
+
+    if not (unmatched_df.shape[0] > 0 and rebate_enrichment_df is not None):
+        return out
+
+    with stage("enrich_unmatched", rows_in=len(unmatched_df) + len(rebate_enrichment_df)):
+        drop_cols = [col for col in unmatched_df.columns if col in rebate_enrichment_df.columns and col != merge_key]
+        enrich_df = pd.merge(
+            unmatched_df.drop(columns=drop_cols),
+            rebate_enrichment_df,
+            on=merge_key,
+            how='left',
+            indicator=True
+        )
+        enrich_df['Match Status'] = enrich_df['_merge'].map({
+            'both': 'Matched with Query result',
+            'left_only': 'Still Unmatched'
+        })
+        enrich_df.drop(columns=['_merge'], inplace=True)
+
+        if 'Statement amount' in enrich_df.columns and 'Amount to pay' in enrich_df.columns:
+            enrich_df['Disputed amount'] = enrich_df['Statement amount'] - enrich_df['Amount to pay']
+
+        final_output = pd.concat([merged_df[merged_df['Match Status'] == 'Matched with Estimates'], enrich_df])
+
+        if {'Disputed amount', 'Rebate AI'}.issubset(final_output.columns):
+            final_output['Dispute analysis'] = final_output['Rebate AI'] + final_output['Disputed amount']
+
+        if 'Dispute analysis' in final_output.columns and 'Match Status' in final_output.columns:
+            cols = final_output.columns.tolist()
+            cols.remove('Match Status')
+            idx = cols.index('Dispute analysis') + 1
+            cols.insert(idx, 'Match Status')
+            final_output = final_output[cols]
+
+    with stage("summarize", rows_in=len(final_output)):
+        match_status_summary = final_output['Match Status'].value_counts()
+        duplicate_statements = merged_df[merged_df['Match Status'] == 'Matched with Estimates'].duplicated(subset=merge_key, keep=False).sum()
+        duplicate_estimates = estimates_df[estimates_df[merge_key].isin(final_output[merge_key])].duplicated(subset=merge_key, keep=False).sum()
+    out['summary'] = {
+        'Matched with Estimates': int(match_status_summary.get('Matched with Estimates', 0)),
+        'Matched with Query result': int(match_status_summary.get('Matched with Query result', 0)),
+        'Still Unmatched': int(match_status_summary.get('Still Unmatched', 0)),
+        'Duplicates in Statements': int(duplicate_statements),
+        'Duplicates in Estimates': int(duplicate_estimates),
+    }
+
+    # Convert PO column to int (if possible)
+    if 'PO' in final_output.columns:
+        try:
+            final_output['PO'] = pd.to_numeric(final_output['PO'], errors='raise').astype(int)
+        except Exception:
+            pass
+
+    for col in ['Appointment date', 'Appointment month', 'Appointment year']:
+        if col in final_output.columns:
+            final_output[col] = final_output[col].astype(str)
+    out['final_output'] = final_output
+    if export:
+        to_xlsx(final_output, 'Final Processed')
+
+    # FC3 kept final_output in session state; Tab 2 changed it in place and Tab 3 read it back
+    final_df = final_output.copy()
+
+    # --- TAB 2 ---
+    if non_ai_df is not None:
+        with stage("check_non_ai", rows_in=len(final_df) + len(non_ai_df)):
+            df_non_ai = non_ai_df.copy()
+            df_non_ai['PO'] = df_non_ai['PO'].astype(str).str.strip()
+            final_df['PO'] = final_df['PO'].astype(str).str.strip()
+
+            final_df['Non AI check'] = final_df['PO'].apply(
+                lambda po: "Matched with Non-AI" if po in df_non_ai['PO'].values else " "
+            )
+
+            try:
+                final_df['PO'] = pd.to_numeric(final_df['PO'], errors='raise').astype(int)
+            except Exception:
+                pass
+        out['non_ai_df'] = final_df.copy()
+        if export:
+            to_xlsx(final_df, 'PO_Match_Result')
+
+    # --- TAB 3 ---
+    if remit_df is not None:
+        with stage("merge_remittance", rows_in=len(final_df) + len(remit_df)):
+            remit_df_subset = remit_df[required_remit_cols].copy()
+            remit_df_subset.rename(columns={'shop_order_id': 'PO'}, inplace=True)
+
+            final_df['PO'] = pd.to_numeric(final_df['PO'], errors='coerce').astype('Int64')
+            remit_df_subset['PO'] = pd.to_numeric(remit_df_subset['PO'], errors='coerce').astype('Int64')
+
+            merged_remit_df = pd.merge(final_df, remit_df_subset, on='PO', how='left')
+        out['merged_remit_df'] = merged_remit_df
+        if export:
+            with stage("export Remittance Merge (csv)", rows_in=len(merged_remit_df)):
+                merged_remit_df.to_csv(index=False).encode('utf-8')
+
+    return out
@@ -0,0 +1,183 @@
+"""Synthetic statement, estimates, rebate query, Non-AI and remittance inputs for benchmarks.
+
+Columns follow required_cols, the raw query-export names Step 2 renames and required_remit_cols.
+Match and duplicate rates are set per scenario, and generation is seeded, so the same
+scenario always produces the same files.
+"""
+import os
+import sys
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reconciliation.columns import required_cols, required_cols_step2, required_remit_cols  # noqa: E402
+
+EXCEL_MAX_ROWS = 1_048_575  # data rows below the header row
+
+FORMATS = ['xlsx', 'csv', 'parquet']
+
+MONEY_COLS = ['Sub Total', 'Tax Total', 'AI trans Fee', 'FMC Rebate', 'Payable Amount', 'Rebate AI', 'Amount to pay',
+              'Trans fee', 'Merch fee']
+
+
+@dataclass(frozen=True)
+class Scenario:
+    rows: int = 10_000
+    match_rate: float = 0.7       # distinct statement keys found in Estimates
+    query_rate: float = 0.6       # of the keys Estimates misses, found in the rebate query export
+    duplicate_rate: float = 0.02  # rows repeating an earlier key, in the statement, Estimates and remittance
+    non_ai_rate: float = 0.05     # statement keys listed in the Non-AI reference
+    remit_rate: float = 0.8       # statement keys with a remittance line
+    extra_cols: int = 5           # statement columns FC3 only passes through
+    seed: int = 0
+
+    def tag(self):
+        return (f"{self.rows}r_m{self.match_rate:g}_q{self.query_rate:g}_d{self.duplicate_rate:g}"
+                f"_n{self.non_ai_rate:g}_r{self.remit_rate:g}_x{self.extra_cols}_s{self.seed}")
+
+    def params(self):
+        return asdict(self)
+
+
+def with_duplicates(keys, rate, rng):
+    # Append rate * len(keys) repeats of existing keys and shuffle them in
+    extra = rng.choice(keys, int(round(len(keys) * rate))) if len(keys) else keys[:0]
+    return rng.permutation(np.concatenate([keys, extra]))
+
+
+def roid(pos):
+    # One ROID per PO, so either merge key gives the same matches
+    return 10_000_000 + pos * 7
+
+
+def money(rng, n, low=0, high=1500):
+    return rng.uniform(low, high, n).round(2)
+
+
+def appointments(rng, n):
+    return pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, n), unit='min')
+
+
+def estimates_frame(pos, roids, rng):
+    n = len(pos)
+    dates = appointments(rng, n)
+    df = pd.DataFrame({
+        'Appointment date': dates.date,
+        'Appointment month': dates.strftime('%B'),
+        'Appointment year': dates.year,
+        'Vendor Name': rng.choice([f"Vendor {i}" for i in range(300)], n),
+        'PO': pos,
+        'ROID': roids,
+        'Invoice no': [f"INV-{po}" for po in pos],
+        'VIN': [f"1HGCM82633A{po % 1_000_000:06d}" for po in pos],
+    })
+    for col in MONEY_COLS:
+        df[col] = money(rng, n)
+    df['Rebate%'] = '-10.00%'
+    df['Status in api'] = rng.choice(['completed', 'cancelled', 'pending'], n)
+    df['AP status'] = rng.choice(['paid', 'unpaid'], n)
+    return df[required_cols]
+
+
+def query_frame(pos, roids, rng):
+    # The raw export Step 2 reads: currency strings with symbols and separators, source column names
+    n = len(pos)
+    subtotal = money(rng, n, -200, 2000)
+    subtotal[rng.random(n) < 0.02] = 0
+    tax = (subtotal * 0.08).round(2)
+    df = pd.DataFrame({
+        'id': pos,
+        'ai_order_id': roids,
+        'company': rng.choice([f"Vendor {i}" for i in range(300)], n),
+        'invoice_number': [f"INV-{po}" for po in pos],
+        'vin': [f"1HGCM82633A{po % 1_000_000:06d}" for po in pos],
+        'appointment_datetime': appointments(rng, n).strftime('%Y-%m-%d %H:%M:%S'),
+        required_cols_step2[0]: [f"${v:,.2f}" for v in subtotal],
+        required_cols_step2[1]: [f"${v:,.2f}" for v in subtotal + tax],
+        required_cols_step2[2]: (subtotal + tax).round(2),
+        'transaction_fee': money(rng, n, 0, 20),
+        'merch_fee': money(rng, n, 0, 20),
+        'Status_in_api': rng.choice(['completed', 'cancelled', 'pending'], n),
+        'ap_status': rng.choice(['paid', 'unpaid'], n),
+    })
+    df.loc[rng.random(n) < 0.01, required_cols_step2[0]] = 'n/a'
+    return df
+
+
+def generate(scenario):
+    """Frames keyed statement/estimates/rebate/non_ai/remittance for one scenario."""
+    rng = np.random.default_rng(scenario.seed)
+    distinct = max(int(round(scenario.rows / (1 + scenario.duplicate_rate))), 1)
+    keys = 1_000_000 + rng.permutation(distinct * 2)[:distinct]
+
+    statement_pos = with_duplicates(keys, scenario.duplicate_rate, rng)[:scenario.rows]
+    statement = pd.DataFrame({
+        'PO': statement_pos,
+        'ROID': roid(statement_pos),
+        'Statement date': appointments(rng, len(statement_pos)).strftime('%Y-%m-%d'),
+        'Statement amount': money(rng, len(statement_pos)),
+    })
+    for i in range(scenario.extra_cols):
+        statement[f"Note {i}"] = rng.choice(['', 'reviewed', 'recheck', 'escalated'], len(statement_pos))
+
+    shuffled = rng.permutation(keys)
+    matched = shuffled[:int(round(distinct * scenario.match_rate))]
+    unmatched = shuffled[len(matched):]
+    # Estimates also cover jobs from other statements, with keys the statement never uses
+    others = 1_000_000 + distinct * 2 + np.arange(len(matched) // 10)
+    estimate_pos = with_duplicates(np.concatenate([matched, others]), scenario.duplicate_rate, rng)
+    estimates = estimates_frame(estimate_pos, roid(estimate_pos), rng)
+
+    queried = rng.permutation(unmatched)[:int(round(len(unmatched) * scenario.query_rate))]
+    rebate = query_frame(queried, roid(queried), rng)
+
+    non_ai = pd.DataFrame({'PO': rng.choice(keys, int(round(distinct * scenario.non_ai_rate)), replace=False)})
+
+    remit_pos = with_duplicates(rng.choice(keys, int(round(distinct * scenario.remit_rate)), replace=False),
+                                scenario.duplicate_rate, rng)
+    n = len(remit_pos)
+    disputed = rng.random(n) < 0.1
+    remittance = pd.DataFrame({
+        'shop_order_id': remit_pos,
+        'paid_amount': money(rng, n),
+        'paid_date': appointments(rng, n).strftime('%Y-%m-%d'),
+        'disputed_amount': np.where(disputed, money(rng, n, 0, 300), 0.0),
+        'disputed_date': np.where(disputed, appointments(rng, n).strftime('%Y-%m-%d'), None),
+        'dispute_reason': np.where(disputed, rng.choice(['short paid', 'duplicate', 'no estimate'], n), None),
+        'payment_details': [f"ACH {i:08d}" for i in range(n)],
+    })[required_remit_cols]
+
+    return {'statement': statement, 'estimates': estimates, 'rebate': rebate, 'non_ai': non_ai,
+            'remittance': remittance}
+
+
+def write_inputs(frames, out_dir, fmt='xlsx'):
+    if fmt == 'xlsx':
+        too_big = [name for name, df in frames.items() if len(df) > EXCEL_MAX_ROWS]
+        if too_big:
+            raise ValueError(f"{', '.join(too_big)} exceed Excel's {EXCEL_MAX_ROWS} rows; use csv or parquet")
+    os.makedirs(out_dir, exist_ok=True)
+    paths = {}
+    for name, df in frames.items():
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        if fmt == 'xlsx':
+            df.to_excel(path, index=False, engine='xlsxwriter')
+        elif fmt == 'csv':
+            df.to_csv(path, index=False)
+        else:
+            df.to_parquet(path, index=False)
+        paths[name] = path
+    return paths
+
+
+def cached_inputs(scenario, data_dir, fmt='xlsx'):
+    # Generated files are reused across runs of the same scenario; generation dominates at millions of rows
+    out_dir = os.path.join(data_dir, scenario.tag())
+    paths = {name: os.path.join(out_dir, f"{name}.{fmt}")
+             for name in ['statement', 'estimates', 'rebate', 'non_ai', 'remittance']}
+    if all(os.path.exists(path) for path in paths.values()):
+        return paths
+    return write_inputs(generate(scenario), out_dir, fmt)
@@ -0,0 +1,4 @@
+from .engine import (
+    ReconciliationResult, calculate_rebates, check_non_ai, enrich_unmatched, merge_estimates,
+    merge_remittance, reconcile, summarize
+)
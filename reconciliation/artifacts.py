@@ -0,0 +1,138 @@
+"""Session results held once per server instead of once per session.
+
+st.session_state only keeps artifact keys; the frames live in one ArtifactStore shared by every session,
+so analysts working on the same files share one copy. Artifacts are never modified in place: a later tab
+derives a new frame (copy-on-write shares every column it doesn't touch) and stores it under its own key.
+Past max_bytes the least recently used artifacts, typically those of idle sessions, are spilled to disk
+(as Arrow IPC/feather files when pyarrow is installed, as pickles otherwise) and reloaded on demand: the
+next access reads the whole frame back into memory.
+"""
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+from .cache import size_of
+from .readers import engine_available
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+KEY_LOCKS = 64
+
+
+class ArtifactStore:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or tempfile.mkdtemp(prefix="reconcile-artifacts-")
+        self.total_bytes = 0
+        self.spills = 0
+        self.loads = 0
+        self._memory = OrderedDict()  # key -> (frame, bytes), least recently used first
+        self._spilled = {}            # key -> path
+        self._lock = threading.Lock()
+        # Held from reading a spilled artifact back until it is in memory again, so that no one removes its file
+        # meanwhile; keys share KEY_LOCKS locks by hash
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCKS)]
+        os.makedirs(self.spill_dir, exist_ok=True)
+
+    def put(self, key, df):
+        with self._key_lock(key):
+            self._put(key, df)
+        return key
+
+    def get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+            if key not in self._spilled:
+                return None
+        with self._key_lock(key):
+            # Another session may have read it back while this one waited
+            with self._lock:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    return self._memory[key][0]
+                path = self._spilled.get(key)
+            if path is None:
+                return None
+            df = load(path)
+            self.loads += 1
+            return self._put(key, df)
+
+    def _key_lock(self, key):
+        return self._key_locks[hash(key) % KEY_LOCKS]
+
+    def _put(self, key, df):
+        # Returns the artifact stored under key, which is df unless key was already in memory
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key][0]
+            path = self._spilled.pop(key, None)
+            if path:
+                os.remove(path)
+            size = size_of(df)
+            self._memory[key] = (df, size)
+            self.total_bytes += size
+            self._spill_over_budget()
+        return df
+
+    def __contains__(self, key):
+        return key in self._memory or key in self._spilled
+
+    def in_memory(self):
+        return len(self._memory)
+
+    def on_disk(self):
+        return len(self._spilled)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._spilled.clear()
+            self.total_bytes = 0
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
+            os.makedirs(self.spill_dir, exist_ok=True)
+
+    def _spill_over_budget(self):
+        # Oldest first; the artifact just stored stays in memory even when it alone is over budget
+        while self.total_bytes > self.max_bytes and len(self._memory) > 1:
+            key, (df, size) = self._memory.popitem(last=False)
+            self._spilled[key] = spill(df, os.path.join(self.spill_dir, key))
+            self.total_bytes -= size
+            self.spills += 1
+            logger.info("Spilled artifact %s (%.1f MB) to disk", key, size / 1024 / 1024)
+
+
+def spill(df, path):
+    # Uncompressed feather is the quickest to write and read back; mixed-type object columns fall back to pickle
+    if engine_available('pyarrow'):
+        import pyarrow as pa
+        import pyarrow.feather as feather
+
+        try:
+            feather.write_feather(df, f"{path}.arrow", compression='uncompressed')
+            return f"{path}.arrow"
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # A write that failed partway leaves a partial file behind
+            if os.path.exists(f"{path}.arrow"):
+                os.remove(f"{path}.arrow")
+    with open(f"{path}.pkl", 'wb') as f:
+        pickle.dump(df, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return f"{path}.pkl"
+
+
+def load(path):
+    if path.endswith('.arrow'):
+        import pyarrow.feather as feather
+
+        return feather.read_feather(path)
+    with open(path, 'rb') as f:
+        return pickle.load(f)
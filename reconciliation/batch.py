@@ -0,0 +1,167 @@
+"""Reconcile many statements against one set of references using a process pool.
+
+The estimates, the Step 2 rebate result, the Non-AI index and the remittance subset
+are built once in the parent. Workers receive them through the pool initializer: with
+the default fork start method on Linux they are inherited copy-on-write and never
+pickled; elsewhere they are pickled once per worker rather than once per statement.
+"""
+import concurrent.futures
+import logging
+import multiprocessing as mp
+import os
+import time
+from dataclasses import dataclass
+
+import pandas as pd
+
+from .columns import (
+    FUZZY_MATCHED, MATCHED_ESTIMATES, MATCHED_QUERY, STILL_UNMATCHED, rebate_input_cols, required_cols,
+    required_remit_cols
+)
+from .engine import calculate_rebates, reconcile, reference_indexes, stringify_dates
+from .export import output_specs, write_export
+from .fuzzy import FuzzyIndex
+from .keyindex import index_file
+from .readers import read_table
+from .rollup import RollupCube, file_token, run_name, run_rows
+
+logger = logging.getLogger(__name__)
+
+STATEMENT_EXTENSIONS = ('.xlsx', '.xls', '.csv', '.parquet', '.pq')
+MANIFEST_EXTENSIONS = ('.txt', '.lst')
+
+SUMMARY_COLS = [
+    MATCHED_ESTIMATES, MATCHED_QUERY, STILL_UNMATCHED, 'Duplicates in Statements', 'Duplicates in Estimates'
+]
+
+
+@dataclass
+class References:
+    estimates_df: pd.DataFrame
+    rebate_enrichment_df: pd.DataFrame = None
+    non_ai_ref: object = None
+    remit_df: pd.DataFrame = None
+    fuzzy_index: object = None
+    found_in_refs: list = None
+
+
+def load_references(estimates, rebate=None, rebate_percent=0.0, non_ai=None, remittance=None, fuzzy=False,
+                    found_in=False, index_cache=None):
+    # Step 2 only depends on the query file and rebate %, so it runs once for the whole batch
+    rebate_enrichment_df = None
+    if rebate:
+        rebate_enrichment_df = stringify_dates(
+            calculate_rebates(read_table(rebate, columns=rebate_input_cols), rebate_percent)
+        )
+    estimates_df = read_table(estimates, columns=required_cols)
+    remit_df = read_table(remittance, columns=required_remit_cols) if remittance else None
+    return References(
+        estimates_df=estimates_df,
+        rebate_enrichment_df=rebate_enrichment_df,
+        # Loaded from index_cache rather than re-read while the Non-AI file is unchanged
+        non_ai_ref=index_file(non_ai, 'PO', 'Non-AI', index_cache) if non_ai else None,
+        remit_df=remit_df,
+        fuzzy_index=FuzzyIndex.from_references(estimates_df, rebate_enrichment_df) if fuzzy else None,
+        found_in_refs=reference_indexes(estimates_df, remit_df) if found_in else None,
+    )
+
+
+def list_statements(source):
+    """A directory of statement files, or a manifest with one statement path per line."""
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name) for name in os.listdir(source)
+            if name.lower().endswith(STATEMENT_EXTENSIONS) and not name.startswith(('~$', '.'))
+        )
+    base = os.path.dirname(os.path.abspath(source))
+    with open(source, encoding='utf-8') as f:
+        paths = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    return [path if os.path.isabs(path) else os.path.join(base, path) for path in paths]
+
+
+def is_batch_source(path):
+    return os.path.isdir(path) or path.lower().endswith(MANIFEST_EXTENSIONS)
+
+
+_references = None
+
+
+def _init_worker(references):
+    global _references
+    _references = references
+
+
+def reconcile_one(statement_path, out_dir, merge_key='PO', fmt=None, dedupe=None, amount_col=None,
+                  remittance_detail=False, remittance_as_of=None, rollup=None, found_in=False):
+    # rollup is the path of a cube this statement's totals go to, under its file name and content token
+    start = time.perf_counter()
+    row = {'statement': statement_path, 'error': '', 'outputs': []}
+    try:
+        result = reconcile(
+            read_table(statement_path), _references.estimates_df, merge_key=merge_key,
+            remit_df=_references.remit_df,
+            rebate_enrichment_df=_references.rebate_enrichment_df,
+            non_ai_ref=_references.non_ai_ref,
+            dedupe=dedupe,
+            fuzzy_index=_references.fuzzy_index,
+            amount_col=amount_col,
+            remittance_detail=remittance_detail,
+            remittance_as_of=remittance_as_of,
+            found_in=found_in,
+            found_in_refs=_references.found_in_refs,
+        )
+        for attr, (path, sheet_name, out_fmt) in output_specs(statement_path, out_dir, fmt).items():
+            df = getattr(result, attr)
+            # Step 2 is shared by the whole batch and written once by run_batch
+            if df is not None and attr != 'rebate_enrichment_df':
+                write_export(df, path, out_fmt, sheet_name)
+                row['outputs'].append(path)
+        if rollup and result.final_output is not None:
+            name = run_name(statement_path, content=file_token(statement_path))
+            RollupCube(rollup).update(name, run_rows(
+                result.final_output, result.merged_remit_df, _references.remit_df, remittance_detail, remittance_as_of
+            ))
+        row.update(result.summary)
+    except Exception as e:
+        logger.exception("Failed to reconcile %s", statement_path)
+        row['error'] = str(e)
+    row['seconds'] = round(time.perf_counter() - start, 3)
+    return row
+
+
+def run_batch(statements, estimates, out_dir, merge_key='PO', rebate=None, rebate_percent=0.0, non_ai=None,
+              remittance=None, jobs=None, fmt=None, dedupe=None, fuzzy=False, amount_col=None,
+              remittance_detail=False, remittance_as_of=None, rollup=None, found_in=False, index_cache=None):
+    """Reconcile every statement and write its outputs plus batch_summary.csv; returns the summary frame."""
+    os.makedirs(out_dir, exist_ok=True)
+    references = load_references(estimates, rebate, rebate_percent, non_ai, remittance, fuzzy, found_in, index_cache)
+    jobs = jobs or os.cpu_count() or 1
+    options = (merge_key, fmt, dedupe, amount_col, remittance_detail, remittance_as_of, rollup, found_in)
+
+    if references.rebate_enrichment_df is not None:
+        path, sheet_name, out_fmt = output_specs("batch", out_dir, fmt)['rebate_enrichment_df']
+        write_export(references.rebate_enrichment_df, path, out_fmt, sheet_name)
+
+    if jobs == 1:
+        _init_worker(references)
+        rows = [reconcile_one(path, out_dir, *options) for path in statements]
+    else:
+        context = mp.get_context('fork') if 'fork' in mp.get_all_start_methods() else None
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(jobs, len(statements)) or 1, mp_context=context,
+            initializer=_init_worker, initargs=(references,)
+        ) as pool:
+            futures = [pool.submit(reconcile_one, path, out_dir, *options) for path in statements]
+            rows = []
+            for future in concurrent.futures.as_completed(futures):
+                rows.append(future.result())
+                logger.info("%d/%d statements done", len(rows), len(statements))
+
+    summary_cols = SUMMARY_COLS + ([FUZZY_MATCHED] if fuzzy else [])
+    summary = pd.DataFrame(rows).reindex(columns=['statement', *summary_cols, 'seconds', 'error', 'outputs'])
+    summary = summary.sort_values('statement', ignore_index=True)
+    summary['outputs'] = summary['outputs'].map(lambda paths: '; '.join(paths) if isinstance(paths, list) else '')
+    totals = summary[summary_cols].sum(min_count=1).to_dict()
+    summary = pd.concat([summary, pd.DataFrame([{'statement': 'TOTAL', **totals}])], ignore_index=True)
+    summary.to_csv(os.path.join(out_dir, "batch_summary.csv"), index=False)
+    return summary
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def token(value):
+    # Content hash of an upload (bytes), a DataFrame or a plain parameter
+    h = hashlib.sha1()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        h.update(b"bytes:")
+        h.update(value)
+    elif isinstance(value, pd.DataFrame):
+        h.update(b"frame:")
+        h.update(repr(list(value.columns)).encode())
+        h.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    else:
+        h.update(b"param:")
+        h.update(repr(value).encode())
+    return h.hexdigest()
+
+
+def upload_token(uploaded_file):
+    return token(uploaded_file.getvalue())
+
+
+def size_of(value, seen=None):
+    """Bytes held by a cached value, counting the frames and arrays inside containers, dataclasses and objects."""
+    # seen keeps an array shared by two attributes from being counted twice
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=True))
+    if isinstance(value, pd.Index):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        # nbytes only counts the pointers of an object array; pandas measures the objects too
+        if value.dtype == object:
+            return int(pd.Series(value.ravel(), copy=False).memory_usage(index=False, deep=True))
+        return int(value.nbytes)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, (tuple, list, set, frozenset)):
+        return sum(size_of(v, seen) for v in value)
+    if isinstance(value, dict):
+        return sum(size_of(k, seen) + size_of(v, seen) for k, v in value.items())
+    if type(value).__sizeof__ is object.__sizeof__ and hasattr(value, '__dict__'):
+        # Dataclasses and plain objects (indexes, analyses): their attributes hold the data
+        return sys.getsizeof(value) + size_of(vars(value), seen)
+    return sys.getsizeof(value)
+
+
+class StageCache:
+    """LRU cache of stage results keyed by the stage name and the tokens of its inputs.
+
+    A stage's key doubles as the token downstream stages depend on, so changing one
+    input only misses the stages that (transitively) consume it.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, stage, deps):
+        return hashlib.sha1(repr((stage, tuple(deps))).encode()).hexdigest()
+
+    def stage(self, stage, deps, fn):
+        # Returns (key, value); fn() is only called on a miss
+        key = self.key(stage, deps)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return key, self._entries[key][0]
+
+        value = fn()
+        size = size_of(value)
+        with self._lock:
+            self.misses += 1
+            if size > self.max_bytes:
+                logger.info("Not caching %s: %d bytes exceeds the cache limit", stage, size)
+                return key, value
+            if key in self._entries:
+                self.total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted
+        return key, value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
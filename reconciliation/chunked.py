@@ -0,0 +1,239 @@
+"""Out-of-core reconciliation: hash-partition every input on its key, then reconcile one partition at a time.
+
+Rows with the same key always land in the same partition, so the left merges, the
+enrichment and the duplicate counts computed per partition add up to the in-memory
+result. Peak memory is roughly one partition of each input plus one read chunk.
+Output rows come out grouped by partition rather than in statement order.
+"""
+import logging
+import math
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .columns import UNMATCHED_ESTIMATES, rebate_input_cols, required_cols, required_remit_cols
+from .engine import (
+    calculate_rebates, check_non_ai, enrich_unmatched, merge_estimates, merge_remittance, select_estimate_columns,
+    stringify_dates, summarize, try_po_to_int
+)
+from .duplicates import analyze_duplicates, dedupe_estimates
+from .export import ExportStream, output_specs
+from .keyindex import index_file, normalize_keys
+from .profiling import stage, timed
+from .readers import iter_table, source_format
+from .rollup import combine_cells, rollup_cells, run_rows
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARTITIONS = 16
+CHUNK_ROWS = 100_000
+
+# Rough in-memory size of a frame relative to its file on disk
+EXPANSION = {'excel': 8, 'csv': 3, 'parquet': 5}
+# Merged/enriched copies alive while a partition is processed
+WORKING_COPIES = 4
+
+
+def partitions_for(paths, max_memory_mb):
+    """Enough partitions that one partition of every input fits in max_memory_mb."""
+    paths = [path for path in paths if path]
+    in_memory = sum(os.path.getsize(path) * EXPANSION[source_format(path)] for path in paths)
+    return max(1, math.ceil(in_memory * WORKING_COPIES / (max_memory_mb * 1024 * 1024)))
+
+
+def key_partitions(keys, n):
+    # Hash the normalized key so 1001, 1001.0 and '1001' agree, and all missing keys share a partition
+    normalized = normalize_keys(keys).fillna('').to_numpy(dtype=object)
+    return pd.util.hash_array(normalized, categorize=False) % n
+
+
+def numeric_key_partitions(keys, n):
+    # merge_remittance joins on pd.to_numeric(PO, errors='coerce'), so partition on that value
+    return key_partitions(pd.to_numeric(keys, errors='coerce').astype('Int64'), n)
+
+
+class Spill:
+    """Partitioned on-disk copy of one input, written chunk by chunk as pickles."""
+
+    def __init__(self, work_dir, name, key, n, partition_fn=key_partitions):
+        self.dir = os.path.join(work_dir, name)
+        self.key = key
+        self.n = n
+        self.partition_fn = partition_fn
+        self.empty = None
+        self.rows = 0
+        self._seq = 0
+        os.makedirs(self.dir, exist_ok=True)
+
+    @property
+    def columns(self):
+        return [] if self.empty is None else list(self.empty.columns)
+
+    def write(self, df):
+        if self.empty is None:
+            self.empty = df.iloc[0:0]
+        if df.empty:
+            return
+        if self.key not in df.columns:
+            raise ValueError(f"Selected key '{self.key}' not found in {os.path.basename(self.dir)} file.")
+        self.rows += len(df)
+        ids = self.partition_fn(df[self.key], self.n)
+        for part in np.unique(ids):
+            df[ids == part].to_pickle(os.path.join(self.dir, f"{part}-{self._seq}.pkl"))
+        self._seq += 1
+
+    def read(self, part):
+        files = sorted(
+            (f for f in os.listdir(self.dir) if f.split('-')[0] == str(part)),
+            key=lambda f: int(f.split('-')[1].split('.')[0])
+        )
+        if not files:
+            return self.empty.copy() if self.empty is not None else pd.DataFrame()
+        return pd.concat([pd.read_pickle(os.path.join(self.dir, f)) for f in files], ignore_index=True)
+
+
+def reconcile_chunked(statement, estimates, out_dir, merge_key='PO', rebate=None, rebate_percent=0.0,
+                      non_ai=None, remittance=None, partitions=DEFAULT_PARTITIONS, chunk_rows=CHUNK_ROWS,
+                      work_dir=None, fmt=None, dedupe=None, remittance_detail=False, remittance_as_of=None,
+                      rollup=False, found_in=False, index_cache=None):
+    """Same stages as engine.reconcile, over file paths, streaming every output to out_dir.
+
+    The Non-AI index (and with found_in the Estimates and remittance ones) are saved to index_cache when set.
+
+    Returns {"summary": ..., "outputs": [paths]}, plus the run's rollup cube cells under "rollup" when asked.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    specs = output_specs(statement, out_dir, fmt)
+    tmp = tempfile.mkdtemp(prefix="reconcile-", dir=work_dir)
+    streams = {}
+    # Rollup cells per partition; a row is in one partition only, so adding them up gives the whole run's
+    cells = []
+
+    def stream(attr):
+        if attr not in streams:
+            path, sheet_name, out_fmt = specs[attr]
+            streams[attr] = ExportStream(path, out_fmt, sheet_name)
+        return streams[attr]
+
+    try:
+        statement_spill = Spill(tmp, 'statement', merge_key, partitions)
+        with stage(f"spill {os.path.basename(statement)}"):
+            for chunk in iter_table(statement, chunk_rows=chunk_rows):
+                statement_spill.write(chunk)
+        estimates_spill = Spill(tmp, 'estimates', merge_key, partitions)
+        with stage(f"spill {os.path.basename(estimates)}"):
+            for chunk in iter_table(estimates, columns=required_cols, chunk_rows=chunk_rows):
+                estimates_spill.write(chunk)
+        for spill in (statement_spill, estimates_spill):
+            if merge_key not in spill.columns:
+                raise ValueError(f"Selected key '{merge_key}' not found in both files.")
+
+        rebate_spill = None
+        if rebate:
+            # Step 2 is row-independent, so it runs on the read chunks and its output keeps file order
+            rebate_spill = Spill(tmp, 'rebate', merge_key, partitions)
+            for chunk in iter_table(rebate, columns=rebate_input_cols, chunk_rows=chunk_rows):
+                enriched = stringify_dates(timed("calculate_rebates", calculate_rebates, chunk, rebate_percent))
+                stream('rebate_enrichment_df').write(enriched)
+                rebate_spill.write(enriched)
+
+        tab23 = bool(non_ai or remittance)
+        final_spill = Spill(tmp, 'final', 'PO', partitions, numeric_key_partitions) if tab23 else None
+        summary, unmatched = {}, 0
+        for part in range(partitions):
+            estimates_df = estimates_spill.read(part)
+            statement_df = statement_spill.read(part)
+            # A key never spans partitions, so per-partition counts and dedupe are exact
+            duplicates = timed("analyze_duplicates", analyze_duplicates, statement_df, estimates_df, merge_key)
+            report = duplicates.report()
+            if not report.empty:
+                stream('duplicate_report').write(report)
+            if dedupe:
+                estimates_df = timed("dedupe_estimates", dedupe_estimates, estimates_df, merge_key, dedupe)
+                duplicates = duplicates.deduplicated()
+            merged_df = stringify_dates(timed("merge_estimates", merge_estimates, statement_df, estimates_df, merge_key))
+            stream('merged_df').write(merged_df)
+            unmatched += int((merged_df['Match Status'] == UNMATCHED_ESTIMATES).sum())
+
+            enrichment_df = rebate_spill.read(part) if rebate_spill else merged_df.iloc[0:0][[merge_key]]
+            final_output = timed("enrich_unmatched", enrich_unmatched, merged_df, enrichment_df, merge_key)
+            estimates_df = select_estimate_columns(estimates_df)
+            counts = timed("summarize", summarize, final_output, merged_df, estimates_df, merge_key, duplicates)
+            for name, count in counts.items():
+                summary[name] = summary.get(name, 0) + count
+
+            final_output = stringify_dates(try_po_to_int(final_output, "Tab 1"))
+            if tab23:
+                final_spill.write(final_output)
+            elif rollup:
+                cells.append(rollup_cells(final_output))
+            stream('final_output').write(final_output)
+
+        if unmatched and rebate_spill is None:
+            # Matches engine.reconcile: without a rebate file Step 3 and Tabs 2-3 are skipped
+            logger.warning("%d rows unmatched with estimates and no rebate file given; skipping Step 3", unmatched)
+            streams.pop('final_output').close()
+            os.remove(specs['final_output'][0])
+            return {"summary": {}, "outputs": close_streams(streams, specs)}
+
+        if tab23:
+            index = references = None
+            if non_ai:
+                # Only the distinct POs are kept, so the whole reference fits in one index
+                index = index_file(non_ai, 'PO', 'Non-AI', index_cache)
+                if found_in:
+                    references = [index_file(estimates, 'PO', 'Estimates', index_cache)]
+                    if remittance:
+                        references.append(index_file(remittance, 'shop_order_id', 'Remittance', index_cache))
+            remit_spill = None
+            if remittance:
+                remit_spill = Spill(tmp, 'remittance', 'shop_order_id', partitions, numeric_key_partitions)
+                with stage(f"spill {os.path.basename(remittance)}"):
+                    for chunk in iter_table(remittance, columns=required_remit_cols, chunk_rows=chunk_rows):
+                        missing_cols = [col for col in required_remit_cols if col not in chunk.columns]
+                        if missing_cols:
+                            raise ValueError(f"Missing columns in Remittance File: {missing_cols}")
+                        remit_spill.write(chunk)
+
+            for part in range(partitions):
+                base_df = final_spill.read(part)
+                if index is not None:
+                    base_df = try_po_to_int(
+                        timed("check_non_ai", check_non_ai, base_df, index=index, references=references), "Tab 2"
+                    )
+                    stream('non_ai_df').write(base_df)
+                remit_df = merged_remit_df = None
+                if remit_spill is not None:
+                    remit_df = remit_spill.read(part)
+                    merged_remit_df = timed(
+                        "merge_remittance", merge_remittance, base_df, remit_df, remittance_detail, remittance_as_of
+                    )
+                    stream('merged_remit_df').write(merged_remit_df)
+                if rollup:
+                    cells.append(rollup_cells(
+                        run_rows(base_df, merged_remit_df, remit_df, remittance_detail, remittance_as_of)
+                    ))
+
+        run = {"summary": summary, "outputs": close_streams(streams, specs)}
+        if rollup:
+            run["rollup"] = combine_cells(cells)
+        return run
+    except BaseException:
+        for s in streams.values():
+            s.close()
+        raise
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def close_streams(streams, specs):
+    written = []
+    for attr, s in streams.items():
+        path, sheet_name, out_fmt = specs[attr]
+        with stage(f"close {sheet_name} ({out_fmt})"):
+            s.close()
+        written.append(path)
+    return written
@@ -0,0 +1,354 @@
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+
+from .columns import non_ai_cols, rebate_input_cols, required_cols, required_remit_cols
+from .batch import is_batch_source, list_statements, run_batch
+from .chunked import CHUNK_ROWS, DEFAULT_PARTITIONS, partitions_for, reconcile_chunked
+from .duplicates import DEDUPE_POLICIES
+from .engine import reconcile
+from .export import EXPORT_FORMATS, output_specs, write_export
+from .incremental import reconcile_incremental
+from .keyindex import index_file
+from .profiling import Profiler
+from .readers import read_table
+from .refstore import DATASETS, ReferenceStore, linked_pos, statement_keys
+from .rollup import DIMS, RollupCube, file_token, run_name, run_rows
+from .scenarios import parse_rates, rebate_scenarios, vendor_rate_table
+from .schema import apply_schema, memory_report
+
+
+def rollup_dimensions(text):
+    dims = [dim.strip() for dim in text.split(',') if dim.strip()]
+    unknown = [dim for dim in dims if dim not in DIMS]
+    if unknown:
+        raise ValueError(f"Unknown rollup dimensions: {', '.join(unknown)}")
+    return dims
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m reconciliation",
+        description="Run the FC3 statement reconciliation (Tabs 1-3) without the Streamlit UI."
+    )
+    parser.add_argument("statement", nargs="?", help="Statement file (.xlsx, .csv or .parquet), or for a batch a "
+                                                     "directory of statements or a .txt manifest listing one per line")
+    parser.add_argument("estimates", nargs="?", help="Estimates file (.xlsx, .csv or .parquet); optional with a "
+                                                     "--reference-store holding estimates")
+    parser.add_argument("--merge-key", choices=['PO', 'ROID'], default='PO')
+    parser.add_argument("--rebate-file", help="Query results file for the Step 2 tax & rebate calculation")
+    parser.add_argument("--rebate-pct", type=float, default=0.0, help="Rebate %% applied in Step 2")
+    parser.add_argument("--non-ai", help="Non-AI reference file with a 'PO' column (Tab 2)")
+    parser.add_argument("--remittance", help="Remittance file (Tab 3)")
+    parser.add_argument("--found-in", action="store_true",
+                        help="Add a 'Found in' column to Tab 2 naming the reference files (Non-AI, Estimates, "
+                             "Remittance) each PO is in")
+    parser.add_argument("--index-cache", metavar="DIR", default=os.environ.get("RECONCILE_INDEX_CACHE"),
+                        help="Save the key indexes of the reference files here and load them on later runs while "
+                             "the files are unchanged (default: $RECONCILE_INDEX_CACHE)")
+    parser.add_argument("--scenario-rates", type=parse_rates, metavar="PCT,PCT,...",
+                        help="What-if rebate %% to compare, e.g. 5,7.5,10: writes rebate_scenarios with the Rebate AI, "
+                             "Amount to pay and dispute totals per scenario and vendor")
+    parser.add_argument("--scenario-table", help="Per-vendor what-if rebates: a 'Vendor Name' column plus one "
+                                                 "rebate %% column per scenario")
+    parser.add_argument("--scenario-all-rows", action="store_true",
+                        help="Apply the scenario rates to every row with a Sub Total, not only the query-matched rows")
+    parser.add_argument("--remittance-detail", action="store_true",
+                        help="Join every remittance row (one output row per payment) instead of one total per PO")
+    parser.add_argument("--as-of", type=datetime.date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="Statement cutoff: remittance payments with a later paid_date are left out")
+    parser.add_argument("--out-dir", default=".", help="Directory the output files are written to")
+    parser.add_argument("--output-format", choices=list(EXPORT_FORMATS),
+                        help="Write every output in this format (default: xlsx, csv for Tab 3)")
+    parser.add_argument("--dedupe", choices=list(DEDUPE_POLICIES),
+                        help="Reduce Estimates to one row per key before the merge: "
+                             + "; ".join(f"{name}: {text.lower()}" for name, text in DEDUPE_POLICIES.items()))
+    parser.add_argument("--fuzzy-match", action="store_true",
+                        help="Tag 'Still Unmatched' rows with the Estimates/query row found by a normalized key, "
+                             "the invoice number or the VIN plus amount")
+    parser.add_argument("--amount-col", help="Statement amount column compared with Payable Amount by --fuzzy-match")
+    parser.add_argument("--jobs", type=int, help="Worker processes for a batch (default: one per CPU)")
+    parser.add_argument("--state", help="SQLite state store: only keys whose inputs changed since the last run "
+                                        "against it are recomputed, and only the last stage's output is written")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Print per-column memory of each input before and after typing, then exit")
+    parser.add_argument("--profile", metavar="TRACE_JSON",
+                        help="Save per-stage timings as a Chrome/Perfetto trace (stages are always logged as JSON)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Also record each stage's peak allocation with tracemalloc (slower)")
+    store = parser.add_argument_group("reference store")
+    store.add_argument("--reference-store", metavar="STORE_DB",
+                       help="SQLite file of ingested estimates, rebate query and remittance exports; the ones not "
+                            "given as files are fetched from it, only for the statement's POs/ROIDs")
+    store.add_argument("--ingest", nargs=2, action="append", metavar=("DATASET", "FILE"), default=[],
+                       help=f"Append an export to the store first ({', '.join(DATASETS)}); repeatable. "
+                            "Without a statement the run stops after ingesting")
+    store.add_argument("--supersede", action="store_true",
+                       help="Ingested exports replace the stored rows sharing a PO or ROID instead of adding to them")
+    cube = parser.add_argument_group("rollup cube")
+    cube.add_argument("--rollup", metavar="CUBE_DB",
+                      help="SQLite cube of totals per vendor, appointment year and month, match status and AP status: "
+                           "the run's totals replace those of its earlier runs. Without a statement, prints the totals")
+    cube.add_argument("--rollup-run", metavar="NAME",
+                      help="Name the run's totals are kept under (default: the statement's file name and a token "
+                           "of its content; a batch always uses each statement's)")
+    cube.add_argument("--rollup-by", type=rollup_dimensions, default=['Vendor Name'], metavar="DIM,DIM",
+                      help=f"Dimensions the printed totals are grouped by, from {', '.join(DIMS)} "
+                           "(default: Vendor Name)")
+    chunked = parser.add_argument_group("out-of-core mode")
+    chunked.add_argument("--chunked", action="store_true",
+                         help="Hash-partition the inputs on the merge key and reconcile one partition at a time")
+    chunked.add_argument("--partitions", type=int, help=f"Number of partitions (default {DEFAULT_PARTITIONS})")
+    chunked.add_argument("--max-memory-mb", type=float,
+                         help="Pick the partition count so one partition of every input fits in this budget")
+    chunked.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows read per chunk")
+    chunked.add_argument("--work-dir", help="Where partition spill files go (default: system temp dir)")
+    return parser
+
+
+def write_outputs(result, statement_path, out_dir, fmt=None):
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for attr, (path, sheet_name, out_fmt) in output_specs(statement_path, out_dir, fmt).items():
+        df = getattr(result, attr)
+        if df is not None:
+            write_export(df, path, out_fmt, sheet_name)
+            written.append(path)
+    return written
+
+
+def run_chunked(args):
+    partitions = args.partitions
+    if partitions is None and args.max_memory_mb:
+        inputs = [args.statement, args.estimates, args.rebate_file, args.non_ai, args.remittance]
+        partitions = partitions_for(inputs, args.max_memory_mb)
+    run = reconcile_chunked(
+        args.statement, args.estimates, args.out_dir,
+        merge_key=args.merge_key,
+        rebate=args.rebate_file,
+        rebate_percent=args.rebate_pct,
+        non_ai=args.non_ai,
+        remittance=args.remittance,
+        partitions=partitions or DEFAULT_PARTITIONS,
+        chunk_rows=args.chunk_rows,
+        work_dir=args.work_dir,
+        fmt=args.output_format,
+        dedupe=args.dedupe,
+        remittance_detail=args.remittance_detail,
+        remittance_as_of=args.as_of,
+        rollup=bool(args.rollup),
+        found_in=args.found_in,
+        index_cache=args.index_cache,
+    )
+    if run.get("rollup") is not None:
+        run["rollup"] = add_to_rollup(args, cells=run["rollup"])
+    return run
+
+
+def add_to_rollup(args, rows=None, cells=None):
+    # The run's totals replace those of its earlier runs under the same name
+    cube = RollupCube(args.rollup)
+    run = run_name(args.statement, args.rollup_run, file_token(args.statement))
+    updated = cube.replace(run, cells) if cells is not None else cube.update(run, rows)
+    return {"cube": args.rollup, "run": run, "updated": updated}
+
+
+def ingest_exports(args):
+    store = ReferenceStore(args.reference_store)
+    return {
+        path: store.ingest(dataset, read_table(path), os.path.basename(path), supersede=args.supersede)
+        for dataset, path in args.ingest
+    }
+
+
+def read_references(args, statement_df):
+    """(estimates, query results, remittance) frames; files given on the command line win over the store."""
+    store = ReferenceStore(args.reference_store) if args.reference_store else None
+
+    def stored(dataset, keys, columns):
+        # Only the rows sharing a key with the statement
+        return store.fetch(dataset, keys, columns) if store is not None and store.has(dataset) else None
+
+    keys = statement_keys(statement_df)
+    if args.estimates:
+        estimates_df = read_table(args.estimates, columns=required_cols)
+    else:
+        estimates_df = stored('estimates', keys, required_cols)
+        if estimates_df is None:
+            raise ValueError("No Estimates: pass an estimates file or a --reference-store holding estimates")
+    if args.rebate_file:
+        rebate_df = read_table(args.rebate_file, columns=rebate_input_cols)
+    else:
+        rebate_df = stored('rebate_query', keys, rebate_input_cols)
+    if args.remittance:
+        remit_df = read_table(args.remittance, columns=required_remit_cols)
+    else:
+        remit_df = stored('remittance', {'PO': linked_pos(statement_df, estimates_df, rebate_df)}, required_remit_cols)
+    return estimates_df, rebate_df, remit_df
+
+
+def non_ai_reference(args):
+    # Only the Non-AI POs are needed, as a KeyIndex loaded from --index-cache when the file is unchanged
+    return index_file(args.non_ai, 'PO', 'Non-AI', args.index_cache) if args.non_ai else None
+
+
+def run_incremental(args):
+    statement_df = read_table(args.statement)
+    estimates_df, rebate_df, remit_df = read_references(args, statement_df)
+    run = reconcile_incremental(
+        statement_df,
+        estimates_df,
+        args.state,
+        merge_key=args.merge_key,
+        rebate_df=rebate_df,
+        rebate_percent=args.rebate_pct,
+        non_ai_ref=non_ai_reference(args),
+        remit_df=remit_df,
+        dedupe=args.dedupe,
+        remittance_detail=args.remittance_detail,
+        remittance_as_of=args.as_of,
+    )
+    written = []
+    if run.output is not None:
+        os.makedirs(args.out_dir, exist_ok=True)
+        path, sheet_name, out_fmt = output_specs(args.statement, args.out_dir, args.output_format)[run.stage]
+        write_export(run.output, path, out_fmt, sheet_name)
+        written.append(path)
+    report = {"summary": run.summary, "recomputed_keys": run.recomputed, "reused_keys": run.reused,
+              "outputs": written}
+    if args.rollup and run.output is not None:
+        # The last stage keeps one row per final output row, since --remittance-detail is refused with --rollup
+        report["rollup"] = add_to_rollup(args, rows=run.output)
+    return report
+
+
+def print_memory_reports(args):
+    inputs = [
+        ("Statement", args.statement, None), ("Estimates", args.estimates, required_cols),
+        ("Rebate", args.rebate_file, rebate_input_cols), ("Non-AI", args.non_ai, non_ai_cols),
+        ("Remittance", args.remittance, required_remit_cols),
+    ]
+    for label, path, columns in inputs:
+        if path:
+            raw = read_table(path, columns=columns, typed=False)
+            print(f"{label}: {path}")
+            print(memory_report(raw, apply_schema(raw)).to_string(), end="\n\n")
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+
+    if args.memory_report:
+        print_memory_reports(args)
+        return 0
+
+    profiler = Profiler("cli", trace_memory=args.trace_memory, log=True).activate()
+    try:
+        return run_args(args)
+    finally:
+        if args.profile:
+            profiler.save_trace(args.profile)
+
+
+def run_args(args):
+    try:
+        if args.ingest and not args.reference_store:
+            raise ValueError("--ingest needs a --reference-store to ingest into")
+        ingested = ingest_exports(args) if args.ingest else {}
+        if args.statement is None:
+            if not (args.ingest or args.rollup):
+                raise ValueError("No statement given")
+            if args.ingest:
+                print(json.dumps({"reference_store": args.reference_store, "ingested_rows": ingested}, indent=2))
+            if args.rollup:
+                print(RollupCube(args.rollup).query(by=args.rollup_by).to_string(index=False))
+            return 0
+        if args.reference_store and (is_batch_source(args.statement) or args.chunked):
+            raise ValueError("--reference-store works with a single statement and without --chunked")
+        if (args.scenario_rates or args.scenario_table) and (
+            is_batch_source(args.statement) or args.chunked or args.state
+        ):
+            raise ValueError("--scenario-rates and --scenario-table need one statement, not --chunked or --state")
+        if args.found_in and args.state:
+            raise ValueError("--found-in can't run with --state; its fingerprints only cover the Non-AI check")
+        if args.rollup and args.state and args.remittance_detail:
+            raise ValueError("--rollup with --state needs one total per PO; drop --remittance-detail")
+        if args.estimates is None and not args.reference_store:
+            raise ValueError("No Estimates: pass an estimates file or a --reference-store holding estimates")
+        if args.estimates is None and args.fuzzy_match:
+            raise ValueError("--fuzzy-match needs the full Estimates file, not the rows fetched from the store")
+
+        if is_batch_source(args.statement):
+            summary = run_batch(
+                list_statements(args.statement), args.estimates, args.out_dir,
+                merge_key=args.merge_key,
+                rebate=args.rebate_file,
+                rebate_percent=args.rebate_pct,
+                non_ai=args.non_ai,
+                remittance=args.remittance,
+                jobs=args.jobs,
+                fmt=args.output_format,
+                dedupe=args.dedupe,
+                remittance_detail=args.remittance_detail,
+                remittance_as_of=args.as_of,
+                fuzzy=args.fuzzy_match,
+                amount_col=args.amount_col,
+                rollup=args.rollup,
+                found_in=args.found_in,
+                index_cache=args.index_cache,
+            )
+            print(summary.drop(columns=['outputs']).to_string(index=False))
+            return 1 if (summary['error'].fillna('') != '').any() else 0
+
+        if args.chunked or args.state:
+            if args.fuzzy_match:
+                raise ValueError(
+                    "--fuzzy-match needs every reference row in memory; it can't run with --chunked or --state"
+                )
+            run = run_chunked(args) if args.chunked else run_incremental(args)
+            print(json.dumps({"statement": args.statement, **run}, indent=2))
+            return 0
+
+        statement_df = read_table(args.statement)
+        estimates_df, rebate_df, remit_df = read_references(args, statement_df)
+        result = reconcile(
+            statement_df,
+            estimates_df,
+            merge_key=args.merge_key,
+            rebate_df=rebate_df,
+            rebate_percent=args.rebate_pct,
+            non_ai_ref=non_ai_reference(args),
+            remit_df=remit_df,
+            dedupe=args.dedupe,
+            remittance_detail=args.remittance_detail,
+            remittance_as_of=args.as_of,
+            fuzzy=args.fuzzy_match,
+            amount_col=args.amount_col,
+            found_in=args.found_in,
+        )
+        if (args.scenario_rates or args.scenario_table) and result.final_output is not None:
+            vendor_rates = vendor_rate_table(read_table(args.scenario_table)) if args.scenario_table else None
+            result.rebate_scenarios = rebate_scenarios(
+                result.final_output, args.scenario_rates, vendor_rates, all_rows=args.scenario_all_rows
+            ).comparison()
+        # An output past an Excel sheet's row limit is reported like the other input errors; the cube only
+        # takes the run's totals once its outputs are written
+        written = write_outputs(result, args.statement, args.out_dir, args.output_format)
+        rollup = None
+        if args.rollup and result.final_output is not None:
+            rollup = add_to_rollup(args, rows=run_rows(
+                result.final_output, result.merged_remit_df, remit_df, args.remittance_detail, args.as_of
+            ))
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        return 2
+
+    report = {"statement": args.statement, "summary": result.summary, "outputs": written}
+    if rollup:
+        report["rollup"] = rollup
+    print(json.dumps(report, indent=2))
+    return 0
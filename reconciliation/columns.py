@@ -0,0 +1,67 @@
+# Column sets and status labels shared by the Streamlit apps and the headless engine
+
+required_cols = [
+    'Appointment date', 'Appointment month', 'Appointment year', 'Vendor Name',
+    'PO', 'ROID', 'Invoice no', 'VIN', 'Sub Total', 'Tax Total', 'AI trans Fee', 'FMC Rebate', 'Payable Amount',
+    'Rebate AI', 'Rebate%', 'Amount to pay', 'Trans fee', 'Merch fee',
+    'Status in api', 'AP status'
+]
+
+required_cols_step2 = ['SubTotal (exc. Tax)', 'Total (inc. Tax)', 'Payable Amount (inc. Tax)']
+
+column_renames = {
+    'SubTotal (exc. Tax)': 'Sub Total',
+    'Tax': 'Tax Total',
+    'Payable Amount (inc. Tax)': 'Payable Amount',
+    'Rebate': 'Rebate AI',
+    'Rebate %': 'Rebate%',
+    'Amount to Pay': 'Amount to pay',
+    'company': 'Vendor Name',
+    'transaction_fee': 'Trans fee',
+    'merch_fee': 'Merch fee',
+    'Status_in_api': 'Status in api',
+    'ap_status': 'AP status',
+    'ai_order_id': 'ROID',
+    'id': 'PO',
+    'invoice_number': 'Invoice no',
+    'vin': 'VIN',
+    'AI Transaction Fee': 'AI trans Fee',
+    'FMC Rebate Amount': 'FMC Rebate'
+}
+
+# Columns Step 2 reads from the query results file (inputs, rename sources and passthroughs)
+rebate_input_cols = list(dict.fromkeys(
+    required_cols_step2 + list(column_renames) + ['appointment_datetime'] + required_cols
+))
+
+non_ai_cols = ['PO']
+
+required_remit_cols = [
+    'shop_order_id', 'paid_amount', 'paid_date',
+    'disputed_amount', 'disputed_date',
+    'dispute_reason', 'payment_details'
+]
+
+remittance_preview_cols = [
+    'PO', 'paid_amount', 'paid_date',
+    'disputed_amount', 'disputed_date',
+    'dispute_reason', 'payment_details'
+]
+
+date_cols = ['Appointment date', 'Appointment month', 'Appointment year']
+
+merge_keys = ['PO', 'ROID']
+
+MATCHED_ESTIMATES = 'Matched with Estimates'
+UNMATCHED_ESTIMATES = 'Unmatched with Estimates (N/A)'
+MATCHED_QUERY = 'Matched with Query result'
+STILL_UNMATCHED = 'Still Unmatched'
+FUZZY_MATCHED = 'Still Unmatched with a fuzzy match'
+MATCHED_NON_AI = 'Matched with Non-AI'
+NOT_NON_AI = ' '
+# Tab 2 column naming the reference files each PO is in (found_in)
+FOUND_IN = 'Found in'
+
+UPLOAD_TYPES = ["xlsx", "csv", "parquet"]
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
@@ -0,0 +1,58 @@
+# Streamlit download widgets that only build the export once the user asks for it
+import streamlit as st
+
+from .export import EXPORT_FORMATS, available_formats, export_file, export_file_name
+
+
+def lazy_download(label, df, file_name, key, sheet_name='Sheet1', default_format='xlsx', format_sheet=None,
+                  data_key=None):
+    """Format picker + "Prepare" button; the file is written only after the click.
+
+    data_key identifies the frame's content (e.g. a StageCache key) so a prepared
+    download is dropped as soon as the underlying data changes; the written file is
+    kept under it, so reruns reuse it instead of writing it again.
+    """
+    formats = available_formats()
+    ready_key = f"{key}_ready"
+    bytes_key = f"{key}_bytes"
+    picker, action = st.columns([1, 3])
+    with picker:
+        fmt = st.selectbox("Format", formats, index=formats.index(default_format), key=f"{key}_format",
+                           label_visibility="collapsed")
+
+    wanted = (data_key, fmt)
+    if st.session_state.get(ready_key) != wanted:
+        st.session_state.pop(ready_key, None)
+        st.session_state.pop(bytes_key, None)
+
+    with action:
+        if ready_key not in st.session_state:
+            if not st.button(f"⚙️ Prepare: {label}", key=f"{key}_prepare"):
+                return
+            st.session_state[ready_key] = wanted
+
+        # Without a data_key a change of df can't be told apart, so the file is written on every rerun
+        built = st.session_state.get(bytes_key)
+        if data_key is not None and built is not None and built[0] == wanted:
+            data = built[1]
+        else:
+            with st.spinner("Writing file ..."):
+                # download_button only takes bytes/BytesIO, so the spooled file is read exactly once
+                with export_file(df, fmt, sheet_name, format_sheet if fmt == 'xlsx' else None) as f:
+                    data = f.read()
+            if data_key is not None:
+                st.session_state[bytes_key] = (wanted, data)
+        st.download_button(
+            label,
+            data=data,
+            file_name=export_file_name(file_name, fmt),
+            mime=EXPORT_FORMATS[fmt],
+            key=f"{key}_download",
+            # Forget the prepared file once it has been downloaded
+            on_click=lambda: forget(ready_key, bytes_key)
+        )
+
+
+def forget(*keys):
+    for name in keys:
+        st.session_state.pop(name, None)
@@ -0,0 +1,138 @@
+# Key multiplicities counted in one pass per input: the merge fan-out is known before the merge
+# runs, summarize() takes its duplicate counts from them, and Estimates can be deduplicated first
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .cache import size_of
+from .schema import MONEY_COLS, joinable_keys
+
+DEDUPE_POLICIES = {
+    'first': "Keep the first row per key",
+    'latest': "Keep the latest appointment per key",
+    'sum': "One row per key, amounts summed",
+}
+
+
+def key_counts(keys):
+    # Missing keys count as one key, the way merge() and duplicated() treat them
+    return keys.value_counts(dropna=False, sort=False)
+
+
+@dataclass
+class DuplicateAnalysis:
+    merge_key: str
+    statement_counts: pd.Series
+    estimates_counts: pd.Series
+    vendors: pd.Series = None  # first Vendor Name of each duplicated estimates key
+
+    def __sizeof__(self):
+        # The key counts, so the stage cache's memory budget sees them
+        return object.__sizeof__(self) + size_of(vars(self))
+
+    def _aligned(self):
+        # Estimate rows per statement key, NaN where Estimates doesn't have it
+        return self.estimates_counts.reindex(self.statement_counts.index)
+
+    def merged_counts(self):
+        # A left merge gives each statement row one output row per matching estimate, or one if none match
+        return self.statement_counts * self._aligned().fillna(1).astype('int64')
+
+    @property
+    def statement_rows(self):
+        return int(self.statement_counts.sum())
+
+    @property
+    def merged_rows(self):
+        return int(self.merged_counts().sum())
+
+    @property
+    def fanout(self):
+        return self.merged_rows / self.statement_rows if self.statement_rows else 1.0
+
+    @property
+    def duplicated_estimate_keys(self):
+        return int((self.estimates_counts > 1).sum())
+
+    def summary_counts(self):
+        """summarize()'s two duplicate counts, from the key counts instead of scans of the merged frames."""
+        estimates = self._aligned()
+        merged = self.merged_counts()
+        matched = merged[estimates.notna()]
+        return {
+            'Duplicates in Statements': int(matched[matched > 1].sum()),
+            'Duplicates in Estimates': int(estimates[estimates > 1].sum()),
+        }
+
+    def deduplicated(self):
+        # The analysis as it stands once Estimates has one row per key
+        return DuplicateAnalysis(self.merge_key, self.statement_counts, self.estimates_counts.clip(upper=1))
+
+    def report(self):
+        """One row per key that repeats on either side, the keys adding the most merged rows first."""
+        estimates = self._aligned().fillna(0).astype('int64')
+        merged = self.merged_counts()
+        repeated = (self.statement_counts > 1) | (estimates > 1)
+        report = pd.DataFrame({
+            'Statement rows': self.statement_counts[repeated],
+            'Estimate rows': estimates[repeated],
+            'Merged rows': merged[repeated],
+        })
+        report['Extra rows'] = report['Merged rows'] - report['Statement rows']
+        vendors = self.vendors if self.vendors is not None else pd.Series(dtype=object)
+        report['Vendor Name'] = vendors.reindex(report.index)
+        report = report.rename_axis(self.merge_key).reset_index()
+        return report.sort_values(['Extra rows', 'Merged rows'], ascending=False, kind='stable', ignore_index=True)
+
+
+def analyze_duplicates(statement_df, estimates_df, merge_key):
+    if merge_key not in statement_df.columns or merge_key not in estimates_df.columns:
+        raise ValueError(f"Selected key '{merge_key}' not found in both files.")
+    statement_df, estimates_df = joinable_keys(statement_df, estimates_df, merge_key)
+    estimates_counts = key_counts(estimates_df[merge_key])
+    vendors = None
+    if 'Vendor Name' in estimates_df.columns:
+        # Only the repeated keys need a vendor, so this touches a small slice of Estimates
+        repeated = estimates_df[estimates_df[merge_key].isin(estimates_counts.index[estimates_counts > 1])]
+        vendors = repeated.groupby(merge_key, sort=False, dropna=False, observed=True)['Vendor Name'].first()
+    return DuplicateAnalysis(merge_key, key_counts(statement_df[merge_key]), estimates_counts, vendors)
+
+
+def fanout_by_vendor(report):
+    """Duplicated keys and the extra merged rows they cause, per vendor."""
+    if report.empty:
+        return pd.DataFrame(columns=['Vendor Name', 'Keys', 'Extra rows'])
+    vendors = report.assign(**{'Vendor Name': report['Vendor Name'].astype(object).fillna('(unknown)')})
+    rollup = vendors.groupby('Vendor Name', sort=False)['Extra rows'].agg(['size', 'sum'])
+    rollup.columns = ['Keys', 'Extra rows']
+    return rollup.sort_values('Extra rows', ascending=False).reset_index()
+
+
+def dedupe_estimates(estimates_df, merge_key, policy):
+    """Estimates with one row per key, chosen or combined by one of DEDUPE_POLICIES."""
+    if policy not in DEDUPE_POLICIES:
+        raise ValueError(f"Unknown dedupe policy '{policy}'; choose one of {', '.join(DEDUPE_POLICIES)}")
+    keys = estimates_df[merge_key]
+    if not keys.duplicated().any():
+        return estimates_df
+
+    if policy == 'first':
+        return estimates_df[~keys.duplicated(keep='first')]
+
+    if policy == 'latest':
+        if 'Appointment date' not in estimates_df.columns:
+            raise ValueError("The 'latest' policy needs an 'Appointment date' column in Estimates")
+        dates = pd.to_datetime(estimates_df['Appointment date'].astype(object), errors='coerce')
+        # Undated rows sort first so they only win when a key has no dated row; ties go to the later row
+        order = pd.Series(dates.to_numpy()).sort_values(kind='stable', na_position='first').index.to_numpy()
+        last = ~keys.iloc[order].duplicated(keep='last').to_numpy()
+        return estimates_df.iloc[np.sort(order[last])]
+
+    # 'sum': the key's first row, with its amounts replaced by the sums over all its rows
+    money = [col for col in MONEY_COLS if col in estimates_df.columns
+             and pd.api.types.is_numeric_dtype(estimates_df[col])]
+    sums = estimates_df.groupby(merge_key, sort=False, dropna=False, observed=True)[money].sum(min_count=1)
+    combined = estimates_df[~keys.duplicated()].copy()
+    combined[money] = sums.reindex(combined[merge_key]).to_numpy()
+    return combined
@@ -0,0 +1,394 @@
+import datetime
+import logging
+import os
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from .duplicates import analyze_duplicates, dedupe_estimates
+from .fuzzy import FuzzyIndex, fuzzy_match_count, tag_fuzzy_matches
+from .keyindex import KeyIndex, matched_references
+from .profiling import timed
+from .schema import NON_AI_DTYPE, STATUS_DTYPE, as_text, joinable_keys
+from .compute import (
+    CURRENCY_PATTERN, add_dispute_analysis, add_disputed_amount, clean_currency, promote_status, rebate_pct_column
+)
+from .columns import (
+    FOUND_IN, FUZZY_MATCHED, MATCHED_ESTIMATES, MATCHED_QUERY, STILL_UNMATCHED, UNMATCHED_ESTIMATES, column_renames,
+    date_cols, remittance_preview_cols, required_cols, required_cols_step2, required_remit_cols
+)
+
+logger = logging.getLogger(__name__)
+
+
+def select_estimate_columns(estimates_df):
+    cols = [col for col in required_cols if col in estimates_df.columns]
+    # Already projected (e.g. read with columns=required_cols): skip the copy
+    if cols == list(estimates_df.columns):
+        return estimates_df
+    return estimates_df[cols]
+
+
+def whole_years(series):
+    # A left merge turns an int year column float wherever a row is unmatched, so '2024' would depend on which
+    # rows were reconciled together; integral years are written as ints however their column came out
+    if pd.api.types.is_float_dtype(series):
+        values = series.dropna()
+        if (values == np.floor(values)).all():
+            return series.astype('Int64')
+    return series
+
+
+def stringify_dates(df):
+    # A new frame sharing every other column with df (copy-on-write); df itself is left alone
+    return df.assign(**{
+        col: as_text(whole_years(df[col]) if col == 'Appointment year' else df[col])
+        for col in date_cols if col in df.columns
+    })
+
+
+# --- Tab 1, Step 1: Statement ⇄ Estimates ---
+def pick_merge_key(statement_df, estimates_df, merge_key=None):
+    # A chosen key is checked by the merge; otherwise PO when both files have it, else ROID
+    if merge_key:
+        return merge_key
+    for key in ('PO', 'ROID'):
+        if key in statement_df.columns and key in estimates_df.columns:
+            return key
+    raise ValueError("Neither PO nor ROID column found in both files.")
+
+
+def merge_estimates(statement_df, estimates_df, merge_key, project=True, disputed=True):
+    # project=False keeps every Estimates column; disputed=False skips the Disputed amount column
+    if merge_key not in statement_df.columns or merge_key not in estimates_df.columns:
+        raise ValueError(f"Selected key '{merge_key}' not found in both files.")
+
+    if project:
+        estimates_df = select_estimate_columns(estimates_df)
+    statement_df, estimates_df = joinable_keys(statement_df, estimates_df, merge_key)
+    merged_df = pd.merge(statement_df, estimates_df, how='left', on=merge_key, indicator=True)
+    merged_df['Match Status'] = merged_df['_merge'].map({
+        'both': MATCHED_ESTIMATES,
+        'left_only': UNMATCHED_ESTIMATES
+    }).astype(STATUS_DTYPE)
+    merged_df.drop(columns=['_merge'], inplace=True)
+
+    return add_disputed_amount(merged_df) if disputed else merged_df
+
+
+def unmatched_rows(merged_df):
+    return merged_df[merged_df['Match Status'] == UNMATCHED_ESTIMATES]
+
+
+# --- Tab 1, Step 2: Tax & Rebate calculator ---
+def calculate_rebates(df, rebate_percent, formatted=True, currency_pattern=CURRENCY_PATTERN, blank_fee_cols=False):
+    # blank_fee_cols adds the fee columns a query export doesn't carry as empty text, the way Statement.py did
+    if not all(col in df.columns for col in required_cols_step2):
+        raise ValueError(f"Required columns: {', '.join(required_cols_step2)}")
+
+    df = df.copy()
+    for col in required_cols_step2:
+        df[col] = clean_currency(df[col], pattern=currency_pattern)
+
+    rebate_rate = rebate_percent / 100.0
+    df['Tax'] = df['Total (inc. Tax)'] - df['SubTotal (exc. Tax)']
+    df['Rebate'] = df['SubTotal (exc. Tax)'] * (-rebate_rate)
+    df['Rebate %'] = rebate_pct_column(df['Rebate'], df['SubTotal (exc. Tax)'], formatted=formatted)
+    df['Amount to Pay'] = df['Payable Amount (inc. Tax)'] + df['Rebate']
+
+    if 'appointment_datetime' in df.columns:
+        df['appointment_datetime'] = pd.to_datetime(df['appointment_datetime'], errors='coerce')
+        df['Appointment date'] = df['appointment_datetime'].dt.date
+        df['Appointment month'] = df['appointment_datetime'].dt.month_name().astype('category')
+        df['Appointment year'] = df['appointment_datetime'].dt.year
+
+    for old, new in column_renames.items():
+        if old in df.columns:
+            df[new] = df[old]
+
+    if blank_fee_cols and 'Tax Total' in df.columns and 'Payable Amount' in df.columns:
+        for col in ('AI trans Fee', 'FMC Rebate'):
+            if col not in df.columns:
+                df[col] = ""
+
+    final_cols = [col for col in required_cols if col in df.columns]
+    return df[final_cols]
+
+
+# --- Tab 1, Step 3: Enrich unmatched rows ---
+def enrich_unmatched(merged_df, rebate_enrichment_df, merge_key):
+    unmatched_df = unmatched_rows(merged_df)
+    drop_cols = [col for col in unmatched_df.columns if col in rebate_enrichment_df.columns and col != merge_key]
+    unmatched_df, rebate_enrichment_df = joinable_keys(unmatched_df.drop(columns=drop_cols), rebate_enrichment_df, merge_key)
+    enrich_df = pd.merge(
+        unmatched_df,
+        rebate_enrichment_df,
+        on=merge_key,
+        how='left',
+        indicator=True
+    )
+    enrich_df['Match Status'] = enrich_df['_merge'].map({
+        'both': MATCHED_QUERY,
+        'left_only': STILL_UNMATCHED
+    }).astype(STATUS_DTYPE)
+    enrich_df.drop(columns=['_merge'], inplace=True)
+    add_disputed_amount(enrich_df)
+
+    final_output = pd.concat([merged_df[merged_df['Match Status'] == MATCHED_ESTIMATES], enrich_df])
+    add_dispute_analysis(final_output)
+
+    if 'Dispute analysis' in final_output.columns and 'Match Status' in final_output.columns:
+        cols = final_output.columns.tolist()
+        cols.remove('Match Status')
+        idx = cols.index('Dispute analysis') + 1
+        cols.insert(idx, 'Match Status')
+        final_output = final_output[cols]
+
+    return final_output
+
+
+# --- Statement processing with Format: Query Results merge ---
+def query_result_column(df):
+    return next((col for col in df.columns if str(col).endswith('_QR')), None)
+
+
+def merge_query_results(merged_df, qr_df, merge_key):
+    # Query rows joined with '_QR' suffixes on clashing columns; a row whose '_QR' column
+    # is filled moves from unmatched to matched with the query results
+    if merge_key not in qr_df.columns:
+        raise ValueError(f"'{merge_key}' column not found in Query Results file.")
+    merged_df, qr_df = joinable_keys(merged_df, qr_df, merge_key)
+    merged_df = merged_df.merge(qr_df, on=merge_key, how='left', suffixes=('', '_QR'))
+    qr_col = query_result_column(merged_df)
+    if qr_col:
+        merged_df['Match Status'] = promote_status(
+            merged_df['Match Status'], merged_df[qr_col].notna(), UNMATCHED_ESTIMATES, MATCHED_QUERY
+        )
+    return merged_df
+
+
+def summarize(final_output, merged_df, estimates_df, merge_key, duplicates=None):
+    # With a DuplicateAnalysis of the merged inputs the duplicate counts come from its key counts
+    match_status_summary = final_output['Match Status'].value_counts()
+    if duplicates is not None:
+        counts = duplicates.summary_counts()
+        duplicate_statements, duplicate_estimates = counts['Duplicates in Statements'], counts['Duplicates in Estimates']
+    else:
+        duplicate_statements = merged_df[merged_df['Match Status'] == MATCHED_ESTIMATES].duplicated(subset=merge_key, keep=False).sum()
+        duplicate_estimates = estimates_df[estimates_df[merge_key].isin(final_output[merge_key])].duplicated(subset=merge_key, keep=False).sum()
+    return {
+        MATCHED_ESTIMATES: int(match_status_summary.get(MATCHED_ESTIMATES, 0)),
+        MATCHED_QUERY: int(match_status_summary.get(MATCHED_QUERY, 0)),
+        STILL_UNMATCHED: int(match_status_summary.get(STILL_UNMATCHED, 0)),
+        'Duplicates in Statements': int(duplicate_statements),
+        'Duplicates in Estimates': int(duplicate_estimates),
+    }
+
+
+def po_to_int(df):
+    # Convert PO column to int; raises if any PO is not numeric. Plain int columns are left alone
+    if 'PO' in df.columns and not (isinstance(df['PO'].dtype, np.dtype) and df['PO'].dtype.kind == 'i'):
+        df = df.assign(PO=pd.to_numeric(df['PO'], errors='raise').astype(int))
+    return df
+
+
+def try_po_to_int(df, tab):
+    try:
+        return po_to_int(df)
+    except Exception as e:
+        logger.warning("Could not convert PO column to integer format in %s: %s", tab, e)
+        return df
+
+
+def final_output_file_name(statement_name=None, timestamp=None):
+    original_name = os.path.splitext(os.path.basename(statement_name))[0] if statement_name else "Processed_Statement"
+    timestamp = timestamp or datetime.datetime.now().strftime("%Y%m%d_%H%M")
+    return f"{original_name}_Final_Processed_{timestamp}.xlsx"
+
+
+# --- Tab 2: Non-AI PO check ---
+def non_ai_index(df_non_ai):
+    return KeyIndex.from_frame(df_non_ai, 'PO', name='Non-AI')
+
+
+def reference_indexes(estimates_df=None, remit_df=None):
+    # The other references a PO can be looked up in, next to the Non-AI one, for the 'Found in' column
+    indexes = []
+    if estimates_df is not None and 'PO' in estimates_df.columns:
+        indexes.append(KeyIndex(estimates_df['PO'], name='Estimates'))
+    if remit_df is not None and 'shop_order_id' in remit_df.columns:
+        indexes.append(KeyIndex(remit_df['shop_order_id'], name='Remittance'))
+    return indexes
+
+
+def check_non_ai(final_df, df_non_ai=None, index=None, references=None):
+    # Pass a prebuilt index to reuse it across reruns/statements checked against the same reference;
+    # references (KeyIndexes, see reference_indexes) add a FOUND_IN column naming every file each PO is in
+    if 'PO' not in final_df.columns or (index is None and 'PO' not in df_non_ai.columns):
+        raise ValueError("'PO' column not found in both files.")
+    if index is None:
+        index = non_ai_index(df_non_ai)
+
+    # Only the new column (and stripped text POs) are built; the rest is shared with final_df
+    changes = {}
+    # The index normalizes keys itself; only text POs still get stripped for the output
+    if not pd.api.types.is_numeric_dtype(final_df['PO']):
+        changes['PO'] = final_df['PO'].astype(str).str.strip()
+    changes['Non AI check'] = pd.Categorical.from_codes(
+        np.where(index.contains(final_df['PO']), 0, 1), dtype=NON_AI_DTYPE
+    )
+    if references is not None:
+        changes[FOUND_IN] = matched_references(final_df['PO'], [index, *references])
+    return final_df.assign(**changes)
+
+
+# --- Tab 3: Remittance merge ---
+def remittance_rows(remit_df, as_of=None):
+    """The remittance columns keyed by an Int64 PO; as_of drops the payments dated after that cutoff."""
+    missing_cols = [col for col in required_remit_cols if col not in remit_df.columns]
+    if missing_cols:
+        raise ValueError(f"Missing columns in Remittance File: {missing_cols}")
+
+    # Subset and rename
+    remit_df_subset = remit_df[required_remit_cols].rename(columns={'shop_order_id': 'PO'})
+    remit_df_subset = remit_df_subset.assign(PO=pd.to_numeric(remit_df_subset['PO'], errors='coerce').astype('Int64'))
+    if as_of is not None:
+        # Unpaid rows (disputes, pending payments) have no paid_date and are kept
+        paid = pd.to_datetime(remit_df_subset['paid_date'], errors='coerce')
+        remit_df_subset = remit_df_subset[~(paid > pd.Timestamp(as_of))]
+    return remit_df_subset
+
+
+def remittance_amounts(series):
+    # Totals need numbers; text amounts are cleaned like the statement's, blanks stay missing
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype('float64')
+    return clean_currency(series).where(series.notna())
+
+
+def aggregate_remittance(remit_df, as_of=None):
+    """One row per PO: total paid and disputed, the latest paid/disputed date, the latest payment's details,
+    the latest dispute's reason and the number of payments, so the Tab 3 join never fans out."""
+    rows = remittance_rows(remit_df, as_of)
+    rows = rows[rows['PO'].notna()].assign(
+        paid_amount=remittance_amounts(rows['paid_amount']),
+        disputed_amount=remittance_amounts(rows['disputed_amount']),
+        paid_date=pd.to_datetime(rows['paid_date'], errors='coerce'),
+        disputed_date=pd.to_datetime(rows['disputed_date'], errors='coerce'),
+    )
+    # In paid_date order 'last' is the latest payment; undated rows sort first so they only win when nothing is dated
+    rows = rows.sort_values('paid_date', kind='stable', na_position='first')
+    per_po = rows.groupby('PO', sort=False).agg(
+        paid_amount=('paid_amount', 'sum'),
+        paid_date=('paid_date', 'max'),
+        disputed_amount=('disputed_amount', 'sum'),
+        disputed_date=('disputed_date', 'max'),
+        payment_details=('payment_details', 'last'),
+        payment_count=('paid_amount', 'count'),
+        disputes=('disputed_amount', 'count'),
+    )
+    # A PO without any amount keeps a missing total rather than 0
+    per_po['paid_amount'] = per_po['paid_amount'].where(per_po['payment_count'] > 0)
+    per_po['disputed_amount'] = per_po['disputed_amount'].where(per_po['disputes'] > 0)
+    per_po['payment_count'] = per_po['payment_count'].astype('Int64')
+    disputes = rows[rows['dispute_reason'].notna()].sort_values('disputed_date', kind='stable', na_position='first')
+    reasons = disputes.drop_duplicates('PO', keep='last').set_index('PO')['dispute_reason']
+    per_po['dispute_reason'] = reasons.reindex(per_po.index)
+    return per_po.reset_index()[['PO', *remittance_preview_cols[1:], 'payment_count']]
+
+
+def merge_remittance(final_df, remit_df, detail=False, as_of=None):
+    # One row per PO unless detail asks for every remittance row, which repeats a statement row per payment
+    if detail:
+        remit_df_subset = remittance_rows(remit_df, as_of)
+    else:
+        remit_df_subset = aggregate_remittance(remit_df, as_of)
+
+    # Ensure PO columns are Int64; the other columns of final_df are shared, not copied
+    final_df = final_df.assign(PO=pd.to_numeric(final_df['PO'], errors='coerce').astype('Int64'))
+
+    return pd.merge(final_df, remit_df_subset, on='PO', how='left', validate=None if detail else 'many_to_one')
+
+
+def remittance_only(merged_remit_df):
+    cols = remittance_preview_cols + ['payment_count']
+    return merged_remit_df[[col for col in cols if col in merged_remit_df.columns]]
+
+
+@dataclass
+class ReconciliationResult:
+    merge_key: str
+    merged_df: pd.DataFrame
+    rebate_enrichment_df: pd.DataFrame = None
+    final_output: pd.DataFrame = None
+    non_ai_df: pd.DataFrame = None
+    merged_remit_df: pd.DataFrame = None
+    duplicate_report: pd.DataFrame = None
+    rebate_scenarios: pd.DataFrame = None
+    summary: dict = field(default_factory=dict)
+
+
+def reconcile(statement_df, estimates_df, merge_key='PO', rebate_df=None, rebate_percent=0.0,
+              non_ai_df=None, remit_df=None, rebate_enrichment_df=None, non_ai_ref=None, dedupe=None,
+              fuzzy=False, fuzzy_index=None, amount_col=None, remittance_detail=False, remittance_as_of=None,
+              found_in=False, found_in_refs=None):
+    # rebate_enrichment_df / non_ai_ref / fuzzy_index take a precomputed Step 2 result, Non-AI KeyIndex
+    # and FuzzyIndex so a batch can share them across statements instead of rebuilding them per file.
+    # dedupe is one of DEDUPE_POLICIES, applied to Estimates before the merge; fuzzy tags the
+    # 'Still Unmatched' rows with the reference row a secondary matching tier found for them. Tab 3 joins
+    # one collapsed remittance row per PO unless remittance_detail; remittance_as_of is the statement cutoff.
+    # found_in adds Tab 2's FOUND_IN column, from found_in_refs when a batch built them once
+    duplicates = timed("analyze_duplicates", analyze_duplicates, statement_df, estimates_df, merge_key)
+    if dedupe:
+        estimates_df = timed("dedupe_estimates", dedupe_estimates, estimates_df, merge_key, dedupe)
+    merged_df = timed("merge_estimates", merge_estimates, statement_df, estimates_df, merge_key)
+    result = ReconciliationResult(merge_key=merge_key, merged_df=stringify_dates(merged_df))
+    report = duplicates.report()
+    result.duplicate_report = report if not report.empty else None
+    if dedupe:
+        duplicates = duplicates.deduplicated()
+
+    if rebate_enrichment_df is not None:
+        result.rebate_enrichment_df = rebate_enrichment_df
+    elif rebate_df is not None:
+        enriched = timed("calculate_rebates", calculate_rebates, rebate_df, rebate_percent)
+        result.rebate_enrichment_df = stringify_dates(enriched)
+
+    unmatched_count = unmatched_rows(merged_df).shape[0]
+    if unmatched_count > 0 and result.rebate_enrichment_df is None:
+        logger.warning("%d rows unmatched with estimates and no rebate file given; skipping Step 3", unmatched_count)
+        return result
+
+    enrichment_df = result.rebate_enrichment_df
+    if enrichment_df is None:
+        enrichment_df = merged_df.iloc[0:0][[merge_key]]
+    final_output = timed("enrich_unmatched", enrich_unmatched, result.merged_df, enrichment_df, merge_key)
+    if fuzzy and fuzzy_index is None:
+        fuzzy_index = timed(
+            "fuzzy_index", FuzzyIndex.from_references, select_estimate_columns(estimates_df), result.rebate_enrichment_df
+        )
+    if fuzzy_index is not None:
+        final_output = timed("fuzzy_match", tag_fuzzy_matches, final_output, fuzzy_index, merge_key, amount_col)
+    result.summary = timed(
+        "summarize", summarize, final_output, result.merged_df, select_estimate_columns(estimates_df), merge_key,
+        duplicates
+    )
+    if fuzzy_index is not None:
+        result.summary[FUZZY_MATCHED] = fuzzy_match_count(final_output)
+    result.final_output = stringify_dates(try_po_to_int(final_output, "Tab 1"))
+
+    if non_ai_df is not None or non_ai_ref is not None:
+        if found_in and found_in_refs is None:
+            found_in_refs = timed("reference_indexes", reference_indexes, estimates_df, remit_df)
+        result.non_ai_df = try_po_to_int(timed(
+            "check_non_ai", check_non_ai, result.final_output, non_ai_df, non_ai_ref,
+            found_in_refs if found_in else None
+        ), "Tab 2")
+    if remit_df is not None:
+        base_df = result.non_ai_df if result.non_ai_df is not None else result.final_output
+        result.merged_remit_df = timed(
+            "merge_remittance", merge_remittance, base_df, remit_df, remittance_detail, remittance_as_of
+        )
+
+    return result
@@ -0,0 +1,183 @@
+# Streams result frames to .xlsx/.csv/.parquet without building the workbook in memory first
+import datetime
+import decimal
+import os
+import tempfile
+
+import pandas as pd
+import xlsxwriter
+
+from .columns import XLSX_MIME
+from .engine import final_output_file_name
+from .profiling import stage
+from .readers import engine_available
+
+EXPORT_FORMATS = {
+    'xlsx': XLSX_MIME,
+    'csv': "text/csv",
+    'parquet': "application/vnd.apache.parquet",
+}
+
+# Exports smaller than this stay in memory, larger ones spill to a temp file
+SPOOL_MAX_SIZE = 16 * 1024 * 1024
+CHUNK_ROWS = 10_000
+EXCEL_MAX_ROWS = 1_048_575  # data rows below the header row
+
+XLSX_OPTIONS = {
+    'constant_memory': True,
+    'nan_inf_to_errors': True,
+    'remove_timezone': True,
+    'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+}
+
+EXCEL_TYPES = (str, bool, int, float, decimal.Decimal, datetime.date, datetime.datetime, datetime.time)
+
+
+def available_formats():
+    return [fmt for fmt in EXPORT_FORMATS if fmt != 'parquet' or engine_available('pyarrow')]
+
+
+def export_file_name(file_name, fmt):
+    return f"{os.path.splitext(file_name)[0]}.{fmt}"
+
+
+def output_specs(statement_path, out_dir, fmt=None):
+    """ReconciliationResult attribute -> (path, sheet name, format) for the headless outputs.
+
+    fmt=None keeps the app's defaults: Excel for Tabs 1-2, CSV for the Tab 3 merge.
+    """
+    stem = os.path.splitext(os.path.basename(statement_path))[0]
+    specs = {
+        'merged_df': (f"{stem}_Initial_Merged_Statement_Estimates", 'Merged', 'xlsx'),
+        'rebate_enrichment_df': (f"{stem}_updated_calculations", 'Updated', 'xlsx'),
+        'final_output': (final_output_file_name(statement_path), 'Final Processed', 'xlsx'),
+        'non_ai_df': (f"{stem}_PO_Match_Result", 'PO_Match_Result', 'xlsx'),
+        'merged_remit_df': (f"{stem}_tab3_full_merged_output", 'Remittance Merge', 'csv'),
+        'duplicate_report': (f"{stem}_duplicate_report", 'Duplicate Report', 'xlsx'),
+        'rebate_scenarios': (f"{stem}_rebate_scenarios", 'Rebate Scenarios', 'xlsx'),
+    }
+    return {
+        attr: (os.path.join(out_dir, export_file_name(name, fmt or default_fmt)), sheet_name, fmt or default_fmt)
+        for attr, (name, sheet_name, default_fmt) in specs.items()
+    }
+
+
+def excel_column(series):
+    # Python values xlsxwriter can write directly; blanks for missing, str() for anything else
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.tz_localize(None) if getattr(series.dt, 'tz', None) else series
+        values = values.astype(object)
+    else:
+        values = series.astype(object)
+    values = values.where(series.notna(), None)
+    return [v if v is None or isinstance(v, EXCEL_TYPES) else str(v) for v in values.tolist()]
+
+
+class ExportStream:
+    """Append DataFrame chunks to one .xlsx/.csv/.parquet output.
+
+    The first chunk fixes the header; later chunks are reindexed to it. format_sheet
+    only applies to xlsx and sees the first chunk, so it should stick to column-level
+    or range-based formatting.
+    """
+
+    def __init__(self, target, fmt='xlsx', sheet_name='Sheet1', format_sheet=None):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format '{fmt}'; choose one of {', '.join(EXPORT_FORMATS)}")
+        self.target = target
+        self.fmt = fmt
+        self.sheet_name = sheet_name
+        self.format_sheet = format_sheet
+        self.columns = None
+        self.rows = 0
+        self._workbook = self._worksheet = self._parquet = None
+
+    def _open(self, df):
+        self.columns = list(df.columns)
+        if self.fmt == 'xlsx':
+            self._workbook = xlsxwriter.Workbook(self.target, XLSX_OPTIONS)
+            self._worksheet = self._workbook.add_worksheet(self.sheet_name)
+            header = self._workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+            if self.format_sheet is not None:
+                self.format_sheet(self._workbook, self._worksheet, df)
+            self._worksheet.write_row(0, 0, [str(col) for col in self.columns], header)
+        elif self.fmt == 'csv':
+            df.iloc[0:0].to_csv(self.target, index=False, encoding='utf-8')
+
+    def write(self, df, chunk_rows=CHUNK_ROWS):
+        if self.columns is None:
+            self._open(df)
+        elif list(df.columns) != self.columns:
+            df = df.reindex(columns=self.columns)
+
+        if self.fmt == 'csv':
+            df.to_csv(self.target, index=False, header=False, mode='a', encoding='utf-8')
+        elif self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self._parquet is None:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                self._parquet = pq.ParquetWriter(self.target, table.schema)
+            else:
+                table = pa.Table.from_pandas(df, schema=self._parquet.schema, preserve_index=False)
+            self._parquet.write_table(table)
+        else:
+            # xlsxwriter skips rows past the sheet's end without raising, so the limit is checked up front
+            if self.rows + len(df) > EXCEL_MAX_ROWS:
+                raise ValueError(
+                    f"{self.sheet_name}: {self.rows + len(df):,} rows don't fit in an Excel sheet "
+                    f"({EXCEL_MAX_ROWS:,} rows at most); export it as csv or parquet instead"
+                )
+            for start in range(0, len(df), chunk_rows):
+                chunk = df.iloc[start:start + chunk_rows]
+                for values in zip(*(excel_column(chunk.iloc[:, i]) for i in range(chunk.shape[1]))):
+                    self.rows += 1
+                    if self._worksheet.write_row(self.rows, 0, values) == -1:
+                        raise ValueError(f"{self.sheet_name}: row {self.rows:,} could not be written to the sheet")
+            return
+        self.rows += len(df)
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+        if self._parquet is not None:
+            self._parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_xlsx(df, target, sheet_name='Sheet1', format_sheet=None, chunk_rows=CHUNK_ROWS):
+    """Write df row by row with xlsxwriter's constant_memory mode.
+
+    format_sheet(workbook, worksheet, df) may add column widths and conditional
+    formats; row-level formats are not possible once rows have been flushed.
+    """
+    with ExportStream(target, 'xlsx', sheet_name, format_sheet) as stream:
+        stream.write(df, chunk_rows)
+
+
+def write_export(df, target, fmt='xlsx', sheet_name='Sheet1', format_sheet=None):
+    # target is a path or a binary file object
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format '{fmt}'; choose one of {', '.join(EXPORT_FORMATS)}")
+    with stage(f"export {sheet_name} ({fmt})", rows_in=len(df)) as s:
+        if fmt == 'xlsx':
+            write_xlsx(df, target, sheet_name, format_sheet)
+        elif fmt == 'csv':
+            df.to_csv(target, index=False, encoding='utf-8')
+        else:
+            df.to_parquet(target, index=False)
+        s.rows_out = len(df)
+
+
+def export_file(df, fmt='xlsx', sheet_name='Sheet1', format_sheet=None):
+    """Export into a spooled temp file, rewound and ready to read or hand to st.download_button."""
+    f = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    write_export(df, f, fmt, sheet_name, format_sheet)
+    f.seek(0)
+    return f
@@ -0,0 +1,77 @@
+# Sheet formatting applied as ranges (conditional formats, column widths) instead of per-row calls;
+# every function here is a format_sheet(workbook, worksheet, df) building block for export.write_xlsx
+import numpy as np
+import pandas as pd
+from xlsxwriter.utility import xl_col_to_name, xl_range
+
+from .columns import UNMATCHED_ESTIMATES
+
+WIDTH_SAMPLE_ROWS = 2_000
+MAX_COLUMN_WIDTH = 80
+
+HIGHLIGHT_RED = {'bg_color': '#FFCCCC'}
+DUPLICATE_RED = {'bg_color': '#FFC7CE', 'font_color': '#9C0006'}
+
+
+def text_width(series, sample_rows=WIDTH_SAMPLE_ROWS):
+    # Longest rendered value; numbers are measured from their extremes, text from an even sample
+    values = series.dropna()
+    if values.empty:
+        return 3 if series.isna().any() else 0
+    if pd.api.types.is_bool_dtype(values) or pd.api.types.is_datetime64_any_dtype(values):
+        values = values.iloc[[0, -1]]
+    elif pd.api.types.is_numeric_dtype(values):
+        values = pd.Series([values.min(), values.max()], dtype=values.dtype)
+    elif len(values) > sample_rows:
+        values = values.iloc[np.linspace(0, len(values) - 1, sample_rows).astype(int)]
+    width = int(values.astype(str).str.len().max())
+    return max(width, 3) if series.isna().any() else width
+
+
+def column_widths(df, padding=2, sample_rows=WIDTH_SAMPLE_ROWS, max_width=MAX_COLUMN_WIDTH):
+    return [
+        min(max(text_width(df[col], sample_rows), len(str(col))) + padding, max_width)
+        for col in df.columns
+    ]
+
+
+def autofit_columns(workbook, worksheet, df, cell_format=None):
+    fmt = workbook.add_format(cell_format) if isinstance(cell_format, dict) else cell_format
+    for col_num, width in enumerate(column_widths(df)):
+        worksheet.set_column(col_num, col_num, width, fmt)
+
+
+def data_range(df, first_col=0, last_col=None):
+    last_col = df.shape[1] - 1 if last_col is None else last_col
+    return xl_range(1, first_col, max(len(df), 1), last_col)
+
+
+def highlight_rows(workbook, worksheet, df, column, value, cell_format=HIGHLIGHT_RED):
+    """Highlight every data row whose `column` equals `value` with one conditional format."""
+    if column not in df.columns or df.empty:
+        return
+    col_letter = xl_col_to_name(df.columns.get_loc(column))
+    literal = str(value).replace('"', '""')
+    worksheet.conditional_format(data_range(df), {
+        'type': 'formula',
+        'criteria': f'=${col_letter}2="{literal}"',
+        'format': workbook.add_format(cell_format)
+    })
+
+
+def highlight_duplicates(workbook, worksheet, df, columns=('PO', 'ROID'), cell_format=DUPLICATE_RED):
+    """Mark duplicate keys in the first of `columns` present in df."""
+    col_name = next((col for col in columns if col in df.columns), None)
+    if col_name is None or df.empty:
+        return
+    col_idx = df.columns.get_loc(col_name)
+    worksheet.conditional_format(data_range(df, col_idx, col_idx), {
+        'type': 'duplicate',
+        'format': workbook.add_format(cell_format)
+    })
+
+
+def format_step2(workbook, worksheet, df):
+    # The Format script's sheet: centred auto-fit columns, unmatched rows in red
+    autofit_columns(workbook, worksheet, df, {'align': 'center', 'valign': 'vcenter'})
+    highlight_rows(workbook, worksheet, df, 'Match Status', UNMATCHED_ESTIMATES)
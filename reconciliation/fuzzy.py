@@ -0,0 +1,186 @@
+# Secondary matching for 'Still Unmatched' rows: normalized PO/ROID first, then invoice numbers, then VIN + amount.
+# Every tier is a blocked hash lookup, so the work grows with the candidates per block, never with all pairs
+import numpy as np
+import pandas as pd
+
+from .cache import size_of
+from .columns import STILL_UNMATCHED
+from .compute import clean_currency
+from .keyindex import normalize_keys
+
+KEY_TIER = 'Normalized key'
+INVOICE_TIER = 'Invoice no'
+VIN_TIER = 'VIN + amount'
+FUZZY_TIERS = [KEY_TIER, INVOICE_TIER, VIN_TIER]
+TIER_DTYPE = pd.CategoricalDtype(FUZZY_TIERS)
+
+FUZZY_COLS = ['Fuzzy match', 'Fuzzy source', 'Fuzzy PO', 'Fuzzy ROID']
+
+REFERENCE_AMOUNT = 'Payable Amount'
+MAX_BLOCK = 50  # blocks bigger than this (placeholder VINs, 'N/A' invoices) are too vague to match on
+VIN_LENGTH = 17
+
+
+def canonical_keys(values):
+    """normalize_keys, then upper-cased with separators, a letter prefix and leading zeros dropped: 'po-00123' -> '123'."""
+    return canonicalize(normalize_keys(values))
+
+
+def canonicalize(keys):
+    # canonical_keys for keys normalize_keys already went through
+    keys = keys.str.upper().str.replace(r'[^0-9A-Z]', '', regex=True)
+    keys = keys.str.replace(r'^[A-Z]+(?=[0-9])', '', regex=True).str.lstrip('0')
+    return keys.where(keys != '')
+
+
+def vin_keys(values):
+    # Upper-cased, separators dropped; anything that isn't a full VIN is not a usable block
+    keys = pd.Series(values).astype(str).str.upper().str.replace(r'[^0-9A-Z]', '', regex=True)
+    return keys.where(pd.Series(values).notna() & (keys.str.len() == VIN_LENGTH))
+
+
+class Blocks:
+    """Reference rows grouped by block key, CSR style: rows[starts[i]:starts[i] + counts[i]] share keys[i]."""
+
+    def __init__(self, blocks, max_block=MAX_BLOCK):
+        codes, uniques = pd.factorize(pd.Series(blocks).to_numpy())
+        valid = np.flatnonzero(codes >= 0)
+        self.rows = valid[np.argsort(codes[valid], kind='stable')]
+        self.counts = np.bincount(codes[valid], minlength=len(uniques))
+        self.starts = np.cumsum(self.counts) - self.counts
+        self.counts[self.counts > max_block] = 0
+        self.keys = pd.Index(uniques)
+
+    def probe(self, blocks):
+        """(query position, reference row) for every reference row sharing the query's block."""
+        found = self.keys.get_indexer(pd.Series(blocks).to_numpy())
+        hit = np.flatnonzero(found >= 0)
+        counts = self.counts[found[hit]]
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(hit, counts), self.rows[np.repeat(self.starts[found[hit]], counts) + offsets]
+
+
+class FuzzyIndex:
+    """Blocked lookups over the Estimates and rebate query rows, built once and probed per statement."""
+
+    def __init__(self, references, max_block=MAX_BLOCK):
+        # references: (source name, frame) pairs; earlier sources win ties
+        parts = [
+            pd.DataFrame({
+                'source': source,
+                'PO': column(df, 'PO'),
+                'ROID': column(df, 'ROID'),
+                'Invoice no': column(df, 'Invoice no'),
+                'VIN': column(df, 'VIN'),
+                'amount': pd.to_numeric(column(df, REFERENCE_AMOUNT), errors='coerce'),
+            }).reset_index(drop=True)
+            for source, df in references if df is not None
+        ]
+        rows = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=['source', 'PO', 'ROID'])
+        self.sources = rows['source'].to_numpy(dtype=object)
+        self.po = rows['PO'].to_numpy(dtype=object)
+        self.roid = rows['ROID'].to_numpy(dtype=object)
+        self.amounts = rows['amount'].to_numpy(dtype='float64', na_value=np.nan) if parts else np.empty(0)
+        po, roid = normalize_keys(rows['PO']), normalize_keys(rows['ROID'])
+        # Two reference rows are the same job when both keys agree, whichever file they came from
+        self.identity = pd.factorize(po.fillna('') + '|' + roid.fillna(''))[0]
+        self.blocks = {
+            ('key', 'PO'): Blocks(canonicalize(po), max_block),
+            ('key', 'ROID'): Blocks(canonicalize(roid), max_block),
+        }
+        if parts:
+            self.blocks[INVOICE_TIER] = Blocks(canonical_keys(rows['Invoice no']), max_block)
+            self.blocks[VIN_TIER] = Blocks(vin_keys(rows['VIN']), max_block)
+
+    @classmethod
+    def from_references(cls, estimates_df, rebate_enrichment_df=None, max_block=MAX_BLOCK):
+        return cls([('Estimates', estimates_df), ('Query result', rebate_enrichment_df)], max_block)
+
+    def __len__(self):
+        return len(self.po)
+
+    def __sizeof__(self):
+        # The arrays behind the reference rows and blocks, so the stage cache's memory budget sees them
+        return object.__sizeof__(self) + size_of(vars(self))
+
+    def match(self, keys, merge_key, invoices=None, vins=None, amounts=None, tolerance=0.01):
+        """Reference row and tier code per query row, both -1 where no tier found a single candidate."""
+        n = len(keys)
+        ref = np.full(n, -1, dtype='int64')
+        tier = np.full(n, -1, dtype='int64')
+        amounts = None if amounts is None else np.asarray(amounts, dtype='float64')
+        tiers = [
+            (('key', merge_key), canonical_keys(keys), False),
+            (INVOICE_TIER, None if invoices is None else canonical_keys(invoices), False),
+            (VIN_TIER, None if vins is None or amounts is None else vin_keys(vins), True),
+        ]
+        for code, (name, blocks, needs_amount) in enumerate(tiers):
+            todo = np.flatnonzero(ref == -1)
+            if blocks is None or name not in self.blocks or not len(todo):
+                continue
+            query, rows = self.blocks[name].probe(blocks.iloc[todo])
+            query, rows = self._pick(todo[query], rows, amounts, tolerance, needs_amount)
+            ref[query] = rows
+            tier[query] = code
+        return ref, tier
+
+    def _pick(self, query, rows, amounts, tolerance, needs_amount):
+        # Closest amount wins; a query row whose best candidates are different jobs is ambiguous and left alone
+        pairs = pd.DataFrame({'query': query, 'row': rows, 'job': self.identity[rows]})
+        if amounts is not None:
+            diff = np.abs(amounts[query] - self.amounts[rows])
+            pairs['diff'] = np.where(np.isnan(diff), np.inf, diff)
+            if needs_amount:
+                pairs = pairs[pairs['diff'] <= tolerance]
+            pairs = pairs[pairs['diff'] == pairs.groupby('query')['diff'].transform('min')]
+        single = pairs.groupby('query')['job'].transform('nunique') == 1
+        pairs = pairs[single].drop_duplicates('query')
+        return pairs['query'].to_numpy(), pairs['row'].to_numpy()
+
+
+def column(df, col):
+    # A statement column that clashed with an Estimates one comes out of the merge as '<col>_x'
+    for name in (f"{col}_x", col):
+        if name in df.columns:
+            return df[name]
+    return pd.Series(np.nan, index=df.index, dtype=object)
+
+
+def tag_fuzzy_matches(final_output, index, merge_key, amount_col=None, tolerance=0.01):
+    """final_output with FUZZY_COLS after 'Match Status': the tier, file and keys each 'Still Unmatched' row matched.
+
+    amount_col names the statement's amount column, compared with the references' Payable Amount; without
+    it the VIN tier is skipped and amounts don't break ties.
+    """
+    still = final_output['Match Status'] == STILL_UNMATCHED
+    rows = final_output[still]
+    amounts = None
+    if amount_col:
+        if amount_col not in rows.columns and f"{amount_col}_x" not in rows.columns:
+            raise ValueError(f"Amount column '{amount_col}' not found in the statement.")
+        values = column(rows, amount_col)
+        amounts = clean_currency(values).where(values.notna()).to_numpy(dtype='float64')
+    ref, tier = index.match(
+        rows[merge_key], merge_key, column(rows, 'Invoice no'), column(rows, 'VIN'), amounts, tolerance
+    )
+
+    # Positional: the concatenated final output repeats index labels
+    found = ref >= 0
+    positions = np.flatnonzero(still.to_numpy())[found]
+    codes = np.full(len(final_output), -1, dtype='int64')
+    codes[positions] = tier[found]
+    tags = {'Fuzzy match': pd.Categorical.from_codes(codes, dtype=TIER_DTYPE)}
+    for col, values in zip(FUZZY_COLS[1:], (index.sources, index.po, index.roid)):
+        tags[col] = np.full(len(final_output), None, dtype=object)
+        tags[col][positions] = values[ref[found]]
+
+    final_output = final_output.drop(columns=[col for col in FUZZY_COLS if col in final_output.columns])
+    cols = final_output.columns.tolist()
+    at = cols.index('Match Status') + 1 if 'Match Status' in cols else len(cols)
+    for offset, col in enumerate(FUZZY_COLS):
+        final_output.insert(at + offset, col, tags[col])
+    return final_output
+
+
+def fuzzy_match_count(final_output):
+    return int(final_output['Fuzzy match'].notna().sum()) if 'Fuzzy match' in final_output.columns else 0
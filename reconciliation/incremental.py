@@ -0,0 +1,302 @@
+"""Incremental reconciliation backed by a SQLite state store.
+
+Each statement key (PO or ROID) is fingerprinted from every input row that can change
+its output: its statement, estimate and Step 2 rows, plus the Non-AI membership and
+remittance rows of the POs linked to it. A rerun only recomputes keys whose fingerprint
+is new or changed and reuses the stored rows for the rest. Keys never affect each other
+(the chunked mode relies on the same property), so the output and summary match a full run:
+stored rows keep their dtypes and signed zeros, and years are written without a '.0' however
+the merge typed them (engine.stringify_dates).
+"""
+import json
+import logging
+import sqlite3
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from .columns import MATCHED_ESTIMATES, MATCHED_QUERY, STILL_UNMATCHED
+from .duplicates import dedupe_estimates
+from .engine import calculate_rebates, non_ai_index, reconcile, select_estimate_columns, stringify_dates
+from .keyindex import normalize_keys
+from .schema import NON_AI_DTYPE, STATUS_DTYPE
+
+logger = logging.getLogger(__name__)
+
+STORE_VERSION = 2
+KEY_COL = '_key'
+OCC_COL = '_occ'
+SEQ_COL = '_seq'
+# SQLite stores -0.0 as 0.0 (Step 2's Rebate AI of a zero Sub Total); this column names the ones a row had
+NEG_ZERO_COL = '_neg_zero'
+NEG_ZERO_SEP = '\x1f'
+# Categoricals whose categories are fixed rather than whatever the stored rows happen to contain
+FIXED_DTYPES = {'Match Status': STATUS_DTYPE, 'Non AI check': NON_AI_DTYPE}
+SUMMARY_COLS = [MATCHED_ESTIMATES, MATCHED_QUERY, STILL_UNMATCHED, 'Duplicates in Statements', 'Duplicates in Estimates']
+
+# Per-input salts so the same row in two inputs doesn't hash the same
+SALTS = {
+    'statement': 0x9E3779B97F4A7C15, 'estimates': 0xC2B2AE3D27D4EB4F, 'rebate': 0x165667B19E3779F9,
+    'non_ai': 0x27D4EB2F165667C5, 'remittance': 0x85EBCA77C2B2AE63,
+}
+
+
+@dataclass
+class IncrementalResult:
+    stage: str
+    output: pd.DataFrame = None
+    summary: dict = field(default_factory=dict)
+    recomputed: int = 0
+    reused: int = 0
+
+
+def store_keys(series):
+    # Normalized text keys as stored; '' for missing
+    return normalize_keys(series).fillna('')
+
+
+def row_hashes(df, key_col, source):
+    """(key, hash) per row. The row's position within its key is mixed in, so reordering counts as a change."""
+    if df is None or df.empty or key_col not in df.columns:
+        return pd.DataFrame({KEY_COL: pd.Series(dtype=object), 'h': pd.Series(dtype='int64')})
+    keys = store_keys(df[key_col])
+    h = pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+    pos = keys.groupby(keys, sort=False).cumcount().to_numpy().astype('uint64')
+    with np.errstate(over='ignore'):
+        h = (h ^ np.uint64(SALTS[source])) * (pos * np.uint64(2) + np.uint64(1))
+    return pd.DataFrame({KEY_COL: keys.to_numpy(), 'h': h.view('int64')})
+
+
+def combine(hashes):
+    # Wrapping int64 sum per key
+    return hashes.groupby(KEY_COL, sort=False)['h'].sum()
+
+
+def fingerprints(statement_df, estimates_df, enrichment_df, merge_key, non_ai_ref=None, remit_df=None):
+    parts = [
+        row_hashes(statement_df, merge_key, 'statement'),
+        row_hashes(estimates_df, merge_key, 'estimates'),
+        row_hashes(enrichment_df, merge_key, 'rebate'),
+    ]
+
+    if non_ai_ref is not None or remit_df is not None:
+        # Tabs 2-3 look rows up by PO, so link each key to every PO its rows carry
+        links = [
+            pd.DataFrame({KEY_COL: store_keys(df[merge_key]).to_numpy(), 'po': store_keys(df['PO']).to_numpy()})
+            for df in (statement_df, estimates_df, enrichment_df)
+            if df is not None and merge_key in df.columns and 'PO' in df.columns
+        ]
+        if links:
+            links = pd.concat(links, ignore_index=True).drop_duplicates()
+            po_hashes = []
+            if non_ai_ref is not None:
+                pos = links['po'].drop_duplicates()
+                flags = pd.DataFrame({'PO': pos, 'flag': non_ai_ref.contains(pos)})
+                po_hashes.append(row_hashes(flags, 'PO', 'non_ai'))
+            if remit_df is not None:
+                po_hashes.append(row_hashes(remit_df, 'shop_order_id', 'remittance'))
+            po_fp = combine(pd.concat(po_hashes, ignore_index=True))
+            linked = links.merge(po_fp, left_on='po', right_index=True, how='inner')
+            parts.append(linked[[KEY_COL, 'h']])
+
+    return combine(pd.concat(parts, ignore_index=True))
+
+
+def key_summary(result, estimates_df, merge_key):
+    """summarize() broken down per key; the column sums equal summarize()'s counts."""
+    final_keys = store_keys(result.final_output[merge_key])
+    stats = pd.crosstab(final_keys.to_numpy(), result.final_output['Match Status'].to_numpy())
+    stats = stats.reindex(index=final_keys.unique(), columns=SUMMARY_COLS[:3], fill_value=0)
+
+    merged = result.merged_df
+    counts = store_keys(merged.loc[merged['Match Status'] == MATCHED_ESTIMATES, merge_key]).value_counts()
+    stats['Duplicates in Statements'] = counts[counts > 1].reindex(stats.index, fill_value=0)
+
+    est_keys = store_keys(select_estimate_columns(estimates_df)[merge_key])
+    counts = est_keys[est_keys.isin(stats.index)].value_counts()
+    stats['Duplicates in Estimates'] = counts[counts > 1].reindex(stats.index, fill_value=0)
+    return stats.rename_axis(KEY_COL).reset_index()
+
+
+class StateStore:
+    """Per-key fingerprints, summary counts and output rows in one SQLite file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    def config(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'config'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def reset(self, config):
+        with self.conn:
+            self.conn.execute("DROP TABLE IF EXISTS keys")
+            self.conn.execute("DROP TABLE IF EXISTS rows")
+            cols = ", ".join(f'"{col}" INTEGER' for col in SUMMARY_COLS)
+            self.conn.execute(f"CREATE TABLE keys (_key TEXT PRIMARY KEY, fingerprint INTEGER, {cols})")
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('config', ?)", (json.dumps(config),))
+
+    def fingerprints(self):
+        return pd.read_sql("SELECT _key, fingerprint FROM keys", self.conn, index_col=KEY_COL)['fingerprint']
+
+    def _select(self, keys):
+        # Stage the wanted keys in a temp table rather than a huge IN (...) list
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS selected (_key TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM selected")
+        self.conn.executemany("INSERT OR IGNORE INTO selected VALUES (?)", ((k,) for k in keys))
+
+    def _has_rows(self):
+        return self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rows'").fetchone() is not None
+
+    def replace(self, summary, rows, fingerprints):
+        with self.conn:
+            self._select(fingerprints.index)
+            self.conn.execute("DELETE FROM keys WHERE _key IN (SELECT _key FROM selected)")
+            if self._has_rows():
+                self.conn.execute("DELETE FROM rows WHERE _key IN (SELECT _key FROM selected)")
+            summary = summary.set_index(KEY_COL).reindex(fingerprints.index, fill_value=0)
+            summary.insert(0, 'fingerprint', fingerprints)
+            summary.rename_axis(KEY_COL).reset_index().to_sql('keys', self.conn, if_exists='append', index=False)
+            mark_negative_zeros(rows).to_sql('rows', self.conn, if_exists='append', index=False)
+            dtypes = json.dumps({str(col): str(dtype) for col, dtype in rows.dtypes.items()})
+            self.conn.execute("INSERT OR REPLACE INTO meta VALUES ('dtypes', ?)", (dtypes,))
+
+    def load(self, keys):
+        self._select(keys)
+        summary = pd.read_sql("SELECT * FROM keys WHERE _key IN (SELECT _key FROM selected)", self.conn)
+        if not self._has_rows():
+            return summary, pd.DataFrame(columns=[KEY_COL, OCC_COL, SEQ_COL, 'Match Status'])
+        rows = pd.read_sql("SELECT * FROM rows WHERE _key IN (SELECT _key FROM selected)", self.conn)
+        return summary, restore_negative_zeros(self._restore_dtypes(rows))
+
+    def _restore_dtypes(self, rows):
+        # SQLite only keeps INTEGER/REAL/TEXT; cast back to the dtypes the rows were computed with
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'dtypes'").fetchone()
+        for col, dtype in (json.loads(row[0]) if row else {}).items():
+            if col in rows.columns:
+                try:
+                    rows[col] = rows[col].astype(FIXED_DTYPES.get(col, dtype))
+                except (TypeError, ValueError):
+                    pass
+        return rows
+
+    def close(self):
+        self.conn.close()
+
+
+def mark_negative_zeros(rows):
+    """rows with NEG_ZERO_COL listing, per row, the float columns that hold -0.0."""
+    marks = pd.Series('', index=rows.index, dtype=object)
+    for col in rows.columns:
+        if pd.api.types.is_float_dtype(rows[col]):
+            values = rows[col].to_numpy(dtype='float64', na_value=np.nan)
+            negative = (values == 0) & np.signbit(values)
+            if negative.any():
+                marks[negative] += f"{col}{NEG_ZERO_SEP}"
+    return rows.assign(**{NEG_ZERO_COL: marks.where(marks != '')})
+
+
+def restore_negative_zeros(rows):
+    if NEG_ZERO_COL not in rows.columns:
+        return rows
+    marks = rows.pop(NEG_ZERO_COL).dropna().str.rstrip(NEG_ZERO_SEP).str.split(NEG_ZERO_SEP).explode()
+    for col, positions in marks.groupby(marks, sort=False).groups.items():
+        rows.loc[positions, col] = -0.0
+    return rows
+
+
+def occurrences(keys):
+    # Which statement row of its key each row is: 0 for the first, 1 for the next duplicate...
+    return keys.groupby(keys, sort=False).cumcount()
+
+
+def order_like_statement(rows, statement_keys):
+    # A full run lists estimate matches first, then the rest, each in statement order
+    # (a statement row expands into consecutive output rows, hence seq)
+    positions = pd.DataFrame({
+        KEY_COL: statement_keys.to_numpy(), OCC_COL: occurrences(statement_keys).to_numpy(),
+        'pos': np.arange(len(statement_keys)),
+    })
+    order = rows[[KEY_COL, OCC_COL, SEQ_COL]].merge(positions, on=[KEY_COL, OCC_COL], how='left')
+    order['group'] = (rows['Match Status'] != MATCHED_ESTIMATES).to_numpy()
+    idx = order.sort_values(['group', 'pos', SEQ_COL], kind='mergesort').index
+    return rows.iloc[idx].drop(columns=[KEY_COL, OCC_COL, SEQ_COL]).reset_index(drop=True)
+
+
+def reconcile_incremental(statement_df, estimates_df, store_path, merge_key='PO', rebate_df=None,
+                          rebate_percent=0.0, non_ai_df=None, remit_df=None, rebate_enrichment_df=None,
+                          non_ai_ref=None, dedupe=None, remittance_detail=False, remittance_as_of=None):
+    """engine.reconcile that only recomputes keys whose inputs changed since the last run against store_path.
+
+    Only the last stage is kept per key: the remittance merge, else the Non-AI check, else
+    the final output. Changing the merge key, the stages run or any input's columns
+    rebuilds the store from scratch.
+    """
+    if merge_key not in statement_df.columns or merge_key not in estimates_df.columns:
+        raise ValueError(f"Selected key '{merge_key}' not found in both files.")
+    estimates_df = select_estimate_columns(estimates_df)
+    if dedupe:
+        # Deduplicated once up front, so fingerprints and per-key counts see the rows the merge sees
+        estimates_df = dedupe_estimates(estimates_df, merge_key, dedupe)
+    if rebate_enrichment_df is None and rebate_df is not None:
+        rebate_enrichment_df = stringify_dates(calculate_rebates(rebate_df, rebate_percent))
+    if non_ai_ref is None and non_ai_df is not None:
+        non_ai_ref = non_ai_index(non_ai_df)
+
+    stage = 'merged_remit_df' if remit_df is not None else 'non_ai_df' if non_ai_ref is not None else 'final_output'
+    config = {
+        'version': STORE_VERSION, 'merge_key': merge_key, 'stage': stage, 'dedupe': dedupe,
+        'remittance': [remittance_detail, None if remittance_as_of is None else str(remittance_as_of)],
+        'columns': [None if df is None else [str(col) for col in df.columns]
+                    for df in (statement_df, estimates_df, rebate_enrichment_df, remit_df)],
+    }
+
+    store = StateStore(store_path)
+    try:
+        if store.config() != config:
+            logger.info("State store %s was built for other inputs or settings; rebuilding it", store_path)
+            store.reset(config)
+
+        statement_keys = store_keys(statement_df[merge_key])
+        current = fingerprints(statement_df, estimates_df, rebate_enrichment_df, merge_key, non_ai_ref, remit_df)
+        current = current[current.index.isin(statement_keys)]
+        stored = store.fingerprints().astype('Int64').reindex(current.index)
+        changed = current[~(current.astype('Int64') == stored).fillna(False).to_numpy()]
+        logger.info("%d of %d keys new or changed since the last run", len(changed), len(current))
+
+        if len(changed):
+            def subset(df):
+                return None if df is None else df[store_keys(df[merge_key]).isin(changed.index).to_numpy()]
+
+            # Tag statement rows with their occurrence so stored rows can be put back in statement order
+            statement_subset = subset(statement_df.assign(**{OCC_COL: occurrences(statement_keys).to_numpy()}))
+            result = reconcile(
+                statement_subset, subset(estimates_df), merge_key=merge_key,
+                rebate_enrichment_df=subset(rebate_enrichment_df), non_ai_ref=non_ai_ref, remit_df=remit_df,
+                remittance_detail=remittance_detail, remittance_as_of=remittance_as_of,
+            )
+            if result.final_output is None:
+                # Unmatched rows and no rebate file: reconcile already warned, and nothing is stored
+                return IncrementalResult(stage=stage)
+
+            rows = getattr(result, stage).copy()
+            occ = rows.pop(OCC_COL).to_numpy()
+            rows.insert(0, KEY_COL, store_keys(rows[merge_key]).to_numpy())
+            rows.insert(1, OCC_COL, occ)
+            rows.insert(2, SEQ_COL, rows.groupby([KEY_COL, OCC_COL], sort=False).cumcount().to_numpy())
+            store.replace(key_summary(result, subset(estimates_df), merge_key), rows, changed)
+
+        # Reload fresh rows too, so reused and recomputed rows come back with the same dtypes
+        summary, rows = store.load(current.index)
+        return IncrementalResult(
+            stage=stage,
+            output=order_like_statement(rows, statement_keys),
+            summary={col: int(summary[col].sum()) for col in SUMMARY_COLS},
+            recomputed=len(changed),
+            reused=len(current) - len(changed),
+        )
+    finally:
+        store.close()
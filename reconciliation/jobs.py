@@ -0,0 +1,234 @@
+"""Bounded queue of reconciliation jobs, each run in its own memory-capped worker process.
+
+Used by the HTTP service, but has no web dependencies. Backpressure: once max_pending
+jobs are receiving, queued or running, reserve() raises QueueFull instead of accepting
+more. Memory: a job whose inputs are estimated to exceed memory_limit_mb runs in the
+chunked mode with enough partitions to fit, and every worker process is started with
+an address-space limit, so a job that still overruns fails alone with MemoryError
+instead of taking the machine down. Workers are replaced after every job, which hands
+their memory back to the OS.
+"""
+import concurrent.futures
+import importlib
+import logging
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+
+from .chunked import partitions_for, reconcile_chunked
+from .cli import write_outputs
+from .columns import non_ai_cols, rebate_input_cols, required_cols, required_remit_cols
+from .engine import reconcile
+from .readers import read_table
+from .rollup import RollupCube, file_token, run_name, run_rows
+
+logger = logging.getLogger(__name__)
+
+RECEIVING = 'receiving'
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 8
+DEFAULT_JOB_MEMORY_MB = 2048
+# Finished jobs and their files are dropped after this long
+DEFAULT_RETENTION_SECONDS = 24 * 60 * 60
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    dir: str
+    status: str = RECEIVING
+    inputs: dict = field(default_factory=dict)
+    params: dict = field(default_factory=dict)
+    submitted: float = field(default_factory=time.time)
+    finished: float = None
+    summary: dict = field(default_factory=dict)
+    outputs: dict = field(default_factory=dict)
+    mode: str = None
+    error: str = ''
+    future: object = field(default=None, repr=False)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'mode': self.mode,
+            'submitted': self.submitted,
+            'finished': self.finished,
+            'summary': self.summary,
+            'outputs': sorted(self.outputs),
+            'error': self.error,
+        }
+
+
+def limit_memory(memory_limit_mb):
+    # Worker initializer: cap the address space at what the imports already use plus the job budget
+    try:
+        import resource
+    except ImportError:
+        return
+    if not memory_limit_mb or not os.path.exists('/proc/self/statm'):
+        return
+    # Imported up front: counted in the baseline, not the job budget
+    for module in ('openpyxl', 'pandas', 'xlsxwriter'):
+        importlib.import_module(module)
+
+    with open('/proc/self/statm') as f:
+        baseline = int(f.read().split()[0]) * os.sysconf('SC_PAGE_SIZE')
+    limit = baseline + int(memory_limit_mb * 1024 * 1024)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def run_job(job_dir, inputs, params, memory_limit_mb=None):
+    """Reconcile one job's saved inputs into job_dir/out; returns summary, mode and output paths."""
+    out_dir = os.path.join(job_dir, 'out')
+    merge_key = params.get('merge_key', 'PO')
+    rebate_percent = params.get('rebate_percent', 0.0)
+    fmt = params.get('output_format')
+    dedupe = params.get('dedupe')
+    remittance_detail = params.get('remittance_detail', False)
+    remittance_as_of = params.get('remittance_as_of')
+    found_in = params.get('found_in', False)
+    # Cube the job's totals go to, under rollup_run or the statement's file name and content token
+    rollup = params.get('rollup')
+    cube_run = None
+    if rollup:
+        cube_run = run_name(inputs['statement'], params.get('rollup_run'), file_token(inputs['statement']))
+
+    partitions = partitions_for(inputs.values(), memory_limit_mb) if memory_limit_mb else 1
+    if partitions > 1:
+        run = reconcile_chunked(
+            inputs['statement'], inputs['estimates'], out_dir, merge_key=merge_key,
+            rebate=inputs.get('rebate'), rebate_percent=rebate_percent, non_ai=inputs.get('non_ai'),
+            remittance=inputs.get('remittance'), partitions=partitions, work_dir=job_dir, fmt=fmt, dedupe=dedupe,
+            remittance_detail=remittance_detail, remittance_as_of=remittance_as_of, rollup=bool(rollup),
+            found_in=found_in,
+        )
+        if run.get('rollup') is not None:
+            RollupCube(rollup).replace(cube_run, run['rollup'])
+        return {'mode': f'chunked ({partitions} partitions)', 'summary': run['summary'], 'outputs': run['outputs']}
+
+    remit_df = read_table(inputs['remittance'], columns=required_remit_cols) if inputs.get('remittance') else None
+    result = reconcile(
+        read_table(inputs['statement']),
+        read_table(inputs['estimates'], columns=required_cols),
+        merge_key=merge_key,
+        rebate_df=read_table(inputs['rebate'], columns=rebate_input_cols) if inputs.get('rebate') else None,
+        rebate_percent=rebate_percent,
+        non_ai_df=read_table(inputs['non_ai'], columns=non_ai_cols) if inputs.get('non_ai') else None,
+        remit_df=remit_df,
+        dedupe=dedupe,
+        remittance_detail=remittance_detail,
+        remittance_as_of=remittance_as_of,
+        found_in=found_in,
+    )
+    outputs = write_outputs(result, inputs['statement'], out_dir, fmt)
+    if rollup and result.final_output is not None:
+        RollupCube(rollup).update(cube_run, run_rows(
+            result.final_output, result.merged_remit_df, remit_df, remittance_detail, remittance_as_of
+        ))
+    return {'mode': 'in-memory', 'summary': result.summary, 'outputs': outputs}
+
+
+class JobQueue:
+    def __init__(self, root_dir=None, workers=DEFAULT_WORKERS, max_pending=DEFAULT_MAX_PENDING,
+                 memory_limit_mb=DEFAULT_JOB_MEMORY_MB, retention_seconds=DEFAULT_RETENTION_SECONDS):
+        self.root_dir = root_dir or tempfile.mkdtemp(prefix="reconcile-jobs-")
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.workers = workers
+        self.max_pending = max_pending
+        self.memory_limit_mb = memory_limit_mb
+        self.retention_seconds = retention_seconds
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        # spawn: max_tasks_per_child needs it, and workers shouldn't inherit the server's memory
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=mp.get_context('spawn'), max_tasks_per_child=1,
+            initializer=limit_memory, initargs=(self.memory_limit_mb,),
+        )
+
+    def active(self):
+        return sum(job.status not in FINISHED for job in self.jobs.values())
+
+    def reserve(self):
+        """Claim a slot and a directory for a new job's uploads; raises QueueFull when at capacity."""
+        with self._lock:
+            self._prune()
+            if self.active() >= self.max_pending:
+                raise QueueFull(f"{self.max_pending} jobs already pending; retry later")
+            job_id = uuid.uuid4().hex
+            job = Job(id=job_id, dir=os.path.join(self.root_dir, job_id))
+            os.makedirs(job.dir)
+            self.jobs[job_id] = job
+            return job
+
+    def submit(self, job, inputs, params):
+        job.inputs, job.params = inputs, params
+        with self._lock:
+            job.status = QUEUED
+            job.future = self._pool.submit(run_job, job.dir, inputs, params, self.memory_limit_mb)
+        job.future.add_done_callback(lambda future: self._finish(job, future))
+        return job
+
+    def _finish(self, job, future):
+        try:
+            run = future.result()
+            job.summary, job.mode = run['summary'], run['mode']
+            job.outputs = {os.path.basename(path): path for path in run['outputs']}
+            job.status = DONE
+        except concurrent.futures.CancelledError:
+            job.status, job.error = FAILED, "cancelled"
+        except MemoryError:
+            job.status, job.error = FAILED, f"exceeded the {self.memory_limit_mb} MB per-job memory limit"
+        except BrokenProcessPool:
+            job.status, job.error = FAILED, "worker process died"
+            with self._lock:
+                # A killed worker breaks the whole pool; jobs still queued in it fail the same way
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = self._new_pool()
+        except Exception as e:
+            logger.exception("Job %s failed", job.id)
+            job.status, job.error = FAILED, str(e)
+        job.finished = time.time()
+
+    def get(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None and job.status == QUEUED and job.future.running():
+            job.status = RUNNING
+        return job
+
+    def discard(self, job_id):
+        # Cancels a job that hasn't started and removes its files; a running job is left to finish
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None or (job.future is not None and not job.future.cancel() and not job.future.done()):
+                return False
+            del self.jobs[job_id]
+        shutil.rmtree(job.dir, ignore_errors=True)
+        return True
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        for job_id in [job.id for job in self.jobs.values() if job.finished and job.finished < cutoff]:
+            shutil.rmtree(self.jobs.pop(job_id).dir, ignore_errors=True)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,100 @@
+# Hash index over the PO/ROID keys of a reference file, built once and probed with vectorized lookups
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cache import size_of
+
+# Integral keys above this can't round-trip through float64 and are left as text
+MAX_EXACT_INT = 2 ** 53
+
+
+def normalize_keys(values):
+    """Strip keys and write integral numbers as plain ints, so 1001, 1001.0 and ' 1001' all agree.
+
+    Missing keys come back as NaN and never match.
+    """
+    values = pd.Series(values)
+    keys = values.astype(str).str.strip().where(values.notna())
+    num = pd.to_numeric(keys, errors='coerce')
+    integral = num.notna() & (num.abs() < MAX_EXACT_INT) & (num == np.floor(num))
+    if integral.any():
+        keys = keys.mask(integral, num[integral].astype('int64').astype(str))
+    return keys.where(keys != '')
+
+
+class KeyIndex:
+    def __init__(self, keys, name=None):
+        self.name = name
+        keys = normalize_keys(keys).dropna()
+        self.keys = pd.Index(pd.unique(keys.to_numpy()))
+
+    @classmethod
+    def from_frame(cls, df, key='PO', name=None):
+        if key not in df.columns:
+            raise ValueError(f"'{key}' column not found in {name or 'reference'} file.")
+        return cls(df[key], name=name)
+
+    def contains(self, keys):
+        # Boolean array aligned with keys; the hash table is built once on first lookup and reused
+        return self.keys.get_indexer(normalize_keys(keys)) != -1
+
+    def save(self, path):
+        np.save(path, self.keys.to_numpy(dtype=str))
+
+    @classmethod
+    def load(cls, path, name=None):
+        index = cls.__new__(cls)
+        index.name = name
+        index.keys = pd.Index(np.load(path))
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __sizeof__(self):
+        # The arrays behind the index, so the stage cache's memory budget sees them
+        return object.__sizeof__(self) + size_of(vars(self))
+
+
+def index_file(path, key='PO', name=None, cache_dir=None):
+    """KeyIndex over one column of a reference file, read in chunks so only the keys are held.
+
+    With cache_dir the index is saved there and loaded instead of re-reading the file for as long as
+    the file keeps its size and modification time.
+    """
+    cached = None
+    if cache_dir:
+        stat = os.stat(path)
+        digest = hashlib.sha1(repr((os.path.abspath(path), stat.st_size, stat.st_mtime_ns, key)).encode())
+        cached = os.path.join(cache_dir, f"{digest.hexdigest()}.npy")
+        if os.path.exists(cached):
+            return KeyIndex.load(cached, name=name)
+    from .readers import iter_table  # readers -> schema -> keyindex, so not at module level
+
+    keys = [chunk[key] for chunk in iter_table(path, columns=[key]) if key in chunk.columns]
+    if not keys:
+        raise ValueError(f"'{key}' column not found in {name or 'reference'} file.")
+    index = KeyIndex(pd.concat(keys, ignore_index=True), name=name)
+    if cached:
+        os.makedirs(cache_dir, exist_ok=True)
+        index.save(cached)
+    return index
+
+
+def matched_references(keys, indexes, sep=', '):
+    """Name every reference index each key is found in, e.g. 'Non-AI, Remittance'; '' if none."""
+    keys = pd.Series(keys)
+    codes = np.zeros(len(keys), dtype='int64')
+    for bit, index in enumerate(indexes):
+        codes |= index.contains(keys).astype('int64') << bit
+
+    # One label per distinct combination instead of one join per row
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    labels = np.array(
+        [sep.join(index.name for bit, index in enumerate(indexes) if code >> bit & 1) for code in uniq],
+        dtype=object
+    )
+    return pd.Series(labels[inverse], index=keys.index)
@@ -0,0 +1,161 @@
+# Streamlit panels shared by the apps
+import json
+import os
+
+import streamlit as st
+
+from .artifacts import ArtifactStore
+from .cache import StageCache, token
+from .preview import PAGE_SIZES, disputed_column, filter_options, page, page_count, summarize_frame, view_positions
+from .profiling import MB, Profiler
+from .refstore import open_store
+from .rollup import DIMS, MEASURES, open_cube
+
+
+@st.cache_resource
+def shared_stage_cache():
+    # One per server process: every app and session on it reuses the same parsed uploads and stage results
+    return StageCache()
+
+
+@st.cache_resource
+def artifact_store():
+    # Tab results of every session; RECONCILE_SESSION_MEMORY_MB caps what stays in memory before spilling to disk
+    return ArtifactStore(max_bytes=int(float(os.environ.get("RECONCILE_SESSION_MEMORY_MB", 1024)) * MB))
+
+
+def keep(name, key, df, base=None):
+    """Store df as this session's `name`; base is the key of the artifact it was derived from."""
+    st.session_state[name] = (artifact_store().put(key, df), base)
+
+
+def kept(name, base=None):
+    """(key, frame) of this session's `name`, or (None, None); with base, only if it derives from that artifact."""
+    key, kept_base = st.session_state.get(name, (None, None))
+    if key is None or (base is not None and kept_base != base):
+        return None, None
+    df = artifact_store().get(key)
+    return (key, df) if df is not None else (None, None)
+
+
+def reference_store():
+    """The reference store named in the sidebar (RECONCILE_REFERENCE_STORE by default), or None."""
+    path = st.sidebar.text_input(
+        "🗄️ Reference store", value=os.environ.get("RECONCILE_REFERENCE_STORE", ""), key="reference_store",
+        help="SQLite file built with `python -m reconciliation --reference-store STORE --ingest DATASET FILE`; "
+             "references not uploaded are fetched from it for the statement's keys"
+    ).strip()
+    store = open_store(path)
+    if path and store is None:
+        st.sidebar.warning(f"⚠️ No reference store at {path}")
+    return store
+
+
+def rollup_cube():
+    """The rollup cube named in the sidebar (RECONCILE_ROLLUP by default), or None."""
+    path = st.sidebar.text_input(
+        "📈 Rollup cube", value=os.environ.get("RECONCILE_ROLLUP", ""), key="rollup_cube",
+        help="SQLite file of totals per vendor, appointment month, match status and AP status; each statement "
+             "processed here replaces its earlier totals in it"
+    ).strip()
+    return open_cube(path)
+
+
+def rollup_run_name():
+    """The run name typed in the sidebar, or None for the statement's file name and content token."""
+    return st.sidebar.text_input(
+        "📈 Rollup run name", key="rollup_run",
+        help="Name this statement's totals are kept under; give a corrected statement the name of the one it "
+             "replaces. By default the file name and a token of its content, so files sharing a name stay apart"
+    ).strip() or None
+
+
+def rollup_panel(cube, key="rollup"):
+    """Totals and month-over-month changes read from the cube, never from the row-level outputs."""
+    with st.expander("📈 Vendor / month rollup", expanded=False):
+        runs = cube.runs()
+        if runs.empty:
+            st.caption("The cube is empty; process a statement to add its totals.")
+            return
+        st.caption(f"{len(runs)} statements, {int(runs['rows'].sum()):,} rows")
+        cols = st.columns(2)
+        by = cols[0].multiselect("Group by", DIMS, default=['Vendor Name'], key=f"{key}_by")
+        statuses = cols[1].multiselect(
+            "Match Status", cube.query(by=['Match Status'])['Match Status'].dropna(), key=f"{key}_status"
+        )
+        where = {'Match Status': statuses}
+        st.dataframe(cube.query(by=by, where=where), hide_index=True)
+
+        others = [dim for dim in DIMS if dim not in ('Appointment year', 'Appointment month')]
+        cols = st.columns(2)
+        measure = cols[0].selectbox("Month over month", MEASURES, index=MEASURES.index('Disputed amount'),
+                                    key=f"{key}_measure")
+        mom_by = cols[1].selectbox("Per", others, key=f"{key}_mom_by")
+        st.dataframe(cube.month_over_month(measure, by=mom_by, where=where), hide_index=True)
+
+
+def preview(df, key, data_key=None):
+    """Filterable, sortable page of df; only the visible rows are sent to the browser.
+
+    data_key identifies df's content (a StageCache key) so the options, summary and filtered views are
+    computed once per stage and setting; without it df is hashed on every rerun.
+    """
+    cache = shared_stage_cache()
+    data_key = data_key or token(df)
+    _, summary = cache.stage("preview_summary", (data_key,), lambda: summarize_frame(df))
+    _, options = cache.stage("preview_options", (data_key,), lambda: filter_options(df))
+    st.caption(" · ".join(f"{name}: {value:,}" for name, value in summary.items()))
+
+    cols = st.columns(len(options) + 1)
+    filters = {
+        name: tuple(col.multiselect(name, values, key=f"{key}_filter_{name}"))
+        for col, (name, values) in zip(cols, options.items())
+    }
+    disputed_only = disputed_column(df) is not None and cols[-1].checkbox("Disputed only", key=f"{key}_disputed")
+    sort_cols = st.columns([3, 1, 1, 1])
+    sort_by = sort_cols[0].selectbox(
+        "Sort by", [None, *df.columns], key=f"{key}_sort",
+        format_func=lambda col: "Original order" if col is None else col
+    )
+    ascending = sort_cols[1].checkbox("Ascending", value=True, key=f"{key}_ascending")
+    page_size = sort_cols[2].selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+
+    settings = (data_key, repr(filters), disputed_only, repr(sort_by), ascending)
+    _, positions = cache.stage(
+        "preview_view", settings, lambda: view_positions(df, filters, disputed_only, sort_by, ascending)
+    )
+    pages = page_count(len(positions), page_size)
+    if st.session_state.get(f"{key}_view") != (settings, page_size):
+        # Back to the first page whenever the rows shown change
+        st.session_state[f"{key}_view"] = (settings, page_size)
+        st.session_state[f"{key}_page"] = 1
+    number = int(sort_cols[3].number_input(
+        f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_page"
+    ))
+    st.dataframe(page(df, positions, number, page_size))
+    start = (number - 1) * page_size
+    st.caption(
+        f"Rows {min(start + 1, len(positions)):,}-{min(start + page_size, len(positions)):,} of {len(positions):,}"
+        + (f" (filtered from {len(df):,})" if len(positions) != len(df) else "")
+    )
+
+
+def profile_panel(profiler, key="profile"):
+    """Collapsible table of the stages that ran on this rerun, plus the trace download."""
+    with st.expander("⏱️ Performance profile", expanded=False):
+        if not profiler.records:
+            st.caption("No stage ran on this rerun; everything came from the cache.")
+            return
+        frame = profiler.frame()
+        st.caption(f"{len(frame)} stages, {frame['seconds'].sum():.2f}s in total")
+        st.dataframe(frame, hide_index=True)
+        st.download_button(
+            "📥 Download trace (chrome://tracing, Perfetto)", json.dumps(profiler.chrome_trace()),
+            file_name=f"{profiler.run}_profile_trace.json", mime="application/json", key=f"{key}_trace"
+        )
+
+
+def start_profile(run):
+    """Profiler for this rerun; per-stage memory tracing is opt-in from the sidebar since it slows pandas down."""
+    trace_memory = st.sidebar.checkbox("Trace memory per stage (slower)", key=f"{run}_trace_memory")
+    return Profiler(run, trace_memory=trace_memory).activate()
@@ -0,0 +1,219 @@
+"""One definition of the Statement ⇄ Estimates ⇄ query results flow behind FC3.py, Statement.py and the Format script.
+
+Each app is a PipelineConfig: how the merge key is chosen, which Estimates columns are kept, the rebate rules,
+whether Query Results are merged by '_QR' suffix and how the output sheet is formatted. STEPS declares every
+stage once with the stages and parameters it reads. Pipeline.get(name) runs a stage and whatever it depends on
+through a StageCache, keyed by the inputs' keys and those parameters only, so apps sharing a cache parse an
+upload once and reuse every intermediate frame they compute identically.
+"""
+import os
+from dataclasses import dataclass, field
+
+from .cache import StageCache, upload_token
+from .columns import MATCHED_ESTIMATES, MATCHED_QUERY, rebate_input_cols, required_cols
+from .compute import CURRENCY_PATTERN
+from .duplicates import analyze_duplicates, dedupe_estimates
+from .engine import (
+    calculate_rebates, enrich_unmatched, final_output_file_name, merge_estimates, merge_query_results, pick_merge_key, po_to_int,
+    stringify_dates, summarize
+)
+from .formatting import format_step2, highlight_duplicates
+from .fuzzy import FuzzyIndex, tag_fuzzy_matches
+from .profiling import timed
+from .readers import read_table
+
+
+@dataclass(frozen=True)
+class PipelineConfig:
+    name: str
+    choose_key: bool = True                 # the user picks PO/ROID; otherwise PO when both files have it, else ROID
+    estimate_cols: tuple = tuple(required_cols)  # read and merged from Estimates; None keeps every column
+    disputed_amount: bool = True
+    currency_pattern: str = CURRENCY_PATTERN
+    rebate_percent: float = 0.0             # default of the Rebate % input
+    blank_fee_cols: bool = False
+    stringify_dates: bool = True            # dates as text in the merged and Step 2 frames
+    po_to_int: bool = True
+    status_labels: dict = field(default_factory=dict)  # display names for the Match Status values
+    status_before: str = None               # move Match Status in front of this column
+    output_name: str = None                 # e.g. 'Step 2 {name}'; None names it like FC3's final output
+    output_sheet: str = 'Final Processed'
+    output_format: object = None            # format_sheet(workbook, worksheet, df) for the Excel output
+
+    @property
+    def project_estimates(self):
+        return self.estimate_cols is not None
+
+    def output_file_name(self, statement_name):
+        if self.output_name:
+            return self.output_name.format(name=statement_name, stem=os.path.splitext(statement_name)[0])
+        return final_output_file_name(statement_name)
+
+
+FC3 = PipelineConfig('FC3')
+
+STATEMENT = PipelineConfig(
+    'Statement', choose_key=False, currency_pattern=r'[$,₹,]', rebate_percent=10.0, blank_fee_cols=True,
+    stringify_dates=False, po_to_int=False, output_format=highlight_duplicates,
+)
+
+STATEMENT_FORMAT = PipelineConfig(
+    'Statement processing', choose_key=False, estimate_cols=None, disputed_amount=False, stringify_dates=False,
+    po_to_int=False, status_labels={MATCHED_ESTIMATES: 'Matched with Estimates ✅',
+                                    MATCHED_QUERY: 'Matched with Query Results ✅'},
+    status_before='Case', output_name='Step 2 {name}', output_sheet='Step 2 Processed', output_format=format_step2,
+)
+
+PIPELINES = {config.name: config for config in (FC3, STATEMENT, STATEMENT_FORMAT)}
+
+
+@dataclass(frozen=True)
+class Source:
+    columns: str = None  # config field or constant naming the columns kept on read
+    dataset: str = None  # reference store dataset read when nothing is uploaded
+
+
+@dataclass(frozen=True)
+class Step:
+    fn: object
+    inputs: tuple = ()                          # stage names, passed positionally
+    params: dict = field(default_factory=dict)  # keyword -> run parameter or config field
+    when: str = None  # parameter that switches the step on; when it is off the first input passes through
+
+
+def final_output(final, po_int=True, dates_as_text=True):
+    """(frame, PO conversion error) for download and the later tabs."""
+    error = None
+    if po_int:
+        try:
+            final = po_to_int(final)
+        except Exception as e:
+            error = str(e)
+    return (stringify_dates(final) if dates_as_text else final), error
+
+
+def duplicate_counts(duplicates, dedupe=None):
+    return duplicates.deduplicated() if dedupe else duplicates
+
+
+def duplicate_report(duplicates):
+    return duplicates.report()
+
+
+def present(df, status_labels=None, status_before=None):
+    # Display names and column order of the Format script's output
+    if status_labels and 'Match Status' in df.columns:
+        df = df.assign(**{'Match Status': df['Match Status'].astype(object).replace(status_labels)})
+    if status_before and status_before in df.columns:
+        cols = df.columns.tolist()
+        cols.insert(cols.index(status_before), cols.pop(cols.index('Match Status')))
+        df = df[cols]
+    return df
+
+
+SOURCES = {
+    'statement': Source(),
+    'estimates': Source('estimate_cols', 'estimates'),
+    'rebate_input': Source(tuple(rebate_input_cols), 'rebate_query'),
+    'query_results': Source(),
+}
+
+STEPS = {
+    'merge_key': Step(pick_merge_key, ('statement', 'estimates'), {'merge_key': 'merge_key'}),
+    'duplicates': Step(analyze_duplicates, ('statement', 'estimates', 'merge_key')),
+    'estimates_deduped': Step(dedupe_estimates, ('estimates', 'merge_key'), {'policy': 'dedupe'}, when='dedupe'),
+    'duplicate_counts': Step(duplicate_counts, ('duplicates',), {'dedupe': 'dedupe'}),
+    'duplicate_report': Step(duplicate_report, ('duplicates',)),
+    'merged': Step(merge_estimates, ('statement', 'estimates_deduped', 'merge_key'),
+                   {'project': 'project_estimates', 'disputed': 'disputed_amount'}),
+    'merged_view': Step(stringify_dates, ('merged',), when='stringify_dates'),
+    'rebates': Step(calculate_rebates, ('rebate_input',), {
+        'rebate_percent': 'rebate_percent', 'currency_pattern': 'currency_pattern', 'blank_fee_cols': 'blank_fee_cols'
+    }),
+    'rebates_view': Step(stringify_dates, ('rebates',), when='stringify_dates'),
+    'enriched': Step(enrich_unmatched, ('merged_view', 'rebates_view', 'merge_key')),
+    'fuzzy_index': Step(FuzzyIndex.from_references, ('estimates_deduped', 'rebates_view')),
+    'fuzzy_tagged': Step(tag_fuzzy_matches, ('enriched', 'fuzzy_index', 'merge_key'), {'amount_col': 'amount_col'},
+                         when='fuzzy'),
+    'summary': Step(summarize, ('enriched', 'merged_view', 'estimates_deduped', 'merge_key', 'duplicate_counts')),
+    'final_output': Step(final_output, ('fuzzy_tagged',), {
+        'po_int': 'po_to_int', 'dates_as_text': 'stringify_dates'
+    }),
+    'query_merged': Step(merge_query_results, ('merged', 'query_results', 'merge_key'), when='query_results'),
+    'step2_output': Step(present, ('query_merged',), {
+        'status_labels': 'status_labels', 'status_before': 'status_before'
+    }),
+}
+
+
+class Pipeline:
+    """One app's run over its uploads; parameters are set as the widgets are read and stages run on get()."""
+
+    def __init__(self, config, cache=None, **params):
+        self.config = config
+        self.cache = cache if cache is not None else StageCache()
+        self.params = params
+        self._runs = {}
+
+    def set(self, **params):
+        # Later stages see the new values; anything already run on this rerun was keyed without them
+        self.params.update(params)
+        self._runs = {name: run for name, run in self._runs.items() if name in SOURCES}
+        return self
+
+    def param(self, name):
+        # Run parameters (widget values, uploads) first, then the config
+        if name in self.params:
+            return self.params[name]
+        return getattr(self.config, name, None)
+
+    def run(self, name):
+        """(key, value) of a stage; the key identifies the value's content for downstream stages and downloads."""
+        if name not in self._runs:
+            self._runs[name] = self._read(name) if name in SOURCES else self._step(name)
+        return self._runs[name]
+
+    def get(self, name):
+        return self.run(name)[1]
+
+    def key(self, name):
+        return self.run(name)[0]
+
+    def stored(self, name):
+        # A reference store dataset stands in for the upload
+        store, dataset = self.params.get('reference_store'), SOURCES[name].dataset
+        return store is not None and dataset is not None and store.has(dataset)
+
+    def _read(self, name):
+        upload = self.params.get(name)
+        columns = SOURCES[name].columns
+        if isinstance(columns, str):
+            columns = self.param(columns)
+        columns = list(columns) if columns is not None else None
+        if upload is None and self.stored(name):
+            return self._fetch(name, columns)
+        if upload is None:
+            raise ValueError(f"No {name.replace('_', ' ')} file uploaded.")
+        return self.cache.stage(
+            "read", (upload_token(upload), upload.name, columns), lambda: read_table(upload, columns=columns)
+        )
+
+    def _step(self, name):
+        step = STEPS[name]
+        if step.when and not self.param(step.when):
+            return self.run(step.inputs[0])
+        upstream = [self.run(dep) for dep in step.inputs]
+        params = {keyword: self.param(source) for keyword, source in step.params.items()}
+        deps = (*[key for key, _ in upstream], *[repr(value) for value in params.values()])
+        return self.cache.stage(
+            name, deps, lambda: timed(name, step.fn, *[value for _, value in upstream], **params)
+        )
+
+    def _fetch(self, name, columns):
+        # Only the stored rows sharing a PO/ROID with the statement; a new ingest changes the store's version
+        store, dataset = self.params['reference_store'], SOURCES[name].dataset
+        statement_key, statement = self.run('statement')
+        return self.cache.stage(
+            "fetch", (store.path, store.version(), dataset, statement_key, columns),
+            lambda: timed(f"fetch {dataset}", store.fetch_for, dataset, statement, columns)
+        )
@@ -0,0 +1,91 @@
+# Filtered, sorted and paged views of a result frame, so the apps send one page to the browser instead of every row.
+# A view is an array of row positions: filtering and sorting run once per stage and setting, paging is a slice
+import numpy as np
+import pandas as pd
+
+from .schema import MONEY_COLS
+
+# Filter name -> the columns it reads, first one present wins ('_x' is the statement's side of a clashing merge)
+FILTER_COLS = {
+    'Match Status': ('Match Status',),
+    'Vendor Name': ('Vendor Name', 'Vendor Name_x', 'Vendor Name_y', 'company'),
+    'Non AI check': ('Non AI check',),
+}
+DISPUTED_COLS = ('Disputed amount', 'disputed_amount')
+
+PAGE_SIZES = [50, 100, 500]
+
+
+def first_column(df, names):
+    return next((name for name in names if name in df.columns), None)
+
+
+def filter_options(df):
+    """Filter name -> the values it can take in df, for the filters whose column df has."""
+    options = {}
+    for name, cols in FILTER_COLS.items():
+        col = first_column(df, cols)
+        if col is not None:
+            values = df[col]
+            # A categorical already knows its values; only other columns need a pass over the rows
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                options[name] = sorted(values.cat.categories, key=str)
+            else:
+                options[name] = sorted(values.dropna().unique(), key=str)
+    return options
+
+
+def disputed_column(df):
+    return first_column(df, DISPUTED_COLS)
+
+
+def numbers(series):
+    return series if pd.api.types.is_numeric_dtype(series) else pd.to_numeric(series, errors='coerce')
+
+
+def summarize_frame(df):
+    """Row count, rows per Match Status and the totals of the money columns, computed once per stage."""
+    summary = {'Rows': len(df)}
+    if 'Match Status' in df.columns:
+        counts = df['Match Status'].value_counts(sort=False)
+        summary.update({str(status): int(count) for status, count in counts.items() if count})
+    for col in MONEY_COLS:
+        if col in df.columns:
+            summary[f"Total {col}"] = round(float(numbers(df[col]).sum()), 2)
+    return summary
+
+
+def view_positions(df, filters=None, disputed_only=False, sort_by=None, ascending=True):
+    """Positions of the rows that pass filters ({filter name: allowed values}), in sort_by order."""
+    keep = np.ones(len(df), dtype=bool)
+    for name, allowed in (filters or {}).items():
+        col = first_column(df, FILTER_COLS[name])
+        if allowed and col is not None:
+            keep &= df[col].isin(allowed).to_numpy()
+    disputed = disputed_column(df)
+    if disputed_only and disputed is not None:
+        keep &= (numbers(df[disputed]).fillna(0) != 0).to_numpy()
+    positions = np.flatnonzero(keep)
+
+    if sort_by is not None and sort_by in df.columns and len(positions):
+        # Positions rather than index labels: a concatenated output repeats labels
+        values = df[sort_by].iloc[positions].reset_index(drop=True)
+        try:
+            order = values.sort_values(ascending=ascending, kind='stable', na_position='last').index
+        except TypeError:
+            # Mixed text and numbers in one column sort as text
+            order = values.astype(str).where(values.notna()).sort_values(
+                ascending=ascending, kind='stable', na_position='last'
+            ).index
+        positions = positions[order.to_numpy()]
+    return positions
+
+
+def page_count(rows, page_size):
+    return max(1, -(-rows // page_size))
+
+
+def page(df, positions, number, page_size):
+    """Rows of page `number` (from 1) of the view; only these are copied."""
+    start = (number - 1) * page_size
+    return df.iloc[positions[start:start + page_size]]
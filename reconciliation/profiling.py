@@ -0,0 +1,176 @@
+"""Per-stage wall time, row counts and memory for a reconciliation run.
+
+Code marks its stages with stage()/timed(); they cost nothing unless a Profiler is
+active in the current context (profiler.activate()). Records can be shown as a
+table, logged as one JSON line per stage and saved as a Chrome/Perfetto trace.
+"""
+import contextvars
+import json
+import logging
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('profiler', default=None)
+
+MB = 1024 * 1024
+
+
+def rss_mb():
+    # Current resident set size; falls back to the high-water mark where /proc isn't available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / MB
+    except OSError:
+        return max_rss_mb()
+
+
+def max_rss_mb():
+    # VmHWM belongs to this process image; ru_maxrss keeps a forking parent's peak across exec
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / MB if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def row_count(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple):
+        counts = [row_count(v) for v in value if isinstance(v, (pd.DataFrame, pd.Series))]
+        return counts[0] if counts else None
+    return None
+
+
+class Stage:
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.peak = 0
+
+
+class Profiler:
+    """Collects one record per stage.
+
+    trace_memory turns on tracemalloc for each stage's peak Python/NumPy allocation;
+    it is accurate but slows pandas down noticeably, so it is off by default and
+    only RSS is sampled. log=True emits every record as a JSON line on this module's logger.
+    """
+
+    def __init__(self, run='reconciliation', trace_memory=False, log=False):
+        self.run = run
+        self.trace_memory = trace_memory
+        self.log = log
+        self.records = []
+        self.started = time.perf_counter()
+        self._stack = []
+        self._lock = threading.Lock()
+
+    def activate(self):
+        _current.set(self)
+        return self
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        current = Stage(name, rows_in)
+        tracing = self.trace_memory
+        if tracing:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            base, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # Keep the enclosing stage's peak before resetting it for this one
+                self._stack[-1].peak = max(self._stack[-1].peak, peak)
+            tracemalloc.reset_peak()
+        self._stack.append(current)
+        start = time.perf_counter()
+        try:
+            yield current
+        finally:
+            seconds = time.perf_counter() - start
+            self._stack.pop()
+            peak_mb = None
+            if tracing and tracemalloc.is_tracing():
+                peak = max(current.peak, tracemalloc.get_traced_memory()[1])
+                peak_mb = round((peak - base) / MB, 3)
+                if self._stack:
+                    self._stack[-1].peak = max(self._stack[-1].peak, peak)
+            self._add({
+                'run': self.run,
+                'stage': name,
+                'start': round(start - self.started, 6),
+                'seconds': round(seconds, 6),
+                'rows_in': current.rows_in,
+                'rows_out': current.rows_out,
+                'peak_mb': peak_mb,
+                'rss_mb': round(rss_mb(), 1),
+                'depth': len(self._stack),
+            })
+
+    def _add(self, record):
+        with self._lock:
+            self.records.append(record)
+        if self.log:
+            logger.info(json.dumps({'event': 'stage', **record}))
+
+    def call(self, name, fn, *args, **kwargs):
+        rows = [row_count(arg) for arg in (*args, *kwargs.values())]
+        rows = [r for r in rows if r is not None]
+        with self.stage(name, rows_in=sum(rows) if rows else None) as s:
+            result = fn(*args, **kwargs)
+            s.rows_out = row_count(result)
+        return result
+
+    def frame(self):
+        columns = ['stage', 'seconds', 'rows_in', 'rows_out', 'peak_mb', 'rss_mb', 'start']
+        return pd.DataFrame(self.records, columns=columns)
+
+    def chrome_trace(self):
+        """Complete ("X") events in the Trace Event format read by chrome://tracing and Perfetto."""
+        pid = os.getpid()
+        events = [{
+            'name': r['stage'], 'cat': r['run'], 'ph': 'X', 'pid': pid, 'tid': r['depth'],
+            'ts': int(r['start'] * 1e6), 'dur': int(r['seconds'] * 1e6),
+            'args': {k: r[k] for k in ('rows_in', 'rows_out', 'peak_mb', 'rss_mb') if r[k] is not None},
+        } for r in self.records]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'max_rss_mb': round(max_rss_mb(), 1)}}
+
+    def save_trace(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.chrome_trace(), f)
+        return path
+
+
+def current():
+    return _current.get()
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    profiler = _current.get()
+    if profiler is None:
+        yield Stage(name, rows_in)
+    else:
+        with profiler.stage(name, rows_in) as s:
+            yield s
+
+
+def timed(name, fn, *args, **kwargs):
+    # fn(*args, **kwargs), recorded as a stage when a profiler is active
+    profiler = _current.get()
+    if profiler is None:
+        return fn(*args, **kwargs)
+    return profiler.call(name, fn, *args, **kwargs)
@@ -0,0 +1,153 @@
+import importlib.util
+import logging
+import os
+
+import pandas as pd
+
+from .profiling import timed
+from .schema import apply_schema
+
+logger = logging.getLogger(__name__)
+
+# Fastest first; openpyxl is what pd.read_excel used before and is always the last resort
+EXCEL_ENGINES = ['calamine', 'openpyxl']
+ENGINE_MODULES = {'calamine': 'python_calamine', 'openpyxl': 'openpyxl'}
+
+
+def engine_available(engine):
+    return importlib.util.find_spec(ENGINE_MODULES.get(engine, engine)) is not None
+
+
+def excel_engines():
+    return [engine for engine in EXCEL_ENGINES if engine_available(engine)]
+
+
+def source_name(source):
+    # Paths, Streamlit UploadedFile objects and anything else with a .name
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    return getattr(source, 'name', '') or ''
+
+
+def source_format(source):
+    ext = os.path.splitext(source_name(source))[1].lower()
+    if ext == '.csv':
+        return 'csv'
+    if ext in ('.parquet', '.pq'):
+        return 'parquet'
+    return 'excel'
+
+
+def rewind(source):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+
+def usecols(columns):
+    # Callable form so columns missing from the file are skipped instead of raising;
+    # the stage that needs them reports what is missing
+    if columns is None:
+        return None
+    wanted = set(columns)
+    return lambda col: col in wanted
+
+
+def read_csv(source, columns=None):
+    return pd.read_csv(source, usecols=usecols(columns))
+
+
+def read_parquet(source, columns=None):
+    if columns is None:
+        return pd.read_parquet(source)
+    import pyarrow.parquet as pq
+
+    present = set(pq.read_schema(source).names)
+    rewind(source)
+    return pd.read_parquet(source, columns=[col for col in columns if col in present])
+
+
+def read_excel(source, columns=None, engine=None):
+    # engine=None last lets pandas pick by file type, e.g. xlrd for legacy .xls
+    engines = [engine] if engine else excel_engines() + [None]
+    for i, name in enumerate(engines):
+        rewind(source)
+        try:
+            return pd.read_excel(source, engine=name, usecols=usecols(columns))
+        except Exception as e:
+            if i == len(engines) - 1:
+                raise
+            logger.info("Excel engine %s failed on %s (%s); falling back", name, source_name(source), e)
+
+
+READERS = {
+    'csv': read_csv,
+    'parquet': read_parquet,
+    'excel': read_excel,
+}
+
+
+def read_table(source, columns=None, typed=True):
+    """Read an .xlsx/.csv/.parquet upload or path, keeping only `columns` when given.
+
+    typed applies schema.apply_schema to the known columns.
+    """
+    name = os.path.basename(source_name(source))
+    df = timed(f"read {name}", READERS[source_format(source)], source, columns=columns)
+    return timed(f"type {name}", apply_schema, df) if typed else df
+
+
+def iter_csv(source, columns=None, chunk_rows=100_000):
+    yield from pd.read_csv(source, usecols=usecols(columns), chunksize=chunk_rows)
+
+
+def iter_parquet(source, columns=None, chunk_rows=100_000):
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(source)
+    if columns is not None:
+        columns = [col for col in columns if col in parquet_file.schema_arrow.names]
+    for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+        yield batch.to_pandas()
+
+
+def iter_excel(source, columns=None, chunk_rows=100_000):
+    # openpyxl's read-only mode streams rows instead of loading the whole sheet
+    import openpyxl
+
+    rewind(source)
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = [str(col) if col is not None else f"Unnamed: {i}" for i, col in enumerate(header)]
+        wanted = None if columns is None else set(columns)
+        keep = [i for i, col in enumerate(header) if wanted is None or col in wanted]
+        names = [header[i] for i in keep]
+
+        batch, yielded = [], False
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append([row[i] if i < len(row) else None for i in keep])
+            if len(batch) == chunk_rows:
+                yield pd.DataFrame(batch, columns=names)
+                batch, yielded = [], True
+        if batch or not yielded:
+            # An empty sheet still yields one frame so callers see its columns
+            yield pd.DataFrame(batch, columns=names)
+    finally:
+        workbook.close()
+
+
+CHUNK_READERS = {
+    'csv': iter_csv,
+    'parquet': iter_parquet,
+    'excel': iter_excel,
+}
+
+
+def iter_table(source, columns=None, chunk_rows=100_000):
+    """Yield DataFrames of at most chunk_rows rows; used where a whole file may not fit in memory."""
+    yield from CHUNK_READERS[source_format(source)](source, columns=columns, chunk_rows=chunk_rows)
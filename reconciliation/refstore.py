@@ -0,0 +1,210 @@
+"""Local reference store: estimates, rebate query and remittance exports ingested once into one SQLite file.
+
+Each dataset is a table holding every export ingested so far, plus normalized PO and ROID columns with an
+index on each. A run then fetches only the rows whose keys appear in its statement instead of re-reading
+and merging years of history, so its cost follows the statement's size. Every key-based step only looks at
+rows sharing a key with the statement, which makes the fetched subset give the same result as the full files.
+"""
+import json
+import logging
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+from .cache import token
+from .columns import merge_keys
+from .keyindex import normalize_keys
+
+logger = logging.getLogger(__name__)
+
+PO_COL = '_po'
+ROID_COL = '_roid'
+EXPORT_COL = '_export'
+INTERNAL_COLS = [PO_COL, ROID_COL, EXPORT_COL]
+
+# Dataset -> the columns its PO and ROID keys are read from, first one present wins
+DATASETS = {
+    'estimates': {PO_COL: ('PO',), ROID_COL: ('ROID',)},
+    'rebate_query': {PO_COL: ('PO', 'id'), ROID_COL: ('ROID', 'ai_order_id')},
+    'remittance': {PO_COL: ('shop_order_id',), ROID_COL: ()},
+}
+INSERT_ROWS = 50_000
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def key_values(df, names):
+    for name in names:
+        if name in df.columns:
+            return normalize_keys(df[name]).to_numpy()
+    return None
+
+
+def statement_keys(statement_df):
+    """{'PO': keys, 'ROID': keys} of the statement columns a run can merge on."""
+    return {key: statement_df[key] for key in merge_keys if key in statement_df.columns}
+
+
+class ReferenceStore:
+    """The reference exports in one SQLite file; every call opens its own connection, so one store serves any thread."""
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as conn, conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS exports (id INTEGER PRIMARY KEY, dataset TEXT, token TEXT, name TEXT, "
+                "rows INTEGER, ingested_at TEXT DEFAULT CURRENT_TIMESTAMP, UNIQUE (dataset, token))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path)
+
+    def version(self):
+        # Changes with every ingest, so cached fetches are keyed by it
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COALESCE(MAX(id), 0) FROM exports").fetchone()[0]
+
+    def has(self, dataset):
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM exports WHERE dataset = ? LIMIT 1", (dataset,)).fetchone() is not None
+
+    def exports(self):
+        with closing(self._connect()) as conn:
+            return pd.read_sql("SELECT * FROM exports ORDER BY id", conn)
+
+    def ingest(self, dataset, df, name=None, supersede=False):
+        """Append an export to dataset; returns the rows added, 0 when the same export was ingested before.
+
+        supersede drops the stored rows sharing a PO or ROID with the new export first, for exports that
+        restate earlier rows rather than adding to them.
+        """
+        if dataset not in DATASETS:
+            raise ValueError(f"Unknown dataset '{dataset}'; choose one of {', '.join(DATASETS)}")
+        keys = {col: key_values(df, names) for col, names in DATASETS[dataset].items()}
+        if keys[PO_COL] is None and keys[ROID_COL] is None:
+            names = [name for names in DATASETS[dataset].values() for name in names]
+            raise ValueError(f"No key column ({', '.join(names)}) found in the {dataset} export.")
+        export_token = token(df)
+
+        with closing(self._connect()) as conn, conn:
+            if conn.execute("SELECT 1 FROM exports WHERE dataset = ? AND token = ?", (dataset, export_token)).fetchone():
+                logger.info("%s export %s is already in the store", dataset, name or export_token[:12])
+                return 0
+            export_id = conn.execute(
+                "INSERT INTO exports (dataset, token, name, rows) VALUES (?, ?, ?, ?)",
+                (dataset, export_token, name, len(df))
+            ).lastrowid
+            if self._table_exists(conn, dataset):
+                if supersede:
+                    removed = self._delete_keys(conn, dataset, keys)
+                    logger.info("Superseded %d stored %s rows", removed, dataset)
+                self._add_columns(conn, dataset, df.columns)
+            rows = df.assign(**{col: values for col, values in keys.items() if values is not None}, **{EXPORT_COL: export_id})
+            for start in range(0, len(rows), INSERT_ROWS):
+                rows.iloc[start:start + INSERT_ROWS].to_sql(dataset, conn, if_exists='append', index=False)
+            for col in (PO_COL, ROID_COL):
+                self._add_columns(conn, dataset, [col])
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {quote(f'{dataset}{col}')} ON {quote(dataset)} ({col})")
+            self._merge_dtypes(conn, dataset, df)
+        logger.info("Ingested %d %s rows from %s", len(df), dataset, name or export_token[:12])
+        return len(df)
+
+    def fetch(self, dataset, keys, columns=None):
+        """The stored rows whose PO or ROID is among keys ({'PO': values, 'ROID': values}), in ingestion order.
+
+        columns keeps only those (the ones stored); dtypes are restored to what the exports were read with.
+        """
+        with closing(self._connect()) as conn:
+            if not self._table_exists(conn, dataset):
+                raise ValueError(f"No {dataset} export in the reference store {self.path}.")
+            stored = self._columns(conn, dataset)
+            wanted = [col for col in (stored if columns is None else columns) if col in stored and col not in INTERNAL_COLS]
+            selects = []
+            for key, values in keys.items():
+                col = PO_COL if key == 'PO' else ROID_COL
+                table = f"wanted{col}"
+                conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY)")
+                conn.execute(f"DELETE FROM {table}")
+                # Staged in a temp table rather than a huge IN (...) list
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO {table} VALUES (?)", ((k,) for k in normalize_keys(values).dropna())
+                )
+                selects.append(f"SELECT rowid FROM {quote(dataset)} WHERE {col} IN (SELECT key FROM {table})")
+            if not selects or not wanted:
+                return self._restore_dtypes(conn, dataset, pd.DataFrame(columns=wanted))
+            rows = pd.read_sql(
+                f"SELECT {', '.join(quote(col) for col in wanted)} FROM {quote(dataset)} "
+                f"WHERE rowid IN ({' UNION '.join(selects)}) ORDER BY rowid", conn
+            )
+            return self._restore_dtypes(conn, dataset, rows)
+
+    def fetch_for(self, dataset, statement_df, columns=None):
+        return self.fetch(dataset, statement_keys(statement_df), columns)
+
+    @staticmethod
+    def _table_exists(conn, dataset):
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (dataset,)).fetchone() is not None
+
+    @staticmethod
+    def _columns(conn, dataset):
+        return [row[1] for row in conn.execute(f"PRAGMA table_info({quote(dataset)})")]
+
+    def _add_columns(self, conn, dataset, columns):
+        # A later export may carry columns the earlier ones didn't; their old rows read back as missing
+        stored = set(self._columns(conn, dataset))
+        for col in columns:
+            if str(col) not in stored:
+                conn.execute(f"ALTER TABLE {quote(dataset)} ADD COLUMN {quote(col)}")
+
+    @staticmethod
+    def _delete_keys(conn, dataset, keys):
+        removed = 0
+        for col, values in keys.items():
+            if values is not None:
+                values = pd.Series(values).dropna().unique()
+                conn.execute("CREATE TEMP TABLE IF NOT EXISTS superseded (key TEXT PRIMARY KEY)")
+                conn.execute("DELETE FROM superseded")
+                conn.executemany("INSERT OR IGNORE INTO superseded VALUES (?)", ((k,) for k in values))
+                removed += conn.execute(
+                    f"DELETE FROM {quote(dataset)} WHERE {col} IN (SELECT key FROM superseded)"
+                ).rowcount
+        return removed
+
+    @staticmethod
+    def _merge_dtypes(conn, dataset, df):
+        # SQLite only keeps INTEGER/REAL/TEXT; remember each column's dtype, or object once exports disagree
+        row = conn.execute("SELECT value FROM meta WHERE name = ?", (f"dtypes:{dataset}",)).fetchone()
+        dtypes = json.loads(row[0]) if row else {}
+        for col, dtype in df.dtypes.items():
+            dtype = 'category' if isinstance(dtype, pd.CategoricalDtype) else str(dtype)
+            dtypes[str(col)] = dtype if dtypes.get(str(col), dtype) == dtype else 'object'
+        conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (f"dtypes:{dataset}", json.dumps(dtypes)))
+
+    @staticmethod
+    def _restore_dtypes(conn, dataset, rows):
+        row = conn.execute("SELECT value FROM meta WHERE name = ?", (f"dtypes:{dataset}",)).fetchone()
+        changes = {}
+        for col, dtype in (json.loads(row[0]) if row else {}).items():
+            if col in rows.columns and str(rows[col].dtype) != dtype:
+                try:
+                    changes[col] = rows[col].astype(dtype)
+                except (TypeError, ValueError):
+                    pass
+        return rows.assign(**changes) if changes else rows
+
+
+def open_store(path):
+    """The store at path, or None when there is no such file; the apps treat a missing store as not configured."""
+    return ReferenceStore(path) if path and os.path.exists(path) else None
+
+
+def linked_pos(*frames):
+    # Every PO a run's output can carry: the statement's plus those of the reference rows fetched for it
+    pos = [pd.Series(key_values(df, DATASETS['rebate_query'][PO_COL])) for df in frames if df is not None]
+    pos = [keys for keys in pos if len(keys)]
+    return pd.concat(pos, ignore_index=True) if pos else pd.Series(dtype=object)
@@ -0,0 +1,252 @@
+"""Vendor x month rollup cube: pre-aggregated totals that dashboards query instead of the row-level outputs.
+
+Every run contributes one row per Vendor Name x Appointment year x Appointment month x Match Status x AP status
+with the sums of the money columns and of the Tab 3 paid/disputed amounts. A run is identified by name (the
+statement's file name and a token of its content by default, see run_name): running it again replaces its
+contribution instead of adding to it, and only the cube cells it touches are summed again from the
+contributions, so the totals stay exact however often they are updated. Queries read the cube table, whose size follows vendors x months rather than statement rows.
+"""
+import calendar
+import hashlib
+import logging
+import os
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+
+from .cache import token
+from .engine import merge_remittance
+from .preview import FILTER_COLS, first_column, numbers
+
+logger = logging.getLogger(__name__)
+
+# Dimension -> the output columns it reads, first one present wins
+DIMENSIONS = {
+    'Vendor Name': FILTER_COLS['Vendor Name'],
+    'Appointment year': ('Appointment year',),
+    'Appointment month': ('Appointment month',),
+    'Match Status': ('Match Status',),
+    'AP status': ('AP status', 'ap_status'),
+}
+DIMS = list(DIMENSIONS)
+MEASURES = [
+    'Sub Total', 'Tax Total', 'Rebate AI', 'Amount to pay', 'Disputed amount', 'Dispute analysis',
+    'paid_amount', 'disputed_amount',
+]
+ROWS = 'Rows'
+# Missing dimension values are stored as '' so that they group (SQLite keys treat NULLs as all distinct)
+BLANK = ''
+MISSING_TEXT = {'', 'nan', 'NaN', 'None', 'NaT', '<NA>'}
+CONNECT_TIMEOUT = 30
+TOKEN_CHARS = 12  # of a statement's content token, in default run names
+MONTHS = {name: number for number, name in enumerate(calendar.month_name) if name}
+
+
+def quote(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+DIM_SQL = ', '.join(quote(dim) for dim in DIMS)
+
+
+def dimension_values(series):
+    # Text as the outputs show it ('2024', 'May'); a year read back as a float drops its '.0'
+    text = series.astype(object).where(series.notna(), BLANK).astype(str).str.strip()
+    text = text.str.replace(r'^(\d+)\.0$', r'\1', regex=True)
+    return text.where(~text.isin(MISSING_TEXT), BLANK)
+
+
+def rollup_cells(df):
+    """One row per dimension cell of df with the sums of MEASURES and the row count."""
+    dims = {}
+    for dim, cols in DIMENSIONS.items():
+        col = first_column(df, cols)
+        dims[dim] = dimension_values(df[col]) if col is not None else pd.Series(BLANK, index=df.index)
+    # Missing amounts add 0, as in the Excel pivots this replaces
+    values = {
+        col: numbers(df[col]).fillna(0).astype('float64') if col in df.columns else pd.Series(0.0, index=df.index)
+        for col in MEASURES
+    }
+    frame = pd.DataFrame({**dims, **values, ROWS: 1}, index=df.index)
+    return frame.groupby(DIMS, sort=True, observed=True).sum().reset_index()
+
+
+def combine_cells(frames):
+    # Cells of a run rolled up part by part (the chunked mode's partitions never share a row)
+    frames = [cells for cells in frames if cells is not None]
+    if not frames:
+        return rollup_cells(pd.DataFrame())
+    return pd.concat(frames, ignore_index=True).groupby(DIMS, sort=True).sum().reset_index()
+
+
+def file_token(path, chunk_size=1024 * 1024):
+    # Content hash of a file, read in chunks
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def run_name(statement, name=None, content=None):
+    """The name a run's totals are kept under: name if given, else the statement's file name and content token.
+
+    content is a token of the statement (file_token, upload_token): statements sharing a file name, in two folders
+    or from two users, then keep their own totals, while running the same file again still replaces its own.
+    """
+    if name:
+        return name
+    base = os.path.basename(statement)
+    return f"{base} ({content[:TOKEN_CHARS]})" if content else base
+
+
+def run_rows(final_output, merged_remit_df=None, remit_df=None, detail=False, as_of=None):
+    """The rows a run adds to the cube: one per final output row, with its PO's remittance totals if there are any.
+
+    The aggregated Tab 3 output already is that; a one-row-per-payment output would count a row once per payment,
+    so the totals are joined again from remit_df instead.
+    """
+    if merged_remit_df is not None and not detail:
+        return merged_remit_df
+    if remit_df is not None:
+        return merge_remittance(final_output, remit_df, as_of=as_of)
+    return final_output
+
+
+class RollupCube:
+    """The cube in one SQLite file; every call opens its own connection, so one cube serves any thread."""
+
+    def __init__(self, path):
+        self.path = path
+        dims = ', '.join(f"{quote(dim)} TEXT NOT NULL" for dim in DIMS)
+        measures = ', '.join(f"{quote(col)} REAL NOT NULL" for col in MEASURES)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS runs (run TEXT PRIMARY KEY, token TEXT, rows INTEGER, "
+                "updated_at TEXT DEFAULT CURRENT_TIMESTAMP)"
+            )
+            conn.execute(f"CREATE TABLE IF NOT EXISTS contributions (run TEXT NOT NULL, {dims}, {measures}, "
+                         f"{quote(ROWS)} INTEGER NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS contributions_run ON contributions (run)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS contributions_cell ON contributions ({DIM_SQL})")
+            conn.execute(f"CREATE TABLE IF NOT EXISTS cube ({dims}, {measures}, {quote(ROWS)} INTEGER NOT NULL, "
+                         f"PRIMARY KEY ({DIM_SQL}))")
+
+    def _connect(self):
+        # Batch workers and job processes may update the same cube at once; SQLite serializes the writes
+        return sqlite3.connect(self.path, timeout=CONNECT_TIMEOUT)
+
+    def update(self, run, df):
+        """Replace run's contribution with the rollup of df (the rows from run_rows); False when unchanged."""
+        return self.replace(run, rollup_cells(df))
+
+    def replace(self, run, cells):
+        """Replace run's contribution with cells (from rollup_cells or combine_cells); False when unchanged."""
+        cells_token = token(cells)
+        rows = int(cells[ROWS].sum())
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute("SELECT token FROM runs WHERE run = ?", (run,)).fetchone()
+            if row and row[0] == cells_token:
+                return False
+            touched = self._remove(conn, run)
+            conn.executemany(
+                f"INSERT INTO contributions VALUES (?, {', '.join('?' * (len(DIMS) + len(MEASURES) + 1))})",
+                ((run, *cell) for cell in cells.itertuples(index=False, name=None))
+            )
+            self._resum(conn, touched + cells[DIMS].to_records(index=False).tolist())
+            conn.execute(
+                "INSERT OR REPLACE INTO runs (run, token, rows) VALUES (?, ?, ?)", (run, cells_token, rows)
+            )
+        logger.info("Rollup %s: %d rows in %d cells", run, rows, len(cells))
+        return True
+
+    def remove(self, run):
+        """Take run's contribution out of the cube."""
+        with closing(self._connect()) as conn, conn:
+            self._resum(conn, self._remove(conn, run))
+            conn.execute("DELETE FROM runs WHERE run = ?", (run,))
+
+    def runs(self):
+        with closing(self._connect()) as conn:
+            return pd.read_sql("SELECT * FROM runs ORDER BY updated_at, run", conn)
+
+    def query(self, by=('Vendor Name',), where=None, measures=None):
+        """Totals grouped by the dimensions in by; where is {dimension: allowed values}."""
+        by = list(by)
+        measures = list(measures or MEASURES)
+        unknown = [name for name in [*by, *(where or {})] if name not in DIMS]
+        unknown += [col for col in measures if col not in MEASURES]
+        if unknown:
+            raise ValueError(f"Unknown rollup dimensions or measures: {', '.join(unknown)}")
+        clauses, params = [], []
+        for dim, allowed in (where or {}).items():
+            if allowed:
+                allowed = [BLANK if value is None else str(value) for value in allowed]
+                clauses.append(f"{quote(dim)} IN ({', '.join('?' * len(allowed))})")
+                params += allowed
+        select = [quote(dim) for dim in by] + [f"SUM({quote(col)}) AS {quote(col)}" for col in [*measures, ROWS]]
+        sql = f"SELECT {', '.join(select)} FROM cube"
+        if clauses:
+            sql += f" WHERE {' AND '.join(clauses)}"
+        if by:
+            sql += f" GROUP BY {', '.join(quote(dim) for dim in by)}"
+        with closing(self._connect()) as conn:
+            totals = pd.read_sql(sql, conn, params=params)
+        totals[ROWS] = totals[ROWS].fillna(0).astype('int64')
+        totals = totals.round({col: 2 for col in measures})
+        return self._ordered(totals.replace({dim: {BLANK: None} for dim in by}), by)
+
+    def month_over_month(self, measure='Disputed amount', by='Vendor Name', where=None):
+        """by x 'YYYY-MM' totals of one measure, with the change from the previous month to the latest one."""
+        if by in ('Appointment year', 'Appointment month'):
+            raise ValueError("Month over month compares months; group it by another dimension")
+        totals = self.query(by=[by, 'Appointment year', 'Appointment month'], where=where, measures=[measure])
+        month = totals['Appointment month'].map(MONTHS)
+        totals = totals[totals['Appointment year'].notna() & month.notna()]
+        period = totals['Appointment year'] + '-' + month[totals.index].astype(int).map('{:02d}'.format)
+        table = totals.assign(Month=period).pivot_table(
+            index=by, columns='Month', values=measure, aggfunc='sum', fill_value=0.0, dropna=False
+        )
+        table = table[sorted(table.columns)]
+        if table.shape[1] >= 2:
+            table['Change'] = table.iloc[:, -1] - table.iloc[:, -2]
+        return table.round(2).rename_axis(columns=None).reset_index()
+
+    @staticmethod
+    def _remove(conn, run):
+        # Deletes run's contribution; returns the cells it had, which need summing again
+        cells = conn.execute(f"SELECT {DIM_SQL} FROM contributions WHERE run = ?", (run,)).fetchall()
+        conn.execute("DELETE FROM contributions WHERE run = ?", (run,))
+        return cells
+
+    @staticmethod
+    def _resum(conn, cells):
+        # Sums the given cube cells again from every run's contribution; the other cells are left alone
+        conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS touched ({DIM_SQL}, PRIMARY KEY ({DIM_SQL}))")
+        conn.execute("DELETE FROM touched")
+        conn.executemany(f"INSERT OR IGNORE INTO touched VALUES ({', '.join('?' * len(DIMS))})", cells)
+        match = ' AND '.join(f"c.{quote(dim)} = t.{quote(dim)}" for dim in DIMS)
+        conn.execute(f"DELETE FROM cube WHERE ({DIM_SQL}) IN (SELECT {DIM_SQL} FROM touched)")
+        conn.execute(
+            f"INSERT INTO cube SELECT {', '.join(f'c.{quote(dim)}' for dim in DIMS)}, "
+            f"{', '.join(f'SUM(c.{quote(col)})' for col in [*MEASURES, ROWS])} "
+            f"FROM touched t JOIN contributions c ON {match} GROUP BY {', '.join(f'c.{quote(dim)}' for dim in DIMS)}"
+        )
+
+    @staticmethod
+    def _ordered(totals, by):
+        # Years and months in calendar order rather than as text
+        keys = {
+            'Appointment year': lambda s: pd.to_numeric(s, errors='coerce'),
+            'Appointment month': lambda s: s.map(MONTHS),
+        }
+        if not by or totals.empty:
+            return totals
+        order = totals.sort_values(by, key=lambda s: keys.get(s.name, lambda v: v.astype(str))(s), na_position='last')
+        return order.reset_index(drop=True)
+
+
+def open_cube(path):
+    """The cube at path, created on first use, or None when no path is set."""
+    return RollupCube(path) if path else None
@@ -0,0 +1,139 @@
+# What-if rebate rates over a final output. Every scenario's Rebate AI, Amount to pay, Disputed amount and
+# Dispute analysis come from one rows x scenarios rate matrix: comparing rates is one pass, not one rerun each
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .columns import MATCHED_QUERY
+from .preview import FILTER_COLS, first_column, numbers
+
+SCENARIO_COLS = ['Rebate AI', 'Amount to pay', 'Disputed amount', 'Dispute analysis']
+CURRENT = 'Current'
+UNKNOWN_VENDOR = '(unknown)'
+
+
+def parse_rates(text):
+    """'5, 7.5, 10' -> [5.0, 7.5, 10.0]; rates are percentages like the Rebate % input."""
+    try:
+        return [float(rate) for rate in str(text).replace(';', ',').split(',') if rate.strip()]
+    except ValueError:
+        raise ValueError(f"Rebate rates must be numbers separated by commas, got '{text}'")
+
+
+def vendor_rate_table(df):
+    """A per-vendor rebate table as read: a 'Vendor Name' column plus one column of rebate % per scenario."""
+    if 'Vendor Name' not in df.columns or df.shape[1] < 2:
+        raise ValueError("The rebate table needs a 'Vendor Name' column and one rebate % column per scenario")
+    table = df.set_index(df['Vendor Name'].astype(str).str.strip()).drop(columns=['Vendor Name'])
+    repeated = table.index[table.index.duplicated()].unique()
+    if len(repeated):
+        raise ValueError(f"Vendors listed twice in the rebate table: {', '.join(repeated)}")
+    return table.apply(pd.to_numeric, errors='coerce')
+
+
+def rate_matrix(vendors, rates=None, vendor_rates=None):
+    """(scenario names, rows x scenarios rebate %); NaN where a vendor is missing from the table."""
+    names, blocks = [], []
+    if rates:
+        names += [f"{rate:g}%" for rate in rates]
+        blocks.append(np.broadcast_to(np.asarray(rates, dtype='float64'), (len(vendors), len(rates))))
+    if vendor_rates is not None:
+        codes = vendor_rates.index.get_indexer(vendors.astype(str).str.strip())
+        # A trailing NaN row: vendors missing from the table (code -1) read it and keep their current figures
+        values = np.vstack([vendor_rates.to_numpy(dtype='float64'), np.full(vendor_rates.shape[1], np.nan)])
+        names += [str(col) for col in vendor_rates.columns]
+        blocks.append(values[codes])
+    if not blocks:
+        raise ValueError("Give rebate rates or a per-vendor rebate table")
+    if len(set(names)) != len(names) or CURRENT in names:
+        raise ValueError(f"Scenario names must be unique and not '{CURRENT}': {', '.join(names)}")
+    return names, np.hstack(blocks)
+
+
+@dataclass
+class RebateScenarios:
+    names: list
+    vendors: pd.Series
+    rates: np.ndarray     # rows x scenarios rebate %, NaN where the row keeps its current values
+    sub_total: np.ndarray
+    payable: np.ndarray
+    statement: np.ndarray
+    current: dict         # SCENARIO_COLS -> the row's current values
+
+    def values(self, col):
+        """rows x scenarios values of one of SCENARIO_COLS, Step 2's formulas broadcast over every rate at once."""
+        rebate = self.sub_total[:, None] * (-self.rates / 100.0)
+        if col == 'Rebate AI':
+            computed = rebate
+        elif col == 'Amount to pay':
+            computed = self.payable[:, None] + rebate
+        else:
+            disputed = self.statement[:, None] - (self.payable[:, None] + rebate)
+            computed = disputed if col == 'Disputed amount' else rebate + disputed
+        return np.where(np.isnan(self.rates), self.current[col][:, None], computed)
+
+    def comparison(self):
+        """Totals per scenario and vendor, the current figures first."""
+        codes, vendors = pd.factorize(self.vendors.fillna(UNKNOWN_VENDOR).astype(str), sort=True)
+
+        def totals(values):
+            # Per-vendor sums of every column of values; missing amounts count as 0 like sum() does
+            values = np.nan_to_num(values.reshape(len(codes), -1))
+            return np.column_stack([
+                np.bincount(codes, weights=values[:, i], minlength=len(vendors)) for i in range(values.shape[1])
+            ])
+
+        per_col = {
+            col: np.column_stack([totals(self.current[col]), totals(self.values(col))]) for col in SCENARIO_COLS
+        }
+        scenarios = [CURRENT, *self.names]
+        long = pd.DataFrame({
+            'Scenario': np.repeat(scenarios, len(vendors)),
+            'Vendor Name': np.tile(np.asarray(vendors, dtype=object), len(scenarios)),
+            'Rows': np.tile(np.bincount(codes, minlength=len(vendors)), len(scenarios)),
+            **{col: per_col[col].T.ravel() for col in SCENARIO_COLS},
+        })
+        return long.round({col: 2 for col in SCENARIO_COLS})
+
+    def pivot(self, comparison=None, col='Disputed amount'):
+        """Vendor x scenario totals of one column, with a Total row: the compact view for negotiation prep."""
+        comparison = self.comparison() if comparison is None else comparison
+        table = comparison.pivot(index='Vendor Name', columns='Scenario', values=col)[[CURRENT, *self.names]]
+        table.loc['Total'] = table.sum()
+        return table.rename_axis(columns=None).reset_index()
+
+    def scenario_frame(self, final_output, name):
+        """final_output with SCENARIO_COLS as they would be under scenario `name`, for download."""
+        s = self.names.index(name)
+        return final_output.assign(**{col: self.values(col)[:, s] for col in SCENARIO_COLS})
+
+
+def rebate_scenarios(final_output, rates=None, vendor_rates=None, all_rows=False):
+    """Step 2 recomputed for every scenario over a Tab 1 final output.
+
+    The rates apply where Step 2's rate did, the 'Matched with Query result' rows; all_rows extends them to
+    every row with a Sub Total. Rows a scenario doesn't cover keep their current figures.
+    """
+    missing = [col for col in ('Sub Total', 'Payable Amount', 'Statement amount') if col not in final_output.columns]
+    if missing:
+        raise ValueError(f"Rebate scenarios need the columns: {', '.join(missing)}")
+    vendor_col = first_column(final_output, FILTER_COLS['Vendor Name'])
+    vendors = final_output[vendor_col].astype(object) if vendor_col else pd.Series(np.nan, index=final_output.index)
+    vendors = vendors.reset_index(drop=True)
+    names, rates = rate_matrix(vendors, rates, vendor_rates)
+
+    def column(col):
+        if col not in final_output.columns:
+            return np.full(len(final_output), np.nan)
+        return numbers(final_output[col]).to_numpy(dtype='float64', na_value=np.nan)
+
+    sub_total = column('Sub Total')
+    if not all_rows and 'Match Status' in final_output.columns:
+        query_rows = (final_output['Match Status'] == MATCHED_QUERY).to_numpy()
+        rates = np.where(query_rows[:, None], rates, np.nan)
+    rates = np.where(np.isnan(sub_total)[:, None], np.nan, rates)
+    return RebateScenarios(
+        names=names, vendors=vendors, rates=rates, sub_total=sub_total, payable=column('Payable Amount'),
+        statement=column('Statement amount'), current={col: column(col) for col in SCENARIO_COLS},
+    )
@@ -0,0 +1,123 @@
+# Column types applied once at ingestion: compact keys, categorical labels and cent-rounded money,
+# so later stages can skip their own str/int/Int64 conversion passes
+import numpy as np
+import pandas as pd
+
+from .columns import (
+    MATCHED_ESTIMATES, MATCHED_NON_AI, MATCHED_QUERY, NOT_NON_AI, STILL_UNMATCHED, UNMATCHED_ESTIMATES,
+    column_renames
+)
+from .keyindex import MAX_EXACT_INT
+
+STATUS_DTYPE = pd.CategoricalDtype([MATCHED_ESTIMATES, UNMATCHED_ESTIMATES, MATCHED_QUERY, STILL_UNMATCHED])
+NON_AI_DTYPE = pd.CategoricalDtype([MATCHED_NON_AI, NOT_NON_AI])
+
+KEY_COLS = ['PO', 'ROID', 'id', 'ai_order_id', 'shop_order_id']
+
+MONEY_COLS = [
+    'Statement amount', 'Sub Total', 'Tax Total', 'AI trans Fee', 'FMC Rebate', 'Payable Amount', 'Rebate AI',
+    'Amount to pay', 'Trans fee', 'Merch fee', 'Disputed amount', 'paid_amount', 'disputed_amount',
+    'transaction_fee', 'merch_fee', 'AI Transaction Fee', 'FMC Rebate Amount',
+]
+
+CATEGORY_COLS = [
+    'Vendor Name', 'company', 'Appointment month', 'Status in api', 'Status_in_api', 'AP status', 'ap_status',
+    'dispute_reason',
+]
+
+# Labels repeat a lot; below this share of distinct values a category beats one string per row
+CATEGORY_MAX_UNIQUE = 0.5
+
+# Every source name in column_renames is typed like the column it becomes
+SCHEMA = {
+    **{col: 'key' for col in KEY_COLS},
+    **{col: 'money' for col in MONEY_COLS},
+    **{col: 'category' for col in CATEGORY_COLS},
+}
+SCHEMA.update({old: SCHEMA[new] for old, new in column_renames.items() if new in SCHEMA and old not in SCHEMA})
+
+
+def key_column(series):
+    # Nullable Int64 when every key is an integer, otherwise the keys stay text
+    if pd.api.types.is_integer_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series
+    num = pd.to_numeric(series, errors='coerce')
+    if num.notna().sum() != series.notna().sum() or (num.abs() >= MAX_EXACT_INT).any():
+        return series
+    if not (num.dropna() == np.floor(num.dropna())).all():
+        return series
+    return num.astype('Int64')
+
+
+def mixed_key_column(series):
+    # Text keys with the integral ones as ints, the way a mostly-numeric Excel column reads,
+    # so they still join exactly with an integer key column and only the odd ones miss
+    num = pd.to_numeric(series.astype(str).str.strip(), errors='coerce')
+    integral = num.notna() & (num.abs() < MAX_EXACT_INT) & (num == np.floor(num))
+    values = series.astype(object)
+    values[integral] = num[integral].astype('int64').astype(object)
+    return values
+
+
+def joinable_keys(left, right, key):
+    # pandas won't join text keys with integer ones; the text side gets Excel's mixed int/str form
+    left_numeric = pd.api.types.is_numeric_dtype(left[key])
+    if left_numeric == pd.api.types.is_numeric_dtype(right[key]):
+        return left, right
+    if left_numeric:
+        return left, right.assign(**{key: mixed_key_column(right[key])})
+    return left.assign(**{key: mixed_key_column(left[key])}), right
+
+
+def money_column(series):
+    # Round to cents; integers are already exact and text is only converted when every value parses
+    if pd.api.types.is_integer_dtype(series) or pd.api.types.is_bool_dtype(series):
+        return series
+    if not pd.api.types.is_numeric_dtype(series):
+        num = pd.to_numeric(series, errors='coerce')
+        if num.notna().sum() != series.notna().sum():
+            return series
+        series = num
+    return series.astype('float64').round(2)
+
+
+def category_column(series, max_unique=CATEGORY_MAX_UNIQUE):
+    if isinstance(series.dtype, pd.CategoricalDtype) or pd.api.types.is_numeric_dtype(series):
+        return series
+    if series.nunique() > len(series) * max_unique:
+        return series
+    return series.astype('category')
+
+
+CONVERTERS = {'key': key_column, 'money': money_column, 'category': category_column}
+
+
+def apply_schema(df, schema=SCHEMA):
+    """Type the known columns of df; unknown columns are left as read."""
+    typed = {col: CONVERTERS[schema[col]](df[col]) for col in df.columns if col in schema}
+    changed = {col: values for col, values in typed.items() if values is not df[col]}
+    return df.assign(**changed) if changed else df
+
+
+def as_text(series):
+    # astype(str) for display/export; categories are renamed instead of expanding to one string per row
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.rename_categories([str(c) for c in series.cat.categories])
+    if isinstance(series.dtype, pd.StringDtype):
+        return series
+    return series.astype(str)
+
+
+def memory_report(before, after):
+    """Per-column deep memory of a frame before and after typing, largest savings first."""
+    report = pd.DataFrame({
+        'dtype before': before.dtypes.astype(str),
+        'dtype after': after.dtypes.reindex(before.columns).astype(str),
+        'bytes before': before.memory_usage(index=False, deep=True),
+        'bytes after': after.memory_usage(index=False, deep=True).reindex(before.columns),
+    })
+    report['saved'] = report['bytes before'] - report['bytes after']
+    report = report.sort_values('saved', ascending=False)
+    totals = report[['bytes before', 'bytes after', 'saved']].sum().to_frame('TOTAL').T
+    totals[['dtype before', 'dtype after']] = ''
+    return pd.concat([report, totals]).rename_axis('column')
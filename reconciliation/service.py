@@ -0,0 +1,153 @@
+"""HTTP API over the job queue, for submitting reconciliations without the Streamlit UI.
+
+    pip install fastapi uvicorn python-multipart
+    uvicorn reconciliation.service:app --port 8000
+
+POST /jobs takes the same files as FC3.py Tabs 1-3 and answers 202 with a job id
+(429 when the queue is full). Poll GET /jobs/{id}; once it is done, each output is
+streamed from GET /jobs/{id}/results/{name}. Settings come from the environment:
+RECONCILE_WORKERS, RECONCILE_MAX_PENDING, RECONCILE_JOB_MEMORY_MB, RECONCILE_MAX_UPLOAD_MB,
+RECONCILE_DATA_DIR and RECONCILE_ROLLUP (a rollup cube every job adds its totals to, under
+the rollup_run field or the statement's file name and content token).
+"""
+import datetime
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import FileResponse
+
+from .batch import STATEMENT_EXTENSIONS
+from .columns import merge_keys
+from .duplicates import DEDUPE_POLICIES
+from .export import EXPORT_FORMATS
+from .jobs import (
+    DEFAULT_JOB_MEMORY_MB, DEFAULT_MAX_PENDING, DEFAULT_WORKERS, DONE, JobQueue, QueueFull
+)
+
+MAX_UPLOAD_MB = float(os.environ.get("RECONCILE_MAX_UPLOAD_MB", 200))
+ROLLUP = os.environ.get("RECONCILE_ROLLUP")
+UPLOAD_CHUNK = 1024 * 1024
+RETRY_AFTER_SECONDS = 30
+
+queue = None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global queue
+    queue = JobQueue(
+        root_dir=os.environ.get("RECONCILE_DATA_DIR"),
+        workers=int(os.environ.get("RECONCILE_WORKERS", DEFAULT_WORKERS)),
+        max_pending=int(os.environ.get("RECONCILE_MAX_PENDING", DEFAULT_MAX_PENDING)),
+        memory_limit_mb=float(os.environ.get("RECONCILE_JOB_MEMORY_MB", DEFAULT_JOB_MEMORY_MB)),
+    )
+    yield
+    queue.shutdown()
+
+
+app = FastAPI(title="Statement reconciliation", lifespan=lifespan)
+
+
+async def save_upload(upload, job_dir, field_name):
+    # Streamed to disk in chunks; each field gets its own folder so equal file names don't clash
+    name = os.path.basename(upload.filename or field_name)
+    if not name.lower().endswith(STATEMENT_EXTENSIONS):
+        raise HTTPException(415, f"{field_name}: expected one of {', '.join(STATEMENT_EXTENSIONS)}")
+    path = os.path.join(job_dir, "inputs", field_name, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    size = 0
+    with open(path, "wb") as f:
+        while chunk := await upload.read(UPLOAD_CHUNK):
+            size += len(chunk)
+            if size > MAX_UPLOAD_MB * 1024 * 1024:
+                raise HTTPException(413, f"{field_name} is larger than {MAX_UPLOAD_MB:g} MB")
+            f.write(chunk)
+    return path
+
+
+def job_response(job):
+    body = job.to_dict()
+    body["results"] = {name: f"/jobs/{job.id}/results/{name}" for name in body["outputs"]}
+    return body
+
+
+def get_job(job_id):
+    job = queue.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"No job {job_id}")
+    return job
+
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    statement: UploadFile = File(...),
+    estimates: UploadFile = File(...),
+    rebate: Optional[UploadFile] = File(None),
+    non_ai: Optional[UploadFile] = File(None),
+    remittance: Optional[UploadFile] = File(None),
+    merge_key: str = Form("PO"),
+    rebate_pct: float = Form(0.0),
+    output_format: Optional[str] = Form(None),
+    dedupe: Optional[str] = Form(None),
+    remittance_detail: bool = Form(False),
+    remittance_as_of: Optional[datetime.date] = Form(None),
+    found_in: bool = Form(False),
+    rollup_run: Optional[str] = Form(None),
+):
+    if merge_key not in merge_keys:
+        raise HTTPException(422, f"merge_key must be one of {', '.join(merge_keys)}")
+    if output_format and output_format not in EXPORT_FORMATS:
+        raise HTTPException(422, f"output_format must be one of {', '.join(EXPORT_FORMATS)}")
+    if dedupe and dedupe not in DEDUPE_POLICIES:
+        raise HTTPException(422, f"dedupe must be one of {', '.join(DEDUPE_POLICIES)}")
+    try:
+        job = queue.reserve()
+    except QueueFull as e:
+        raise HTTPException(429, str(e), headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+    uploads = {"statement": statement, "estimates": estimates, "rebate": rebate, "non_ai": non_ai,
+               "remittance": remittance}
+    try:
+        inputs = {name: await save_upload(upload, job.dir, name)
+                  for name, upload in uploads.items() if upload is not None}
+    except BaseException:
+        queue.discard(job.id)
+        raise
+    params = {"merge_key": merge_key, "rebate_percent": rebate_pct, "output_format": output_format, "dedupe": dedupe,
+              "remittance_detail": remittance_detail, "rollup": ROLLUP, "found_in": found_in,
+              "rollup_run": rollup_run,
+              "remittance_as_of": remittance_as_of.isoformat() if remittance_as_of else None}
+    return job_response(queue.submit(job, inputs, params))
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    return job_response(get_job(job_id))
+
+
+@app.get("/jobs/{job_id}/results/{name}")
+async def job_result(job_id: str, name: str):
+    job = get_job(job_id)
+    if job.status != DONE:
+        raise HTTPException(409, f"Job {job_id} is {job.status}")
+    if name not in job.outputs:
+        raise HTTPException(404, f"Job {job_id} has no output {name}")
+    fmt = os.path.splitext(name)[1].lstrip(".")
+    # FileResponse streams the file in chunks instead of loading it
+    return FileResponse(job.outputs[name], media_type=EXPORT_FORMATS.get(fmt), filename=name)
+
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    get_job(job_id)
+    if not queue.discard(job_id):
+        raise HTTPException(409, f"Job {job_id} is running and can't be removed yet")
+    return {"id": job_id, "deleted": True}
+
+
+@app.get("/health")
+async def health():
+    return {"workers": queue.workers, "active_jobs": queue.active(), "max_pending": queue.max_pending,
+            "job_memory_mb": queue.memory_limit_mb}
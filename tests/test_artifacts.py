@@ -0,0 +1,71 @@
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from reconciliation import artifacts
+from reconciliation.artifacts import ArtifactStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    # A budget of one byte keeps only the artifact stored last in memory
+    store = ArtifactStore(max_bytes=1, spill_dir=str(tmp_path))
+    store.put('a', pd.DataFrame({'PO': range(100)}))
+    store.put('b', pd.DataFrame({'PO': range(100, 200)}))
+    return store
+
+
+def test_least_recently_used_artifacts_are_spilled_and_read_back(store):
+    assert (store.in_memory(), store.on_disk(), store.spills) == (1, 1, 1)
+    assert store.get('a')['PO'].tolist() == list(range(100))
+    assert (store.loads, store.on_disk()) == (1, 1)
+    assert 'b' in store and store.get('missing') is None
+
+
+def test_sessions_reading_a_spilled_artifact_at_once(store, monkeypatch):
+    # The first reader is still loading when the second asks; the second must not remove the file under it
+    load = artifacts.load
+
+    def slow_load(path):
+        time.sleep(0.2)
+        return load(path)
+
+    monkeypatch.setattr(artifacts, 'load', slow_load)
+    results, errors = [], []
+
+    def read():
+        try:
+            results.append(store.get('a'))
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=read) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert [df['PO'].tolist() for df in results] == [list(range(100))] * 2
+    assert results[0] is results[1]
+    assert store.loads == 1
+    # 'a' is back in memory and 'b' spilled in its place
+    assert [os.path.splitext(name)[0] for name in os.listdir(store.spill_dir)] == ['b']
+
+
+def test_failed_feather_write_leaves_no_partial_file(tmp_path, monkeypatch):
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.feather as feather
+
+    def partial_write(df, path, **kwargs):
+        with open(path, 'wb') as f:
+            f.write(b'ARROW1')
+        raise pa.ArrowInvalid("mixed types")
+
+    monkeypatch.setattr(feather, 'write_feather', partial_write)
+    path = artifacts.spill(pd.DataFrame({'PO': [1, 'x']}), str(tmp_path / 'a'))
+    assert path.endswith('.pkl')
+    assert os.listdir(tmp_path) == ['a.pkl']
@@ -0,0 +1,53 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from reconciliation.cache import StageCache, size_of, token
+from reconciliation.duplicates import analyze_duplicates
+from reconciliation.fuzzy import FuzzyIndex
+from reconciliation.keyindex import KeyIndex
+
+ROWS = 200_000
+
+
+def test_indexes_are_measured_by_their_arrays():
+    keys = pd.Series(np.arange(ROWS))
+    frame = pd.DataFrame({'PO': keys, 'ROID': keys.astype(str), 'Payable Amount': 1.0})
+    for value in (KeyIndex(keys), FuzzyIndex.from_references(frame), analyze_duplicates(frame, frame, 'PO')):
+        assert size_of(value) > ROWS * 8
+        assert sys.getsizeof(value) > ROWS * 8
+
+
+def test_shared_arrays_are_counted_once():
+    array = np.zeros(1000)
+    assert size_of([array, array]) == array.nbytes
+
+
+def test_large_index_evicts_older_entries():
+    cache = StageCache(max_bytes=ROWS * 8)
+    cache.stage('small', (1,), lambda: pd.DataFrame({'a': range(10)}))
+    assert len(cache) == 1
+    # Over half the budget: it only fits once the older entry is gone
+    cache.stage('index', (2,), lambda: KeyIndex(pd.Series(np.arange(ROWS // 2))))
+    cache.stage('index', (3,), lambda: KeyIndex(pd.Series(np.arange(ROWS // 2, ROWS))))
+    assert len(cache) == 1
+    assert cache.total_bytes <= cache.max_bytes
+
+
+def test_too_large_values_are_not_cached():
+    cache = StageCache(max_bytes=1000)
+    key, value = cache.stage('index', (1,), lambda: KeyIndex(pd.Series(np.arange(ROWS))))
+    assert len(value) == ROWS
+    assert len(cache) == 0
+    assert cache.stage('index', (1,), lambda: None) == (key, None)
+
+
+def test_hits_return_the_cached_value():
+    cache = StageCache()
+    calls = []
+    for _ in range(2):
+        _, value = cache.stage('frame', (token(b'upload'),), lambda: calls.append(1) or pd.DataFrame({'a': [1]}))
+    assert len(calls) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert value['a'].tolist() == [1]
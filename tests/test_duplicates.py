@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from reconciliation.duplicates import analyze_duplicates, dedupe_estimates, fanout_by_vendor
+
+ESTIMATES = pd.DataFrame({
+    'PO': [1, 1, 2, 3, 3, 3],
+    'Vendor Name': ['V1', 'V1', 'V2', 'V3', 'V3', 'V3'],
+    'Appointment date': ['2024-05-02', '2024-05-01', '2024-05-01', None, '2024-04-01', '2024-04-01'],
+    'Sub Total': [10.0, 5.0, 7.0, 1.0, 2.0, None],
+})
+STATEMENT = pd.DataFrame({'PO': [1, 2, 2, 3, 4]})
+
+
+def test_first_keeps_the_first_row_per_key():
+    kept = dedupe_estimates(ESTIMATES, 'PO', 'first')
+    assert kept.index.tolist() == [0, 2, 3]
+
+
+def test_latest_keeps_the_latest_appointment():
+    # Undated rows only win when a key has no dated row; equal dates go to the later row
+    kept = dedupe_estimates(ESTIMATES, 'PO', 'latest')
+    assert kept.index.tolist() == [0, 2, 5]
+
+
+def test_sum_adds_the_amounts_to_the_first_row():
+    kept = dedupe_estimates(ESTIMATES, 'PO', 'sum')
+    assert kept.index.tolist() == [0, 2, 3]
+    assert kept['Sub Total'].tolist() == [15.0, 7.0, 3.0]
+    assert kept['Appointment date'].iloc[:2].tolist() == ['2024-05-02', '2024-05-01']
+    assert ESTIMATES['Sub Total'].iloc[0] == 10.0
+
+
+def test_unique_keys_and_unknown_policies():
+    unique = ESTIMATES.drop_duplicates('PO')
+    assert dedupe_estimates(unique, 'PO', 'sum') is unique
+    with pytest.raises(ValueError, match="Unknown dedupe policy 'last'"):
+        dedupe_estimates(ESTIMATES, 'PO', 'last')
+    with pytest.raises(ValueError, match="'latest' policy needs an 'Appointment date'"):
+        dedupe_estimates(ESTIMATES.drop(columns=['Appointment date']), 'PO', 'latest')
+
+
+def test_analysis_predicts_the_merge():
+    analysis = analyze_duplicates(STATEMENT, ESTIMATES, 'PO')
+    merged = STATEMENT.merge(ESTIMATES, on='PO', how='left')
+    assert (analysis.statement_rows, analysis.merged_rows) == (5, len(merged))
+    assert analysis.duplicated_estimate_keys == 2
+    assert analysis.deduplicated().merged_rows == 5
+
+    report = analysis.report()
+    assert report[['PO', 'Extra rows']].values.tolist() == [[3, 2], [1, 1], [2, 0]]
+    assert report['Vendor Name'].iloc[:2].tolist() == ['V3', 'V1'] and pd.isna(report['Vendor Name'].iloc[2])
+    assert fanout_by_vendor(report)['Extra rows'].tolist() == [2, 1, 0]
@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+from reconciliation import export
+from reconciliation.export import ExportStream, export_file, write_export
+
+
+@pytest.fixture
+def limit(monkeypatch):
+    monkeypatch.setattr(export, 'EXCEL_MAX_ROWS', 3)
+
+
+def frame(rows):
+    return pd.DataFrame({'PO': range(rows), 'Sub Total': [1.5] * rows})
+
+
+def test_a_full_sheet_is_written(limit, tmp_path):
+    path = tmp_path / 'out.xlsx'
+    write_export(frame(3), str(path), sheet_name='Final')
+    pd.testing.assert_frame_equal(pd.read_excel(path), frame(3))
+
+
+def test_rows_past_the_sheet_are_refused(limit, tmp_path):
+    with pytest.raises(ValueError, match="Final: 4 rows don't fit in an Excel sheet"):
+        write_export(frame(4), str(tmp_path / 'out.xlsx'), sheet_name='Final')
+
+
+def test_the_limit_counts_every_streamed_part(limit, tmp_path):
+    with ExportStream(str(tmp_path / 'out.xlsx'), sheet_name='Final') as stream:
+        stream.write(frame(2))
+        with pytest.raises(ValueError, match="4 rows"):
+            stream.write(frame(2))
+        assert stream.rows == 2
+
+
+def test_csv_has_no_row_limit(limit):
+    f = export_file(frame(4), fmt='csv')
+    assert len(pd.read_csv(f)) == 4
@@ -0,0 +1,59 @@
+import pandas as pd
+
+from reconciliation.columns import MATCHED_ESTIMATES, STILL_UNMATCHED
+from reconciliation.fuzzy import FuzzyIndex, fuzzy_match_count, tag_fuzzy_matches
+
+VIN_A = '1HGCM82633A004352'
+VIN_B = '2T1BURHE0JC012345'
+
+ESTIMATES = pd.DataFrame({
+    'PO': ['PO-00123', '500', '600', '700', '701'],
+    'ROID': ['R1', 'R2', 'R3', 'R4', 'R5'],
+    'Invoice no': [None, 'INV-0042', None, None, None],
+    'VIN': [None, None, VIN_A, VIN_B, VIN_B],
+    'Payable Amount': [10.0, 20.0, 30.0, 40.0, 40.0],
+})
+
+
+def statement(**overrides):
+    rows = pd.DataFrame({
+        'PO': ['123', 'x1', 'x2', 'x3', 'x4', '999'],
+        'Invoice no': [None, 'inv 42', None, None, None, None],
+        'VIN': [None, None, VIN_A.lower(), VIN_A, VIN_B, None],
+        'Amount': ['$10.00', '$1.00', '$30.00', '$35.00', '$40.00', None],
+        'Match Status': [STILL_UNMATCHED] * 5 + [MATCHED_ESTIMATES],
+    })
+    return rows.assign(**overrides)
+
+
+def values(series):
+    # None for missing, whatever the column's dtype
+    return series.astype(object).where(series.notna(), None).tolist()
+
+
+def tag(final_output, amount_col='Amount'):
+    return tag_fuzzy_matches(final_output, FuzzyIndex.from_references(ESTIMATES), 'PO', amount_col=amount_col)
+
+
+def test_each_tier_matches_what_the_earlier_ones_left():
+    tagged = tag(statement())
+    assert values(tagged['Fuzzy match']) == [
+        'Normalized key', 'Invoice no', 'VIN + amount', None, None, None
+    ]
+    assert values(tagged['Fuzzy PO']) == ['PO-00123', '500', '600', None, None, None]
+    assert tagged['Fuzzy source'].tolist()[:3] == ['Estimates'] * 3
+    assert fuzzy_match_count(tagged) == 3
+    assert tagged.columns.tolist().index('Fuzzy match') == tagged.columns.tolist().index('Match Status') + 1
+
+
+def test_vin_tier_needs_an_amount_and_a_single_job():
+    # x3's amount is off by 5.00; x4's VIN and amount fit two different jobs (POs 700 and 701)
+    tagged = tag(statement())
+    assert values(tagged['Fuzzy ROID'])[3:5] == [None, None]
+    # Without the statement's amount the VIN tier is skipped
+    assert tag(statement(), amount_col=None)['Fuzzy match'].isna().tolist() == [False, False, True, True, True, True]
+
+
+def test_matched_rows_are_left_alone():
+    tagged = tag(statement(PO=['123'] * 6))
+    assert tagged['Fuzzy match'].notna().tolist() == [True] * 5 + [False]
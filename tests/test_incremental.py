@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from synthetic import Scenario, generate, write_inputs  # noqa: E402
+
+from reconciliation.columns import (  # noqa: E402
+    MATCHED_ESTIMATES, non_ai_cols, rebate_input_cols, required_cols, required_remit_cols
+)
+from reconciliation.engine import reconcile  # noqa: E402
+from reconciliation.incremental import reconcile_incremental  # noqa: E402
+from reconciliation.readers import read_table  # noqa: E402
+
+REBATE_PCT = 10.0
+STAGES = {
+    'final_output': (),
+    'non_ai_df': ('non_ai',),
+    'merged_remit_df': ('non_ai', 'remittance'),
+}
+
+
+@pytest.fixture(scope='module')
+def inputs(tmp_path_factory):
+    frames = generate(Scenario(rows=300, seed=3))
+    # A zero Sub Total gives Step 2 a Rebate AI of -0.0, which has to survive the store
+    frames['rebate'].loc[0, 'SubTotal (exc. Tax)'] = '$0.00'
+    paths = write_inputs(frames, str(tmp_path_factory.mktemp('inputs')), fmt='csv')
+    columns = {'estimates': required_cols, 'rebate': rebate_input_cols, 'non_ai': non_ai_cols,
+               'remittance': required_remit_cols}
+    return {name: read_table(path, columns=columns.get(name)) for name, path in paths.items()}
+
+
+def run(inputs, statement_df, stage, store_path):
+    refs = {f"{name}_df" if name == 'non_ai' else 'remit_df': inputs[name] for name in STAGES[stage]}
+    incremental = reconcile_incremental(statement_df, inputs['estimates'], store_path, rebate_df=inputs['rebate'],
+                                        rebate_percent=REBATE_PCT, **refs)
+    full = reconcile(statement_df, inputs['estimates'], rebate_df=inputs['rebate'], rebate_percent=REBATE_PCT, **refs)
+    return incremental, full
+
+
+def changed_statement(inputs, final_output):
+    # One statement row of a key matched with Estimates, while other keys stay unmatched
+    po = final_output.loc[final_output['Match Status'] == MATCHED_ESTIMATES, 'PO'].iloc[0]
+    statement_df = inputs['statement'].copy()
+    row = statement_df.index[statement_df['PO'] == po][0]
+    statement_df.loc[row, 'Note 0'] = 'changed'
+    return statement_df
+
+
+@pytest.mark.parametrize('stage', list(STAGES))
+def test_rerun_matches_a_full_run(inputs, stage, tmp_path):
+    store_path = str(tmp_path / 'state.db')
+    first, full = run(inputs, inputs['statement'], stage, store_path)
+    assert first.reused == 0
+    assert (full.final_output['Rebate AI'] == 0).any()
+
+    incremental, full = run(inputs, changed_statement(inputs, full.final_output), stage, store_path)
+    assert incremental.recomputed == 1
+    assert incremental.reused == first.recomputed - 1
+    assert incremental.stage == stage
+    assert incremental.summary == full.summary
+    pd.testing.assert_frame_equal(incremental.output, getattr(full, stage).reset_index(drop=True))
+
+
+def test_unchanged_inputs_are_all_reused(inputs, tmp_path):
+    store_path = str(tmp_path / 'state.db')
+    first, _ = run(inputs, inputs['statement'], 'final_output', store_path)
+    again, full = run(inputs, inputs['statement'], 'final_output', store_path)
+    assert (again.recomputed, again.reused) == (0, first.recomputed)
+    pd.testing.assert_frame_equal(again.output, full.final_output.reset_index(drop=True))
@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+
+from reconciliation.columns import MATCHED_ESTIMATES, STILL_UNMATCHED
+from reconciliation.preview import filter_options, page, page_count, summarize_frame, view_positions
+
+# Two rows share each index label, as in a concatenated final output
+DF = pd.DataFrame({
+    'PO': [5, 3, 1, 4, 2],
+    'Vendor Name': ['B', 'A', 'B', None, 'A'],
+    'Match Status': [MATCHED_ESTIMATES, STILL_UNMATCHED, MATCHED_ESTIMATES, STILL_UNMATCHED, MATCHED_ESTIMATES],
+    'Disputed amount': [0.0, 2.5, None, -1.0, 0.0],
+}, index=[0, 0, 1, 1, 2])
+
+
+def test_pages_are_slices_of_the_view():
+    positions = view_positions(DF, sort_by='PO')
+    assert positions.tolist() == [2, 4, 1, 3, 0]
+    assert page_count(len(positions), 2) == 3
+    assert page(DF, positions, 1, 2)['PO'].tolist() == [1, 2]
+    assert page(DF, positions, 3, 2)['PO'].tolist() == [5]
+    assert page(DF, positions, 4, 2).empty
+
+
+def test_filters_and_descending_sort():
+    positions = view_positions(DF, {'Vendor Name': ('A', 'B'), 'Match Status': ()}, sort_by='PO', ascending=False)
+    assert DF['PO'].iloc[positions].tolist() == [5, 3, 2, 1]
+    assert view_positions(DF, disputed_only=True).tolist() == [1, 3]
+
+
+def test_an_empty_view_has_one_page():
+    positions = view_positions(DF, {'Vendor Name': ('C',)})
+    assert len(positions) == 0
+    assert page_count(len(positions), 50) == 1
+
+
+def test_mixed_text_and_numbers_sort_as_text():
+    df = pd.DataFrame({'PO': [10, 'A7', 9, np.nan]})
+    assert df['PO'].iloc[view_positions(df, sort_by='PO')].tolist()[:3] == [10, 9, 'A7']
+
+
+def test_options_and_summary():
+    assert filter_options(DF) == {
+        'Match Status': sorted([MATCHED_ESTIMATES, STILL_UNMATCHED]), 'Vendor Name': ['A', 'B']
+    }
+    summary = summarize_frame(DF)
+    assert (summary['Rows'], summary[MATCHED_ESTIMATES], summary[STILL_UNMATCHED]) == (5, 3, 2)
+    assert summary['Total Disputed amount'] == 1.5
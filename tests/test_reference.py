@@ -0,0 +1,57 @@
+"""The engine against FC3 as it was before it (benchmarks/reference.py), on a small synthetic dataset."""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+BENCHMARKS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+sys.path.insert(0, BENCHMARKS)
+
+from bench_pipeline import check_equal  # noqa: E402
+from reference import read_raw, reference_fc3  # noqa: E402
+from synthetic import Scenario, cached_inputs  # noqa: E402
+
+from reconciliation.columns import non_ai_cols, rebate_input_cols, required_cols, required_remit_cols  # noqa: E402
+from reconciliation.engine import reconcile  # noqa: E402
+from reconciliation.readers import read_table  # noqa: E402
+
+SCENARIO = Scenario(rows=400, seed=7)
+REBATE_PCT = 10.0
+
+
+@pytest.fixture(scope='module')
+def paths(tmp_path_factory):
+    return cached_inputs(SCENARIO, str(tmp_path_factory.mktemp('synthetic')), fmt='csv')
+
+
+@pytest.mark.parametrize('merge_key', ['PO', 'ROID'])
+def test_matches_reference(paths, merge_key):
+    # Same comparison as bench_pipeline: every output frame value by value, and the summary counts
+    problems, _, summary = check_equal(paths, merge_key, REBATE_PCT)
+    assert not problems
+    assert summary
+
+
+def per_po(df, cols):
+    po = pd.to_numeric(df['PO'], errors='coerce')
+    totals = df[cols].apply(pd.to_numeric, errors='coerce').groupby(po).sum()
+    return totals.astype('float64').round(2).sort_index()
+
+
+def test_remittance_totals_match_reference(paths):
+    # The default Tab 3 joins one total per PO: summed per PO, it gives what FC3's one-row-per-payment join did
+    raw = {name: read_raw(path) for name, path in paths.items()}
+    expected = reference_fc3(raw['statement'], raw['estimates'], 'PO', rebate_df=raw['rebate'],
+                             rebate_percent=REBATE_PCT, non_ai_df=raw['non_ai'], remit_df=raw['remittance'])
+    result = reconcile(
+        read_table(paths['statement']), read_table(paths['estimates'], columns=required_cols), merge_key='PO',
+        rebate_df=read_table(paths['rebate'], columns=rebate_input_cols), rebate_percent=REBATE_PCT,
+        non_ai_df=read_table(paths['non_ai'], columns=non_ai_cols),
+        remit_df=read_table(paths['remittance'], columns=required_remit_cols),
+    )
+    detail = expected['merged_remit_df'].assign(payment_count=expected['merged_remit_df']['paid_amount'].notna())
+    pd.testing.assert_frame_equal(
+        per_po(detail, ['paid_amount', 'payment_count']),
+        per_po(result.merged_remit_df, ['paid_amount', 'payment_count']),
+    )
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+from reconciliation.refstore import ReferenceStore
+
+JANUARY = pd.DataFrame({
+    'PO': [1001, 1002, 1003], 'ROID': ['R1', 'R2', 'R3'], 'Sub Total': [10.0, 20.0, 30.0],
+})
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReferenceStore(str(tmp_path / 'refs.db'))
+    assert store.ingest('estimates', JANUARY, name='january.xlsx') == 3
+    return store
+
+
+def test_fetch_returns_the_statement_keys_rows(store):
+    # Keys are normalized on both sides: ' 1003' and 1001.0 find the stored ints
+    rows = store.fetch('estimates', {'PO': pd.Series([1001.0, ' 1003', 9999])})
+    pd.testing.assert_frame_equal(rows, JANUARY.iloc[[0, 2]].reset_index(drop=True))
+    rows = store.fetch_for('estimates', pd.DataFrame({'ROID': ['R2']}), columns=['PO', 'Missing'])
+    assert rows.to_dict('list') == {'PO': [1002]}
+
+
+def test_an_export_is_only_stored_once(store):
+    version = store.version()
+    assert store.ingest('estimates', JANUARY.copy(), name='copy.xlsx') == 0
+    assert store.version() == version
+    assert store.exports()['name'].tolist() == ['january.xlsx']
+
+
+def test_later_exports_are_appended_or_supersede(store):
+    february = pd.DataFrame({'PO': [1002, 1004], 'ROID': ['R2', 'R4'], 'Sub Total': [25.0, 40.0], 'Note': ['x', 'y']})
+    store.ingest('estimates', february)
+    rows = store.fetch('estimates', {'PO': [1002]})
+    assert rows['Sub Total'].tolist() == [20.0, 25.0]
+    assert rows['Note'].isna().tolist() == [True, False]
+
+    march = pd.DataFrame({'PO': [1002], 'ROID': ['R2'], 'Sub Total': [27.0]})
+    store.ingest('estimates', march, supersede=True)
+    assert store.fetch('estimates', {'PO': [1002]})['Sub Total'].tolist() == [27.0]
+    assert store.fetch('estimates', {'PO': [1001, 1004]})['PO'].tolist() == [1001, 1004]
+
+
+def test_unknown_datasets_and_missing_keys(store):
+    with pytest.raises(ValueError, match="Unknown dataset 'payments'"):
+        store.ingest('payments', JANUARY)
+    with pytest.raises(ValueError, match="No key column"):
+        store.ingest('remittance', JANUARY)
+    with pytest.raises(ValueError, match="No rebate_query export"):
+        store.fetch('rebate_query', {'PO': [1001]})
+    assert store.has('estimates') and not store.has('remittance')
@@ -0,0 +1,85 @@
+import pandas as pd
+import pytest
+
+from reconciliation import export
+from reconciliation.batch import run_batch
+from reconciliation.cli import main
+from reconciliation.rollup import RollupCube, run_name
+
+
+@pytest.fixture
+def files(tmp_path):
+    pd.DataFrame({
+        'PO': [1, 2, 3], 'Vendor Name': ['V1', 'V1', 'V2'], 'Appointment year': [2024] * 3,
+        'Appointment month': ['May'] * 3, 'Sub Total': [10.0, 20.0, 30.0],
+    }).to_csv(tmp_path / 'estimates.csv', index=False)
+    for folder, pos in (('a', [1, 2]), ('b', [3])):
+        (tmp_path / folder).mkdir()
+        pd.DataFrame({'PO': pos}).to_csv(tmp_path / folder / 'April.csv', index=False)
+    return tmp_path
+
+
+def test_run_name():
+    assert run_name('in/April.xlsx') == 'April.xlsx'
+    assert run_name('in/April.xlsx', content='0123456789abcdef') == 'April.xlsx (0123456789ab)'
+    assert run_name('in/April.xlsx', 'April corrected', '0123456789abcdef') == 'April corrected'
+
+
+def test_statements_sharing_a_file_name_keep_their_totals(files):
+    cube_path = str(files / 'cube.db')
+    statements = [str(files / 'a' / 'April.csv'), str(files / 'b' / 'April.csv')]
+    run_batch(statements, str(files / 'estimates.csv'), str(files / 'out'), jobs=1, rollup=cube_path)
+
+    cube = RollupCube(cube_path)
+    assert len(cube.runs()) == 2
+    totals = cube.query(by=['Vendor Name']).set_index('Vendor Name')
+    assert totals['Sub Total'].to_dict() == {'V1': 30.0, 'V2': 30.0}
+    assert totals['Rows'].sum() == 3
+
+
+def test_rerunning_a_statement_replaces_its_totals(files):
+    cube_path = str(files / 'cube.db')
+    argv = [str(files / 'a' / 'April.csv'), str(files / 'estimates.csv'), '--rollup', cube_path,
+            '--out-dir', str(files / 'out')]
+    assert main(argv) == 0
+    assert main(argv) == 0
+    cube = RollupCube(cube_path)
+    assert len(cube.runs()) == 1
+    assert cube.query(by=[])['Sub Total'].tolist() == [30.0]
+
+
+def test_cube_is_left_alone_when_the_outputs_fail(files, monkeypatch, capsys):
+    # An output past the Excel row limit ends the run with an error before its totals reach the cube
+    monkeypatch.setattr(export, 'EXCEL_MAX_ROWS', 1)
+    cube_path = str(files / 'cube.db')
+    argv = [str(files / 'a' / 'April.csv'), str(files / 'estimates.csv'), '--rollup', cube_path,
+            '--out-dir', str(files / 'out')]
+    assert main(argv) == 2
+    assert "rows don't fit in an Excel sheet" in capsys.readouterr().err
+    assert RollupCube(cube_path).runs().empty
+
+
+def rows(vendors, amounts):
+    return pd.DataFrame({
+        'Vendor Name': vendors, 'Appointment year': [2024.0] * len(vendors), 'Appointment month': 'May',
+        'Match Status': 'Matched with Estimates', 'Sub Total': amounts,
+    })
+
+
+def test_replacing_a_run_sums_its_cells_again(tmp_path):
+    cube = RollupCube(str(tmp_path / 'cube.db'))
+    assert cube.update('April', rows(['V1', 'V2'], [10.0, 20.0]))
+    assert cube.update('May', rows(['V1'], [5.0]))
+    assert not cube.update('May', rows(['V1'], [5.0]))
+
+    # V1's cell is shared by both runs; May moving to V3 leaves April's share in it
+    cube.update('May', rows(['V3'], [7.0]))
+    totals = cube.query(by=['Vendor Name', 'Appointment year'])
+    assert totals[['Vendor Name', 'Sub Total', 'Rows']].values.tolist() == [
+        ['V1', 10.0, 1], ['V2', 20.0, 1], ['V3', 7.0, 1]
+    ]
+    assert totals['Appointment year'].unique().tolist() == ['2024']
+
+    cube.remove('April')
+    assert cube.query(by=['Vendor Name'])['Vendor Name'].tolist() == ['V3']
+    assert cube.runs()['run'].tolist() == ['May']
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from reconciliation.columns import MATCHED_ESTIMATES, MATCHED_QUERY
+from reconciliation.scenarios import parse_rates, rebate_scenarios, vendor_rate_table
+
+FINAL = pd.DataFrame({
+    'Vendor Name': ['V1', 'V1', 'V2', None],
+    'Match Status': [MATCHED_QUERY, MATCHED_ESTIMATES, MATCHED_QUERY, MATCHED_QUERY],
+    'Sub Total': [100.0, 50.0, 200.0, None],
+    'Payable Amount': [90.0, 45.0, 180.0, 10.0],
+    'Statement amount': [85.0, 45.0, 170.0, 10.0],
+    'Rebate AI': [-10.0, 0.0, -20.0, 0.0],
+    'Amount to pay': [80.0, 45.0, 160.0, 10.0],
+    'Disputed amount': [5.0, 0.0, 10.0, 0.0],
+    'Dispute analysis': [-5.0, 0.0, -10.0, 0.0],
+})
+
+
+def test_step_2_formulas_for_every_rate():
+    scenarios = rebate_scenarios(FINAL, rates=[5, 10])
+    assert scenarios.names == ['5%', '10%']
+    rebate = scenarios.values('Rebate AI')
+    # Only query-matched rows with a Sub Total take the scenario's rate
+    np.testing.assert_allclose(rebate, [[-5.0, -10.0], [0.0, 0.0], [-10.0, -20.0], [0.0, 0.0]])
+    np.testing.assert_allclose(scenarios.values('Amount to pay')[:, 0], [85.0, 45.0, 170.0, 10.0])
+    np.testing.assert_allclose(scenarios.values('Disputed amount')[:, 0], [0.0, 0.0, 0.0, 0.0])
+    np.testing.assert_allclose(scenarios.values('Dispute analysis')[:, 0], [-5.0, 0.0, -10.0, 0.0])
+    # At Step 2's own rate the scenario reproduces the current figures
+    for col in ('Rebate AI', 'Amount to pay', 'Disputed amount', 'Dispute analysis'):
+        np.testing.assert_allclose(scenarios.values(col)[:, 1], FINAL[col])
+
+
+def test_all_rows_extends_the_rates():
+    rebate = rebate_scenarios(FINAL, rates=[10], all_rows=True).values('Rebate AI')
+    np.testing.assert_allclose(rebate[:, 0], [-10.0, -5.0, -20.0, 0.0])
+
+
+def test_vendors_missing_from_the_table_keep_their_figures():
+    table = vendor_rate_table(pd.DataFrame({'Vendor Name': [' V2 '], 'Low': [5], 'High': ['15']}))
+    scenarios = rebate_scenarios(FINAL, vendor_rates=table)
+    assert scenarios.names == ['Low', 'High']
+    np.testing.assert_allclose(scenarios.values('Rebate AI')[:, 1], [-10.0, 0.0, -30.0, 0.0])
+
+    comparison = scenarios.comparison()
+    current = comparison[comparison['Scenario'] == 'Current'].set_index('Vendor Name')
+    assert current.loc['V1', 'Rebate AI'] == -10.0 and current.loc['(unknown)', 'Rows'] == 1
+    pivot = scenarios.pivot(comparison).set_index('Vendor Name')
+    assert pivot.loc['Total'].tolist() == [15.0, 5.0, 25.0]
+
+
+def test_bad_inputs():
+    assert parse_rates('5; 7.5, 10') == [5.0, 7.5, 10.0]
+    with pytest.raises(ValueError, match="separated by commas"):
+        parse_rates('5, ten')
+    with pytest.raises(ValueError, match="Vendors listed twice"):
+        vendor_rate_table(pd.DataFrame({'Vendor Name': ['V1', 'V1 '], 'A': [1, 2]}))
+    with pytest.raises(ValueError, match="Give rebate rates"):
+        rebate_scenarios(FINAL)
+    with pytest.raises(ValueError, match="Statement amount"):
+        rebate_scenarios(FINAL.drop(columns=['Statement amount']), rates=[5])